@@ -0,0 +1,561 @@
+"""
+Analysis
+
+This file contains the analysis of balance signals, without GUI or database
+dependencies, so that scripts and worker processes only import NumPy.
+
+1. Analysis methods: metrics of one balance signal, their summary, and the
+   plot data of a signal from its metrics
+2. Ellipse, convex hull and oriented ellipse methods
+3. Batch analysis method: metrics of many balance signals at once
+"""
+
+import numpy as np
+
+# Version of the analysis algorithms. Results stored with another version
+# are computed again, so it must change with any change of the metrics
+ANALYSIS_VERSION = 1
+
+# Scalar metrics of analisis, and areas of the ellipse, convex hull and
+# oriented ellipse
+METRICS = (
+    'lat_max', 'lat_t_max', 'lat_min', 'lat_t_min', 'lat_rango', 'lat_vel', 'lat_rms',
+    'ap_max', 'ap_t_max', 'ap_min', 'ap_t_min', 'ap_rango', 'ap_vel', 'ap_rms',
+    'centro_vel', 'centro_dist', 'centro_frec',
+)
+AREAS = ('elipse_area', 'hull_area', 'pca_area')
+
+
+# --------
+# Análisis
+# --------
+def analisis(data: np.ndarray, frequency: float = 10.0, start: float = 0.0) -> dict:
+    """ Analysis of balance signal
+
+    Every metric is computed in one pass over the signal array: the extrema,
+    the sample differences and the centered values are computed once and
+    shared by the oscillation, center of pressure and ellipse metrics.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals of shape
+        (n, 2), restricted to the analysis window
+    frequency: float
+        Sampling frequency in Hz, from the file header
+    start: float
+        Start time of the analysis window in seconds, from the file header
+    
+    Returns
+    -------
+    results: dict
+        Results of analysis of lateral, antero-posterior, and center of
+        pressure oscillations
+        data_x: np.ndarray
+            Lateral signal
+        data_y: np.ndarray
+            Antero-posterior signal
+        data_t: np.ndarray
+            Time signal
+        lat_max: float
+            Lateral signal maximum value
+        lat_t_max: float
+            Lateral signal correspondent time value for maximum value
+        lat_min: float
+            Lateral signal minimum value
+        lat_t_min: float
+            Lateral signal correspondent time value for minimum value
+        ap_max: float
+            Antero-posterior signal maximum value
+        ap_t_max: float
+            Antero-posterior signal correspondent time value for maximum value
+        ap_min: float
+            Antero-posterior signal minimum value
+        ap_t_min: float
+            Antero-posterior signal correspondent time value for minimum value
+        lat_rango: float
+            Lateral signal range
+        ap_rango: float
+            Antero-posterior signal range
+        lat_vel: float
+            Lateral signal mean velocity
+        lat_rms: float
+            Lateral signal RMS
+        ap_vel: float
+            Antero-posterior signal mean velocity
+        ap_rms: float
+            Antero-posterior signal RMS
+        centro_vel: float
+            Center of pressure signal mean velocity
+        centro_dist: float
+            Center of pressure signal mean distance
+        centro_frec: float
+            Center of pressure signal mean frequency
+        elipse: dict
+            Results of ellipseStandard
+        pca: dict
+            Results of ellipsePCA
+    """
+    # Rows x, y contiguous: reductions along a long axis are much faster
+    # than along the rows of an (n, 2) array
+    xy = np.ascontiguousarray(np.asarray(data, dtype=np.float64).T)
+    n = xy.shape[1]
+    rows = np.arange(2)
+
+    data_t = start + np.arange(n) / frequency
+    t_analisis = n / frequency
+
+    results = {
+        'data_x': xy[0],
+        'data_y': xy[1],
+        'data_t': data_t
+    }
+
+    # EXTREMOS -----------------------------------------------------------------
+    i_max = xy.argmax(axis=1)
+    i_min = xy.argmin(axis=1)
+    maxima = xy[rows, i_max]
+    minima = xy[rows, i_min]
+
+    results['lat_max'] = maxima[0]
+    results['lat_t_max'] = data_t[i_max[0]]
+    results['lat_min'] = minima[0]
+    results['lat_t_min'] = data_t[i_min[0]]
+
+    results['ap_max'] = maxima[1]
+    results['ap_t_max'] = data_t[i_max[1]]
+    results['ap_min'] = minima[1]
+    results['ap_t_min'] = data_t[i_min[1]]
+
+    results['lat_rango'] = maxima[0] - minima[0]
+    results['ap_rango'] = maxima[1] - minima[1]
+
+    # DIFERENCIAS --------------------------------------------------------------
+    diffs = np.diff(xy, axis=1)
+    np.abs(diffs, out=diffs)
+    vel = diffs.sum(axis=1) * frequency / (n - 1)
+    results['lat_vel'] = vel[0]
+    results['ap_vel'] = vel[1]
+
+    steps = np.square(diffs, out=diffs)[0]
+    steps += diffs[1]
+    np.sqrt(steps, out=steps)
+    results['centro_vel'] = steps.sum() / t_analisis
+    results['centro_frec'] = results['centro_vel'] / (2 * np.pi)
+
+    distance = xy[0] * xy[0]
+    distance += xy[1] * xy[1]
+    np.sqrt(distance, out=distance)
+    results['centro_dist'] = distance.sum() / t_analisis
+    del diffs, steps, distance
+
+    # VALORES CENTRADOS --------------------------------------------------------
+    mean = xy.sum(axis=1) / n
+    centered = xy - mean[:, None]
+    squares = np.einsum('ij,ij->i', centered, centered)
+    rms = np.sqrt(squares / (n - 1))
+    results['lat_rms'] = rms[0]
+    results['ap_rms'] = rms[1]
+
+    # ELIPSES ------------------------------------------------------------------
+    covariance = (squares[0] / n, np.dot(centered[0], centered[1]) / n, squares[1] / n)
+    results['elipse'] = _ellipse_standard(maxima, minima)
+    results['pca'] = _ellipse_pca(centered, mean, covariance)
+
+    return results
+
+
+def summary(results: dict, data_convex: dict) -> dict:
+    """ Scalar metrics of an analysis
+
+    Parameters
+    ----------
+    results: dict
+        Results of analisis
+    data_convex: dict
+        Results of convexHull
+
+    Returns
+    -------
+    metrics: dict
+        Float value of every name of METRICS and AREAS
+    """
+    metrics = {key: float(results[key]) for key in METRICS}
+    metrics['elipse_area'] = float(results['elipse']['area'])
+    metrics['hull_area'] = float(data_convex['area'])
+    metrics['pca_area'] = float(results['pca']['area'])
+    return metrics
+
+
+def plot_data(data: np.ndarray, metrics: dict, frequency: float = 10.0, start: float = 0.0) -> dict:
+    """ Results of analisis needed by the plots of a study, from its metrics
+
+    The extrema and the ellipse are taken from the stored metrics, and only
+    the oriented ellipse is computed from the signals, without the
+    difference and RMS passes of analisis.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals of shape
+        (n, 2), restricted to the analysis window
+    metrics: dict
+        Metrics of the study, as returned by summary
+    frequency: float
+        Sampling frequency in Hz, from the file header
+    start: float
+        Start time of the analysis window in seconds, from the file header
+
+    Returns
+    -------
+    results: dict
+        data_x, data_y, data_t, the extrema (lat_max, lat_t_max, lat_min,
+        lat_t_min, ap_max, ap_t_max, ap_min, ap_t_min), elipse and pca, as
+        in analisis
+    """
+    xy = np.ascontiguousarray(np.asarray(data, dtype=np.float64).T)
+    n = xy.shape[1]
+
+    results = {
+        'data_x': xy[0],
+        'data_y': xy[1],
+        'data_t': start + np.arange(n) / frequency
+    }
+    for key in ('lat_max', 'lat_t_max', 'lat_min', 'lat_t_min', 'ap_max', 'ap_t_max', 'ap_min', 'ap_t_min'):
+        results[key] = metrics[key]
+
+    maxima = np.array([metrics['lat_max'], metrics['ap_max']])
+    minima = np.array([metrics['lat_min'], metrics['ap_min']])
+    results['elipse'] = _ellipse_standard(maxima, minima)
+
+    mean = xy.sum(axis=1) / n
+    centered = xy - mean[:, None]
+    squares = np.einsum('ij,ij->i', centered, centered)
+    covariance = (squares[0] / n, np.dot(centered[0], centered[1]) / n, squares[1] / n)
+    results['pca'] = _ellipse_pca(centered, mean, covariance)
+
+    return results
+
+
+# ------
+# Elipse
+# ------
+def _ellipse_standard(maxima: np.ndarray, minima: np.ndarray) -> dict:
+    """ Ellipse from the extrema of the lateral and antero-posterior signals """
+    a = (maxima[0] - minima[0]) / 2
+    b = (maxima[1] - minima[1]) / 2
+    x0 = maxima[0] - a
+    y0 = maxima[1] - b
+
+    theta = np.linspace(0, 2 * np.pi, 100)
+    x = x0 + a * np.cos(theta)
+    y = y0 + b * np.sin(theta)
+
+    results = {
+        'x': x,
+        'y': y,
+        'area': np.pi * a * b
+    }
+
+    return results
+
+
+def ellipseStandard(data: np.ndarray) -> dict:
+    """ Ellipse analysis of balance signal
+
+    Parameters
+    ----------
+    data: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals of shape (n, 2)
+    
+    Returns
+    -------
+    results: dict
+        Results of ellipse clustering analysis
+        x: list
+            x-coordinates of ellipse points
+        y: list
+            y-coordinates of ellipse points
+        area: float
+            area of ellipse
+    """
+    xy = np.ascontiguousarray(np.asarray(data, dtype=np.float64).T)
+    return _ellipse_standard(xy.max(axis=1), xy.min(axis=1))
+
+
+# -----------
+# Convex Hull
+# -----------
+def convexHull(data: np.ndarray) -> dict:
+    """ Convex hull analysis of balance signal
+
+    Parameters
+    ----------
+    data: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals of shape (n, 2)
+    
+    Returns
+    -------
+    results: dict
+        Results of convex hull clustering analysis
+        x: list
+            x-coordinates of convex hull points
+        y: list
+            y-coordinates of convex hull points
+        area: float
+            area of convex hull
+    """
+    # scipy.spatial is imported here, only by the callers of convexHull
+    from scipy.spatial import ConvexHull
+
+    data = np.asarray(data, dtype=np.float64)
+
+    hull = ConvexHull(data)
+    hullX = data[hull.vertices, 0]
+    hullY = data[hull.vertices, 1]
+
+    results = {
+        'x': hullX,
+        'y': hullY,
+        'area': hull.volume # 2D Area
+    }
+
+    return results
+
+
+# ----------------
+# Elipse Orientada
+# ----------------
+def _ellipse_pca(centered: np.ndarray, cen: np.ndarray, covariance: tuple) -> dict:
+    """ Oriented ellipse from the centered signals, rows x and y, and their
+    covariance (xx, xy, yy) """
+    a, b, d = covariance
+
+    B = a + d
+    C = a * d - b * b
+    L1 = (B / 2) + np.sqrt(B * B - 4 * C) / 2
+
+    rot = np.arctan( (L1 - d) / b )
+
+    # Rotation of the centered points by rot, same as rotating their polar
+    # angle: rho * cos(theta + rot), rho * sin(theta + rot). Only the extrema
+    # of the rotated points are needed, so one coordinate at a time is rotated
+    # in the same buffer
+    cos_rot, sin_rot = np.cos(rot), np.sin(rot)
+    rotated = np.multiply(centered[0], cos_rot)
+    rotated -= sin_rot * centered[1]
+    maxX, minX = rotated.max(), rotated.min()
+
+    np.multiply(centered[0], sin_rot, out=rotated)
+    rotated += cos_rot * centered[1]
+    maxY, minY = rotated.max(), rotated.min()
+
+    aa = (maxX - minX) / 2
+    bb = (maxY - minY) / 2
+    x0 = maxX - aa
+    y0 = maxY - bb
+
+    phi = np.linspace(0, 2 * np.pi, 100)
+    newX = x0 + aa * np.cos(phi)
+    newY = y0 + bb * np.sin(phi)
+    thetaellipse = np.arctan2(newY, newX)
+    rhoellipse = np.sqrt((newX * newX) + (newY * newY))
+    thetarotellipse = thetaellipse - rot
+    Xellipse = rhoellipse * np.cos(thetarotellipse)
+    Yellipse = rhoellipse * np.sin(thetarotellipse)
+    XellipseFinal = Xellipse + cen[0]
+    YellipseFinal = Yellipse + cen[1]
+
+    results = {
+        'x': XellipseFinal,
+        'y': YellipseFinal,
+        'area': np.pi * aa * bb
+    }
+
+    return results
+
+
+def ellipsePCA(data: np.ndarray) -> dict:
+    """ Oriented ellipse analysis of balance signal
+
+    Parameters
+    ----------
+    data: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals of shape (n, 2)
+    
+    Returns
+    -------
+    results: dict
+        Results of oriented ellipse clustering analysis
+        x: list
+            x-coordinates of oriented ellipse points
+        y: list
+            y-coordinates of oriented ellipse points
+        area: float
+            area of oriented ellipse
+    """
+    xy = np.ascontiguousarray(np.asarray(data, dtype=np.float64).T)
+    n = xy.shape[1]
+
+    cen = xy.sum(axis=1) / n
+    centered = xy - cen[:, None]
+    squares = np.einsum('ij,ij->i', centered, centered)
+    covariance = (squares[0] / n, np.dot(centered[0], centered[1]) / n, squares[1] / n)
+
+    return _ellipse_pca(centered, cen, covariance)
+
+
+# ------------------
+# Análisis por Lotes
+# ------------------
+def _segment_arg(xy: np.ndarray, offsets: np.ndarray, extrema: np.ndarray) -> np.ndarray:
+    """ Index inside each study of the first sample equal to its extremum
+
+    Parameters
+    ----------
+    xy: np.ndarray
+        Signals of all studies concatenated, rows x and y, shape (2, N)
+    offsets: np.ndarray
+        Start of each study in xy and total length, shape (m + 1,)
+    extrema: np.ndarray
+        Maximum or minimum of each study, shape (2, m)
+
+    Returns
+    -------
+    index: np.ndarray
+        Index of the extremum relative to the start of each study, shape (2, m)
+    """
+    lengths = np.diff(offsets)
+    index = np.empty(extrema.shape, dtype=np.intp)
+    for row in range(2):
+        candidates = np.flatnonzero(xy[row] == np.repeat(extrema[row], lengths))
+        studies = np.searchsorted(offsets, candidates, side='right') - 1
+        _, first = np.unique(studies, return_index=True)
+        index[row] = candidates[first] - offsets[:-1]
+    return index
+
+
+def analisis_batch(signals: np.ndarray, frequency=10.0, start=0.0, offsets: np.ndarray = None) -> dict:
+    """ Analysis of many balance signals at once
+
+    The metrics of analisis are computed for all studies with array
+    operations along the study axis, without a Python loop over studies.
+
+    Parameters
+    ----------
+    signals: np.ndarray
+        Equal length studies stacked with shape (m, n, 2), or studies of
+        any length concatenated with shape (N, 2) together with offsets.
+        Column 0 is the lateral signal and column 1 the antero-posterior one
+    frequency: float or np.ndarray
+        Sampling frequency in Hz, one for all studies or one per study
+    start: float or np.ndarray
+        Start time of the analysis window in seconds, one for all studies or
+        one per study
+    offsets: np.ndarray
+        Start of each study in the concatenated signals and total length,
+        shape (m + 1,): from 0 to the length of the signals, with at least
+        two samples per study. Required for concatenated signals
+
+    Returns
+    -------
+    results: dict
+        Columnar results, one array of shape (m,) per metric: lat_max,
+        lat_t_max, lat_min, lat_t_min, ap_max, ap_t_max, ap_min, ap_t_min,
+        lat_rango, ap_rango, lat_vel, lat_rms, ap_vel, ap_rms, centro_vel,
+        centro_dist, centro_frec, elipse_area and pca_area, with the same
+        meaning as in analisis
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    stacked = signals.ndim == 3
+    if stacked:
+        m, n, _ = signals.shape
+        offsets = np.arange(m + 1) * n
+        signals = signals.reshape(m * n, 2)
+    elif offsets is None:
+        raise ValueError('offsets are required for concatenated signals')
+
+    offsets = np.asarray(offsets, dtype=np.intp)
+    if offsets.ndim != 1 or len(offsets) < 2 or offsets[0] != 0 or offsets[-1] != len(signals):
+        # reduceat would fold the samples outside the offsets into the first or last study
+        raise ValueError(f'offsets must start at 0 and end at the {len(signals)} samples of the signals')
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    if np.any(lengths < 2):
+        raise ValueError('every study needs at least two samples')
+
+    frequency = np.asarray(frequency, dtype=np.float64)
+    t_analisis = lengths / frequency
+
+    xy = np.ascontiguousarray(signals.T)
+    results = {}
+
+    # EXTREMOS -----------------------------------------------------------------
+    maxima = np.maximum.reduceat(xy, starts, axis=1)
+    minima = np.minimum.reduceat(xy, starts, axis=1)
+    if stacked:
+        i_max = xy.reshape(2, m, n).argmax(axis=2)
+        i_min = xy.reshape(2, m, n).argmin(axis=2)
+    else:
+        i_max = _segment_arg(xy, offsets, maxima)
+        i_min = _segment_arg(xy, offsets, minima)
+    t_max = start + i_max / frequency
+    t_min = start + i_min / frequency
+
+    results['lat_max'], results['ap_max'] = maxima
+    results['lat_t_max'], results['ap_t_max'] = t_max
+    results['lat_min'], results['ap_min'] = minima
+    results['lat_t_min'], results['ap_t_min'] = t_min
+    results['lat_rango'], results['ap_rango'] = maxima - minima
+
+    # DIFERENCIAS --------------------------------------------------------------
+    # The differences across the boundary between two studies are zeroed, so
+    # the sums of each study only include its own differences
+    diffs = np.diff(xy, axis=1)
+    np.abs(diffs, out=diffs)
+    diffs[:, offsets[1:-1] - 1] = 0.0
+    vel = np.add.reduceat(diffs, starts, axis=1) * frequency / (lengths - 1)
+    results['lat_vel'], results['ap_vel'] = vel
+
+    steps = np.square(diffs, out=diffs)[0]
+    steps += diffs[1]
+    np.sqrt(steps, out=steps)
+    results['centro_vel'] = np.add.reduceat(steps, starts) / t_analisis
+    results['centro_frec'] = results['centro_vel'] / (2 * np.pi)
+
+    distance = xy[0] * xy[0]
+    distance += xy[1] * xy[1]
+    np.sqrt(distance, out=distance)
+    results['centro_dist'] = np.add.reduceat(distance, starts) / t_analisis
+    del diffs, steps, distance
+
+    # VALORES CENTRADOS --------------------------------------------------------
+    mean = np.add.reduceat(xy, starts, axis=1) / lengths
+    centered = xy - np.repeat(mean, lengths, axis=1)
+    squares = np.add.reduceat(centered * centered, starts, axis=1)
+    rms = np.sqrt(squares / (lengths - 1))
+    results['lat_rms'], results['ap_rms'] = rms
+
+    # ELIPSES ------------------------------------------------------------------
+    results['elipse_area'] = np.pi * (maxima[0] - minima[0]) / 2 * (maxima[1] - minima[1]) / 2
+
+    a = squares[0] / lengths
+    b = np.add.reduceat(centered[0] * centered[1], starts) / lengths
+    d = squares[1] / lengths
+    B = a + d
+    C = a * d - b * b
+    L1 = (B / 2) + np.sqrt(B * B - 4 * C) / 2
+    rot = np.arctan( (L1 - d) / b )
+
+    cos_rot = np.repeat(np.cos(rot), lengths)
+    sin_rot = np.repeat(np.sin(rot), lengths)
+    rotated = centered[0] * cos_rot
+    rotated -= sin_rot * centered[1]
+    aa = (np.maximum.reduceat(rotated, starts) - np.minimum.reduceat(rotated, starts)) / 2
+
+    np.multiply(centered[0], sin_rot, out=rotated)
+    rotated += cos_rot * centered[1]
+    bb = (np.maximum.reduceat(rotated, starts) - np.minimum.reduceat(rotated, starts)) / 2
+    results['pca_area'] = np.pi * aa * bb
+
+    return results
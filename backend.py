@@ -3,361 +3,453 @@ Backend
 
 This file contains supplementary methods and classes applied to the frontend.
 
-1. Class MPLCanvas: configuration of the plot canvas
-2. Analysis methods: methods to process and analyze balance signals data
+1. Class Palette and class MPLCanvas: colours of the plots of a theme, and plot
+   canvas, with the artists of its plot kept between studies
+2. Analysis methods: re-exported from the analysis module, and analysis of
+   a study file
 3. Database methods: methods of the database operations
 4. About class and method: Dialogs of information about me and Qt
 
 """
 
 from PyQt6 import QtWidgets
-from PyQt6.QtCore import QSettings
+from PyQt6.QtCore import QSettings, QTimer
+from PyQt6.QtGui import QImage, QPainter, QPixmap, QResizeEvent
 
+import json
 import sys
+from dataclasses import dataclass
+
 import numpy as np
-import pandas as pd
-from scipy.spatial import ConvexHull
-import psycopg2
 
+import blobs
+import cache
+import decimation
+import reader
+from analysis import analisis, analisis_batch, ellipseStandard, convexHull, ellipsePCA
+from analysis import summary, plot_data, ANALYSIS_VERSION, METRICS, AREAS
+
+from matplotlib.backend_bases import MouseButton
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
 
 import material3_components as mt3
 
-light = {
-    'surface': '#B2B2B2',
-    'on_surface': '#000000'
-}
+# Bytes of a signal blob read from the database per query
+SIGNAL_CHUNK = 1 << 20
 
-dark = {
-    'surface': '#2E3441',
-    'on_surface': '#E5E9F0'
-}
+# Patients read from the database per page of the patient list
+PATIENTS_PAGE = 200
 
-class MPLCanvas(FigureCanvasQTAgg):
-    def __init__(self, parent, theme: bool) -> None:
-        """ Canvas settings for plotting signals """
-        self.fig = Figure()
-        self.axes = self.fig.add_subplot(111)
+# Zoom of the time axis of the signal plots per step of the mouse wheel, and
+# minimum number of samples in view
+ZOOM_STEP = 1.25
+ZOOM_MIN_SAMPLES = 50
 
-        FigureCanvasQTAgg.__init__(self, self.fig)
-        self.setParent(parent)
-
-        self.apply_styleSheet(theme)
+# Milliseconds without resize events after which a resized canvas is redrawn
+RESIZE_DELAY = 150
 
-    def apply_styleSheet(self, theme):
-        self.fig.subplots_adjust(left=0.05, bottom=0.15, right=1, top=0.95, wspace=0, hspace=0)
-        self.axes.spines['top'].set_visible(False)
-        self.axes.spines['right'].set_visible(False)
-        self.axes.spines['bottom'].set_visible(False)
-        self.axes.spines['left'].set_visible(False)
-        if theme:
-            self.fig.set_facecolor(f'{light["surface"]}')
-            self.axes.set_facecolor(f'{light["surface"]}')
-            self.axes.xaxis.label.set_color(f'{light["on_surface"]}')
-            self.axes.yaxis.label.set_color(f'{light["on_surface"]}')
-            self.axes.tick_params(axis='both', colors=f'{light["on_surface"]}', labelsize=8)
-        else:
-            self.fig.set_facecolor(f'{dark["surface"]}')
-            self.axes.set_facecolor(f'{dark["surface"]}')
-            self.axes.xaxis.label.set_color(f'{dark["on_surface"]}')
-            self.axes.yaxis.label.set_color(f'{dark["on_surface"]}')
-            self.axes.tick_params(axis='both', colors=f'{dark["on_surface"]}', labelsize=8)
+# Milliseconds to wait for the running database jobs when the window is closed
+SHUTDOWN_WAIT = 3000
 
 
-def analisis(df: pd.DataFrame) -> dict:
-    """ Analysis of dataframe from balance signal
+@dataclass(frozen=True)
+class Palette:
+    """ Colours of the plots of a theme
 
-    Parameters
+    Attributes
     ----------
-    df: pd.DataFrame
-        Pandas dataframe converted from balance signal data from file
-    
-    Returns
-    -------
-    results: dict
-        Results of dataframe analysis of lateral, antero-posterior, and
-        center of pressure oscillations
-        data_x: pd.DataFrame
-            Lateral signal
-        data_y: pd.DataFrame
-            Antero-posterior signal
-        data_t: 
-            Time signal
-        lat_max: float
-            Lateral signal maximum value
-        lat_t_max: float
-            Lateral signal correspondent time value for maximum value
-        lat_min: float
-            Lateral signal minimum value
-        lat_t_min: float
-            Lateral signal correspondent time value for minimum value
-        ap_max: float
-            Antero-posterior signal maximum value
-        ap_t_max: float
-            Antero-posterior signal correspondent time value for maximum value
-        ap_min: float
-            Antero-posterior signal minimum value
-        ap_t_min: float
-            Antero-posterior signal correspondent time value for minimum value
-        lat_rango: float
-            Lateral signal range
-        ap_rango: float
-            Antero-posterior signal range
-        lat_vel: float
-            Lateral signal mean velocity
-        lat_rms: float
-            Lateral signal RMS
-        ap_vel: float
-            Antero-posterior signal mean velocity
-        ap_rms: float
-            Antero-posterior signal RMS
-        centro_vel: float
-            Center of pressure signal mean velocity
-        centro_dist: float
-            Center of pressure signal mean distance
-        centro_frec: float
-            Center of pressure signal mean frequency
+    surface: str
+        Background of the figure and the axes
+    on_surface: str
+        Ticks, tick labels, axis labels and labels of the extrema
+    data: str
+        Signals and samples
+    highlight: str
+        Extrema of the signals and outlines of the areas
     """
-    results = {}
-
-    data_x = df.iloc[:,0]
-    data_y = df.iloc[:,1]
-    data_t = np.linspace(0, len(df) / 10, len(df))
-
-    results['data_x'] = data_x
-    results['data_y'] = data_y
-    results['data_t'] = data_t
-
-    x_max = data_x.max()
-    x_min = data_x.min()
-    y_max = data_y.max()
-    y_min = data_y.min()
+    surface: str
+    on_surface: str
+    data: str = '#42A4F5'
+    highlight: str = '#FF2D55'
 
-    results['lat_max'] = x_max
-    results['lat_t_max'] = data_x.idxmax() / 10
-    results['lat_min'] = x_min
-    results['lat_t_min'] = data_x.idxmin() / 10
 
-    results['ap_max'] = y_max
-    results['ap_t_max'] = data_y.idxmax() / 10
-    results['ap_min'] = y_min
-    results['ap_t_min'] = data_y.idxmin() / 10
+light = Palette(surface='#B2B2B2', on_surface='#000000')
 
-    results['lat_rango'] = x_max - x_min
-    results['ap_rango'] = y_max - y_min
+dark = Palette(surface='#2E3441', on_surface='#E5E9F0')
 
-    tAnalisis = len(df) / 10
-    time_analysis = len(df) - 1
-    den = tAnalisis / len(df)
 
-    # SEÑAL X ----------------------------------------------------------------
-    avgX = data_x.sum() / len(df)
-
-    numX = abs(data_x.diff()).dropna()
-    velSgnX = numX / den
-    results['lat_vel'] = velSgnX.sum() / time_analysis
-
-    numRMSX = (data_x - avgX) * (data_x - avgX)
-    results['lat_rms'] = np.sqrt(numRMSX.sum() / time_analysis)
-    
-    # SEÑAL Y ----------------------------------------------------------------
-    avgY = data_y.sum() / len(df)
-
-    numY = abs(data_y.diff()).dropna()
-    velSgnY = numY / den
-    results['ap_vel'] = velSgnY.sum() / time_analysis
+class MPLCanvas(FigureCanvasQTAgg):
+    def __init__(self, parent, theme: bool) -> None:
+        """ Canvas settings for plotting signals
 
-    numRMSY = (data_y - avgY) * (data_y - avgY)
-    results['ap_rms'] = np.sqrt(numRMSY.sum() / time_analysis)
+        The artists of a plot are created the first time it is shown and
+        then kept: showing another study only changes their data, and the
+        canvas is redrawn once the event loop is idle.
 
-    # SEÑALES X Y ------------------------------------------------------------
-    num2 = np.sqrt((numX * numX) + (numY * numY))
-    numVMT = num2 / tAnalisis
-    results['centro_vel'] = numVMT.sum()
+        Signals are drawn decimated to the width of the plot in pixels, and
+        decimated again when the time axis or the canvas size change. Their
+        time axis is zoomed with the mouse wheel, panned by dragging and
+        reset with a double click.
 
-    numDist = np.sqrt((data_x * data_x) + (data_y * data_y))
-    distM = numDist / tAnalisis
+        While the canvas is being resized, the last render is shown scaled
+        to the new size, and the figure is resized and redrawn once the
+        size doesn't change for RESIZE_DELAY milliseconds.
+        """
+        self.fig = Figure()
+        self.axes = self.fig.add_subplot(111)
 
-    results['centro_dist'] = distM.sum()
-    results['centro_frec'] = numVMT.sum() / (2 * np.pi)
+        FigureCanvasQTAgg.__init__(self, self.fig)
+        self.setParent(parent)
 
-    return results
+        # Signal plot: signal, extrema and labels of the extrema
+        self.signal_t = None
+        self.signal_y = None
+        self.signal_pyramid = []
+        self.home_xlim = None
+        self.pan_start = None
+        self.signal_line = None
+        self.extrema = None
+        self.extrema_labels = []
+        # Area plot: samples and outline of the area
+        self.points = None
+        self.outline = None
+
+        self.resize_pixmap = None
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(RESIZE_DELAY)
+        self.resize_timer.timeout.connect(self.on_resize_timer_timeout)
 
+        self.fig.subplots_adjust(left=0.05, bottom=0.15, right=1, top=0.95, wspace=0, hspace=0)
+        self.axes.spines['top'].set_visible(False)
+        self.axes.spines['right'].set_visible(False)
+        self.axes.spines['bottom'].set_visible(False)
+        self.axes.spines['left'].set_visible(False)
+        self.axes.tick_params(axis='both', labelsize=8)
+        self.palette = None
+        self.apply_styleSheet(theme)
 
-# ------
-# Elipse
-# ------
-def ellipseStandard(df: pd.DataFrame) -> dict:
-    """ Ellipse analysis of dataframe from balance signal
+    def apply_styleSheet(self, theme):
+        self.set_palette(light if theme else dark)
+
+    def set_palette(self, palette: Palette) -> None:
+        """ Changes the colours of the figure and of its artists in place
+
+        The canvas is not redrawn: the caller redraws it with draw_idle,
+        once for every change made to it.
+
+        Parameters
+        ----------
+        palette: Palette
+            Colours of the theme
+
+        Returns
+        -------
+        None
+        """
+        if palette == self.palette:
+            return
+        self.palette = palette
+
+        self.fig.set_facecolor(palette.surface)
+        self.axes.set_facecolor(palette.surface)
+        self.axes.xaxis.label.set_color(palette.on_surface)
+        self.axes.yaxis.label.set_color(palette.on_surface)
+        self.axes.tick_params(axis='both', colors=palette.on_surface)
+        for label in self.extrema_labels:
+            label.set_color(palette.on_surface)
+
+        if self.signal_line is not None:
+            self.signal_line.set_color(palette.data)
+            self.extrema.set_markeredgecolor(palette.highlight)
+            self.extrema.set_markerfacecolor(palette.highlight)
+        if self.points is not None:
+            self.points.set_color(palette.data)
+            self.outline.set_color(palette.highlight)
+
+    def artists(self) -> list:
+        """ Artists of the plots created in the canvas """
+        return [artist for artist in (self.signal_line, self.extrema, *self.extrema_labels,
+            self.points, self.outline) if artist is not None]
+
+    def plot_signal(self, data_t, data_y, t_max: float, y_max: float, t_min: float, y_min: float,
+            pyramid: list = None) -> None:
+        """ Shows a signal with its maximum and minimum, with all of it in view
+
+        Parameters
+        ----------
+        data_t: np.ndarray
+            Times of the samples
+        data_y: np.ndarray
+            Values of the samples
+        t_max, y_max: float
+            Time and value of the maximum
+        t_min, y_min: float
+            Time and value of the minimum
+        pyramid: list
+            Levels of decimation.build_pyramid of data_y, built here if None
+
+        Returns
+        -------
+        None
+        """
+        if self.signal_line is None:
+            self.fig.subplots_adjust(left=0.05, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
+            self.signal_line, = self.axes.plot([], [], self.palette.data)
+            self.extrema, = self.axes.plot([], [], linestyle='none', marker='o', markersize=3,
+                markeredgecolor=self.palette.highlight, markerfacecolor=self.palette.highlight)
+            self.extrema_labels = [self.axes.text(0, 0, '', color=self.palette.on_surface) for _ in range(2)]
+            self.axes.callbacks.connect('xlim_changed', self.on_xlim_changed)
+            self.mpl_connect('resize_event', self.on_resize)
+            self.mpl_connect('scroll_event', self.on_scroll)
+            self.mpl_connect('button_press_event', self.on_button_press)
+            self.mpl_connect('motion_notify_event', self.on_motion_notify)
+            self.mpl_connect('button_release_event', self.on_button_release)
+
+        self.signal_t = np.asarray(data_t)
+        self.signal_y = np.asarray(data_y)
+        self.signal_pyramid = decimation.build_pyramid(self.signal_y) if pyramid is None else pyramid
+        self.pan_start = None
+        # Every sample in range, the axes are fitted to the whole signal
+        self.decimate_signal(0, len(self.signal_t))
+        self.extrema.set_data([t_max, t_min], [y_max, y_min])
+        for label, t_value, y_value in zip(self.extrema_labels, (t_max, t_min), (y_max, y_min)):
+            label.set_position((t_value, y_value))
+            label.set_text(f'{y_value:.2f}')
+
+        self._show_artists()
+        self.home_xlim = self.axes.get_xlim()
+
+    def plot_area(self, data_x, data_y, outline_x, outline_y, closed: bool = False, linewidth: float = None) -> None:
+        """ Shows the samples of a study with the outline of an area
+
+        Parameters
+        ----------
+        data_x: np.ndarray
+            Lateral values of the samples
+        data_y: np.ndarray
+            Antero-posterior values of the samples
+        outline_x, outline_y: np.ndarray
+            Vertices of the outline of the area
+        closed: bool
+            Join the last vertex of the outline to the first one
+        linewidth: float
+            Width of the outline, by default the one of the lines
+
+        Returns
+        -------
+        None
+        """
+        if self.points is None:
+            self.fig.subplots_adjust(left=0.1, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
+            self.points = self.axes.scatter([], [], marker='.', color=self.palette.data)
+            self.outline, = self.axes.plot([], [], self.palette.highlight, linewidth=linewidth)
+            self.axes.set_aspect('equal', adjustable='datalim')
+
+        if closed:
+            outline_x = np.append(outline_x, outline_x[:1])
+            outline_y = np.append(outline_y, outline_y[:1])
+        self.points.set_offsets(np.column_stack((data_x, data_y)))
+        self.outline.set_data(outline_x, outline_y)
+
+        self._show_artists()
+
+    def decimate_signal(self, start: int = None, stop: int = None) -> None:
+        """ Shows the min/max decimation of a range of the signal, by default the one in view """
+        if self.signal_t is None or len(self.signal_t) == 0:
+            return
+        if start is None:
+            start, stop = decimation.visible_range(self.signal_t, *self.axes.get_xlim())
+        n_bins = max(int(self.axes.bbox.width), 1)
+        self.signal_line.set_data(*decimation.minmax(self.signal_t, self.signal_y, start, stop, n_bins,
+            self.signal_pyramid))
+
+    def set_time_view(self, t_start: float, width: float) -> None:
+        """ Shows a span of the time axis, kept inside the whole signal """
+        home_start, home_end = self.home_xlim
+        width = min(width, home_end - home_start)
+        t_start = min(max(t_start, home_start), home_end - width)
+        self.axes.set_xlim(t_start, t_start + width)
+        self.draw_idle()
+
+    def _can_navigate(self, event) -> bool:
+        return (self.home_xlim is not None and event.inaxes is self.axes and
+            self.signal_line.get_visible())
+
+    def on_xlim_changed(self, axes) -> None:
+        self.decimate_signal()
+
+    def on_resize(self, event) -> None:
+        self.decimate_signal()
+
+    def on_scroll(self, event) -> None:
+        """ Zooms the time axis around the pointer """
+        if not self._can_navigate(event):
+            return
+        t_start, t_end = self.axes.get_xlim()
+        sample_time = (self.signal_t[-1] - self.signal_t[0]) / max(len(self.signal_t) - 1, 1)
+        width = max((t_end - t_start) * ZOOM_STEP ** -event.step, ZOOM_MIN_SAMPLES * sample_time)
+        ratio = (event.xdata - t_start) / (t_end - t_start)
+        self.set_time_view(event.xdata - ratio * width, width)
+
+    def on_button_press(self, event) -> None:
+        """ Starts a pan of the time axis, or shows all of it on a double click """
+        if not self._can_navigate(event) or event.button != MouseButton.LEFT:
+            return
+        if event.dblclick:
+            self.pan_start = None
+            self.set_time_view(self.home_xlim[0], self.home_xlim[1] - self.home_xlim[0])
+        else:
+            self.pan_start = (event.x, self.axes.get_xlim())
+
+    def on_motion_notify(self, event) -> None:
+        """ Pans the time axis with the pointer """
+        if self.pan_start is None:
+            return
+        x_start, (t_start, t_end) = self.pan_start
+        shift = (event.x - x_start) * (t_end - t_start) / self.axes.bbox.width
+        self.set_time_view(t_start - shift, t_end - t_start)
+
+    def on_button_release(self, event) -> None:
+        self.pan_start = None
+
+    def resizeEvent(self, event: QResizeEvent) -> None:
+        """ Postpones the resize of the figure until the size settles """
+        if getattr(self, 'renderer', None) is None or not self.isVisible():
+            # Nothing drawn yet to show meanwhile
+            super().resizeEvent(event)
+            return
+
+        if self.resize_pixmap is None:
+            buffer = np.asarray(self.buffer_rgba())
+            image = QImage(buffer.tobytes(), buffer.shape[1], buffer.shape[0], QImage.Format.Format_RGBA8888)
+            self.resize_pixmap = QPixmap.fromImage(image)
+        QtWidgets.QWidget.resizeEvent(self, event)
+        self.resize_timer.start()
+        self.update()
+
+    def on_resize_timer_timeout(self) -> None:
+        self.resize_pixmap = None
+        super().resizeEvent(QResizeEvent(self.size(), self.size()))
+
+    def paintEvent(self, event) -> None:
+        if self.resize_pixmap is None:
+            super().paintEvent(event)
+            return
+        painter = QPainter(self)
+        painter.drawPixmap(self.rect(), self.resize_pixmap)
+        painter.end()
+
+    def clear(self) -> None:
+        """ Hides the plots of the canvas """
+        for artist in self.artists():
+            artist.set_visible(False)
+        self.draw_idle()
+
+    def _show_artists(self) -> None:
+        """ Shows the artists, fits the axes to their data and redraws when idle """
+        for artist in self.artists():
+            artist.set_visible(True)
+
+        # Collections are not measured by relim. Zooms turn the autoscale off
+        self.axes.set_autoscale_on(True)
+        self.axes.relim()
+        if self.points is not None:
+            self.axes.update_datalim(self.points.get_offsets())
+        self.axes.autoscale_view()
+        self.draw_idle()
+
+
+# -------
+# Estudio
+# -------
+def analyze_study(file_path: str) -> tuple:
+    """ Loads and analyzes a stabilometry study file
 
     Parameters
     ----------
-    df: pd.DataFrame
-        Pandas dataframe converted from balance signal data from file
-    
+    file_path: str
+        Path of the stabilometry text file
+
     Returns
     -------
     results: dict
-        Results of ellipse clustering analysis
-        x: list
-            x-coordinates of ellipse points
-        y: list
-            y-coordinates of ellipse points
-        area: float
-            area of ellipse
+        Results of analisis in the analysis window of the study
+    data_convex: dict
+        Results of convexHull in the analysis window of the study
     """
-    data_x = df.iloc[:,0]
-    data_y = df.iloc[:,1]
+    return analyze_signal(*cache.load_study(file_path))
 
-    x_max = data_x.max()
-    x_min = data_x.min()
-    y_max = data_y.max()
-    y_min = data_y.min()
 
-    a = (x_max - x_min) / 2
-    b = (y_max - y_min) / 2
-    x0 = x_max - a
-    y0 = y_max - b
-
-    theta = np.linspace(0, 2 * np.pi, 100)
-    x = x0 + a * np.cos(theta)
-    y = y0 + b * np.sin(theta)
-
-    results = {
-        'x': x,
-        'y': y,
-        'area': np.pi * a * b
-    }
-
-    return results
-
-
-# -----------
-# Convex Hull
-# -----------
-def convexHull(df: pd.DataFrame) -> dict:
-    """ Convex hull analysis of dataframe from balance signal
+def analyze_signal(header: reader.StudyHeader, signal) -> tuple:
+    """ Analyzes the signals of a study in its analysis window
 
     Parameters
     ----------
-    df: pd.DataFrame
-        Pandas dataframe converted from balance signal data from file
-    
+    header: StudyHeader
+        Header of the study
+    signal: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals
+
     Returns
     -------
     results: dict
-        Results of convex hull clustering analysis
-        x: list
-            x-coordinates of convex hull points
-        y: list
-            y-coordinates of convex hull points
-        area: float
-            area of convex hull
+        Results of analisis in the analysis window of the study, with the
+        min/max pyramids of its signals (pyramid_x, pyramid_y)
+    data_convex: dict
+        Results of convexHull in the analysis window of the study
     """
-    data_x = df.iloc[:,0]
-    data_y = df.iloc[:,1]
-    data = np.stack((data_x.to_numpy(), data_y.to_numpy()), axis=1)
+    signal = signal[reader.analysis_window(header, len(signal))]
 
-    hull = ConvexHull(data)
-    hullX = data[hull.vertices, 0]
-    hullY = data[hull.vertices, 1]
+    results = analisis(signal, header.frequency, header.start_of_analysis)
+    # Levels of detail of the signal plots, built outside of the GUI thread
+    results['pyramid_x'] = decimation.build_pyramid(results['data_x'])
+    results['pyramid_y'] = decimation.build_pyramid(results['data_y'])
 
-    results = {
-        'x': hullX,
-        'y': hullY,
-        'area': hull.volume # 2D Area
-    }
+    return results, convexHull(signal)
 
-    return results
 
+def plot_signal(header: reader.StudyHeader, signal, metrics: dict) -> tuple:
+    """ Plot data of the signals of a study whose metrics are stored
 
-# ----------------
-# Elipse Orientada
-# ----------------
-def ellipsePCA(df: pd.DataFrame) -> dict:
-    """ Oriented ellipse analysis of dataframe from balance signal
+    The same plot data as analyze_signal, with the extrema and the ellipse
+    of the stored metrics instead of a new analysis.
 
     Parameters
     ----------
-    df: pd.DataFrame
-        Pandas dataframe converted from balance signal data from file
-    
+    header: StudyHeader
+        Header of the study
+    signal: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals
+    metrics: dict
+        Metrics of the study, as stored in resultados
+
     Returns
     -------
     results: dict
-        Results of oriented ellipse clustering analysis
-        x: list
-            x-coordinates of oriented ellipse points
-        y: list
-            y-coordinates of oriented ellipse points
-        area: float
-            area of oriented ellipse
+        Results of plot_data in the analysis window of the study, with the
+        min/max pyramids of its signals (pyramid_x, pyramid_y)
+    data_convex: dict
+        Results of convexHull in the analysis window of the study
     """
-    data_x = df.iloc[:,0]
-    data_y = df.iloc[:,1]
-
-    sumX = data_x.sum()
-    sumY = data_y.sum()
-    cen = ( sumX / len(df) , sumY / len(df) )
-
-    covXX = (data_x - cen[0]) * (data_x - cen[0])
-    covXY = (data_x - cen[0]) * (data_y - cen[1])
-    covYY = (data_y - cen[1]) * (data_y - cen[1])
-    JX = data_x - cen[0]
-    JY = data_y - cen[1]
-    theta = np.arctan2(JY , JX)
-    rho = np.sqrt((JX * JX) + (JY * JY))
-
-    a = covXX.sum() / len(covXX)
-    b = covXY.sum() / len(covXY)
-    d = covYY.sum() / len(covYY)
-
-    B = a + d
-    C = a * d - b * b
-    L1 = (B / 2) + np.sqrt(B * B - 4 * C) / 2
-    eigvec = ( L1 - d , b )
-
-    rot = np.arctan( (L1 - d) / b )
-
-    thetarot = theta + rot
-    rotX = rho * np.cos(thetarot)
-    rotY = rho * np.sin(thetarot)
-
-    maxX = rotX.max()
-    minX = rotX.min()
-    maxY = rotY.max()
-    minY = rotY.min()
-
-    aa = (maxX - minX) / 2
-    bb = (maxY - minY) / 2
-    x0 = maxX - aa
-    y0 = maxY - bb
-
-    phi = np.linspace(0, 2 * np.pi, 100)
-    newX = x0 + aa * np.cos(phi)
-    newY = y0 + bb * np.sin(phi)
-    thetaellipse = np.arctan2(newY, newX)
-    rhoellipse = np.sqrt((newX * newX) + (newY * newY))
-    thetarotellipse = thetaellipse - rot
-    Xellipse = rhoellipse * np.cos(thetarotellipse)
-    Yellipse = rhoellipse * np.sin(thetarotellipse)
-    XellipseFinal = Xellipse + cen[0]
-    YellipseFinal = Yellipse + cen[1]
-
-    results = {
-        'x': XellipseFinal,
-        'y': YellipseFinal,
-        'area': np.pi * aa * bb
-    }
-
-    return results
+    signal = signal[reader.analysis_window(header, len(signal))]
+
+    results = plot_data(signal, metrics, header.frequency, header.start_of_analysis)
+    results['pyramid_x'] = decimation.build_pyramid(results['data_x'])
+    results['pyramid_y'] = decimation.build_pyramid(results['data_y'])
+
+    return results, convexHull(signal)
+
 
 # ---------
 # Funciones
 # ---------
 def create_db(db_table: str) -> list:
-    """ Creates database tables if they don't exist and returns table data
+    """ Brings the database schema up to date and returns table data
+
+    The pending migrations of the migrations module are applied the first
+    time, and skipped afterwards without any DDL.
     
     Parameters
     ----------
@@ -367,62 +459,72 @@ def create_db(db_table: str) -> list:
     Returns
     -------
     table_data: list
-        Data of table if exists (empty if table don't exist)
+        First page of get_patients_page for pacientes, None for other tables
     """
-    settings = QSettings(f'{sys.path[0]}/settings.ini', QSettings.Format.IniFormat)
-    db_host = settings.value('db_host')
-    db_port = settings.value('db_port')
-    db_name = settings.value('db_name')
-    db_user = settings.value('db_user')
-    db_password = settings.value('db_password')
+    import db
+    import migrations
+
     try:
-        connection = psycopg2.connect(user=db_user, 
-                                  password=db_password, 
-                                  host=db_host, 
-                                  port=db_port, 
-                                  database=db_name)
-    except psycopg2.OperationalError as err:
+        migrations.migrate()
+    except db.OperationalError as err:
         return err
 
-    cursor = connection.cursor()
-
+    table_data = None
     if db_table == 'pacientes':
-        cursor.execute("""CREATE TABLE IF NOT EXISTS pacientes (
-                        id serial PRIMARY KEY,
-                        last_name VARCHAR(128) NOT NULL,
-                        first_name VARCHAR(128) NOT NULL,
-                        id_type CHAR(2) NOT NULL,
-                        id_number BIGINT UNIQUE NOT NULL,
-                        birth_date VARCHAR(128) NOT NULL,
-                        sex CHAR(1) NOT NULL,
-                        weight NUMERIC(5,2) NOT NULL,
-                        weight_unit CHAR(2) NOT NULL,
-                        height NUMERIC(3,2) NOT NULL,
-                        height_unit VARCHAR(7) NOT NULL,
-                        bmi NUMERIC(4,2) NOT NULL
-                        )""")
-    elif db_table == 'estudios':
-        cursor.execute("""CREATE TABLE IF NOT EXISTS estudios (
-                        id serial PRIMARY KEY,
-                        id_number BIGINT NOT NULL,
-                        file_name VARCHAR(128) UNIQUE NOT NULL,
-                        file_path VARCHAR(128) UNIQUE NOT NULL
-                        )""")
+        table_data = get_patients_page()
 
-    connection.commit()
+    return table_data
 
-    table_data = None
-    if db_table == 'pacientes':
-        cursor.execute('SELECT * FROM pacientes ORDER BY id ASC')
+
+def get_patients_page(search: str = '', after: int = 0, limit: int = PATIENTS_PAGE) -> list:
+    """ Get a page of patients, ordered by id
+
+    Pages are read by keyset, from the last id of the previous page, so a
+    page costs the same at any depth of the registry.
+
+    Parameters
+    ----------
+    search: str
+        Prefix of the id number, last name or first name of the patients,
+        in any case. Empty for every patient
+    after: int
+        Database id of the last patient of the previous page, 0 for the first
+    limit: int
+        Maximum number of patients of the page
+
+    Returns
+    -------
+    table_data: list
+        Rows of the patients in pacientes
+    """
+    import db
+
+    search = search.strip().lower()
+
+    with db.connection() as connection:
+        cursor = connection.cursor()
+
+        if search:
+            # Texts with the prefix sort between it and the prefix with its last letter raised
+            upper_bound = search[:-1] + chr(ord(search[-1]) + 1)
+            db.execute_prepared(cursor, 'pacientes_buscar', (after, search, upper_bound, limit))
+        else:
+            db.execute_prepared(cursor, 'pacientes_pagina', (after, limit))
         table_data = cursor.fetchall()
-    
-    connection.close()
 
     return table_data
 
 
+def _invalidate_rows(db_table: str, rows: list) -> None:
+    """ Drops the patients of rows written to pacientes or estudios from the cache """
+    import records
+
+    for row in rows:
+        records.invalidate_patient(row[4] if db_table == 'pacientes' else row[1])
+
+
 def add_db(db_table: str, data: dict) -> list:
-    """ Adds data to database table and returns table data updated
+    """ Adds data to database table and returns the row added
     
     Parameters
     ----------
@@ -434,8 +536,10 @@ def add_db(db_table: str, data: dict) -> list:
     Returns
     -------
     table_data: list
-        Data of table updated
+        Rows affected by the operation, as returned by the database
     """
+    import db
+
     if db_table == 'pacientes':
         last_name_value = data['last_name']
         first_name_value = data['first_name']
@@ -453,39 +557,23 @@ def add_db(db_table: str, data: dict) -> list:
         file_name_value = data['file_name']
         file_path_value = data['file_path']
 
-    settings = QSettings(f'{sys.path[0]}/settings.ini', QSettings.Format.IniFormat)
-    db_host = settings.value('db_host')
-    db_port = settings.value('db_port')
-    db_name = settings.value('db_name')
-    db_user = settings.value('db_user')
-    db_password = settings.value('db_password')
-    connection = psycopg2.connect(user=db_user, 
-                                  password=db_password, 
-                                  host=db_host, 
-                                  port=db_port, 
-                                  database=db_name)
-    cursor = connection.cursor()
-
-    insert_query = None
-    if db_table == 'pacientes':
-        insert_query = f"""INSERT INTO pacientes (last_name, first_name, id_type, id_number, birth_date, sex, weight, weight_unit, height, height_unit, bmi) 
-                    VALUES ('{last_name_value}', '{first_name_value}', '{id_type_value}', '{id_value}', '{birth_date_value}', '{sex_value}', '{weight_value}', '{weight_unit}', '{height_value}', '{height_unit}', '{bmi_value}')"""
-    elif db_table == 'estudios':
-        insert_query = f"""INSERT INTO estudios (id_number, file_name, file_path) 
-                    VALUES ('{id_value}', '{file_name_value}', '{file_path_value}')"""
+    with db.connection() as connection:
+        cursor = connection.cursor()
 
-    cursor.execute(insert_query)
-    connection.commit()
+        if db_table == 'pacientes':
+            cursor.execute("""INSERT INTO pacientes (last_name, first_name, id_type, id_number, birth_date, sex, weight, weight_unit, height, height_unit, bmi) 
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
+                        RETURNING *""",
+                        (last_name_value, first_name_value, id_type_value, id_value, birth_date_value, sex_value, weight_value, weight_unit, height_value, height_unit, bmi_value))
+        elif db_table == 'estudios':
+            cursor.execute("""INSERT INTO estudios (id_number, file_name, file_path) 
+                        VALUES (%s, %s, %s) 
+                        RETURNING *""",
+                        (id_value, file_name_value, file_path_value))
 
-    table_data = None
-    if db_table == 'pacientes':
-        cursor.execute('SELECT * FROM pacientes ORDER BY id ASC')
-        table_data = cursor.fetchall()
-    elif db_table == 'estudios':
-        cursor.execute(f"SELECT * FROM estudios WHERE id_number='{id_value}' ORDER BY id ASC")
         table_data = cursor.fetchall()
-    
-    connection.close()
+
+    _invalidate_rows(db_table, table_data)
 
     return table_data
 
@@ -505,32 +593,61 @@ def get_db(db_table: str, data_id: str) -> list:
     table_data: list
         Data of table
     """
-    settings = QSettings(f'{sys.path[0]}/settings.ini', QSettings.Format.IniFormat)
-    db_host = settings.value('db_host')
-    db_port = settings.value('db_port')
-    db_name = settings.value('db_name')
-    db_user = settings.value('db_user')
-    db_password = settings.value('db_password')
-    connection = psycopg2.connect(user=db_user, 
-                                  password=db_password, 
-                                  host=db_host, 
-                                  port=db_port, 
-                                  database=db_name)
-    cursor = connection.cursor()
+    import db
 
-    table_data = None
-    if db_table == 'pacientes':
-        cursor.execute(f"SELECT * FROM pacientes WHERE id_number='{data_id}'")
-    elif db_table == 'estudios':
-        cursor.execute(f"SELECT * FROM estudios WHERE id_number='{data_id}'")
-    table_data = cursor.fetchall()
-    connection.close()
+    with db.connection() as connection:
+        cursor = connection.cursor()
+
+        table_data = None
+        if db_table == 'pacientes':
+            db.execute_prepared(cursor, 'paciente_por_id_number', (data_id,))
+        elif db_table == 'estudios':
+            db.execute_prepared(cursor, 'estudios_por_id_number', (data_id,))
+        table_data = cursor.fetchall()
     
     return table_data
 
 
+def get_patient_db(id_number: str) -> tuple:
+    """ Get a patient and its studies from the database
+
+    Patients selected recently are read from the cache of the records
+    module, which drops them when they are written.
+    
+    Parameters
+    ----------
+    id_number: str
+        Patient id number
+    
+    Returns
+    -------
+    patient_data: list
+        Rows of the patient in pacientes
+    studies_data: list
+        Rows of the studies of the patient in estudios
+    """
+    import records
+
+    return records.get_patient(id_number, _load_patient)
+
+
+def _load_patient(id_number: str) -> tuple:
+    """ Patient and studies of an id number, read from the database """
+    import db
+
+    with db.connection() as connection:
+        cursor = connection.cursor()
+
+        db.execute_prepared(cursor, 'paciente_por_id_number', (id_number,))
+        patient_data = cursor.fetchall()
+        db.execute_prepared(cursor, 'estudios_por_id_number', (id_number,))
+        studies_data = cursor.fetchall()
+
+    return patient_data, studies_data
+
+
 def edit_db(db_table: str, id_db: int, data: dict) -> list:
-    """ Edit data of a database table and returns table data updated
+    """ Edit data of a database table and returns the row edited
     
     Parameters
     ----------
@@ -544,8 +661,11 @@ def edit_db(db_table: str, id_db: int, data: dict) -> list:
     Returns
     -------
     table_data: list
-        Data of table updated
+        Rows affected by the operation, as returned by the database
     """
+    import db
+    import records
+
     if db_table == 'pacientes':
         last_name_value = data['last_name']
         first_name_value = data['first_name']
@@ -563,49 +683,41 @@ def edit_db(db_table: str, id_db: int, data: dict) -> list:
         file_name_value = data['file_name']
         file_path_value = data['file_path']
 
-    settings = QSettings(f'{sys.path[0]}/settings.ini', QSettings.Format.IniFormat)
-    db_host = settings.value('db_host')
-    db_port = settings.value('db_port')
-    db_name = settings.value('db_name')
-    db_user = settings.value('db_user')
-    db_password = settings.value('db_password')
-    connection = psycopg2.connect(user=db_user, 
-                                  password=db_password, 
-                                  host=db_host, 
-                                  port=db_port, 
-                                  database=db_name)
-    cursor = connection.cursor()    
-    
-    update_query = None
-    if db_table == 'pacientes':
-        update_query = f"""UPDATE pacientes 
-                    SET (last_name, first_name, id_type, id_number, birth_date, sex, weight, weight_unit, height, height_unit, bmi)
-                    = ('{last_name_value}', '{first_name_value}', '{id_type_value}', '{id_value}', '{birth_date_value}', '{sex_value}', '{weight_value}', '{weight_unit}', '{height_value}', '{height_unit}', '{bmi_value}') 
-                    WHERE id = '{id_db}' """
-    elif db_table == 'estudios':
-        update_query = f"""UPDATE estudios 
-                    SET (id_number, file_name, file_path)
-                    = ('{id_value}', '{file_name_value}', '{file_path_value}') 
-                    WHERE id = '{id_db}' """
-    
-    cursor.execute(update_query)
-    connection.commit()
+    with db.connection() as connection:
+        cursor = connection.cursor()
+
+        if db_table == 'pacientes':
+            cursor.execute("""UPDATE pacientes 
+                        SET (last_name, first_name, id_type, id_number, birth_date, sex, weight, weight_unit, height, height_unit, bmi)
+                        = (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
+                        WHERE id = %s 
+                        RETURNING *""",
+                        (last_name_value, first_name_value, id_type_value, id_value, birth_date_value, sex_value, weight_value, weight_unit, height_value, height_unit, bmi_value, id_db))
+        elif db_table == 'estudios':
+            cursor.execute("""UPDATE estudios 
+                        SET (id_number, file_name, file_path)
+                        = (%s, %s, %s) 
+                        WHERE id = %s 
+                        RETURNING *""",
+                        (id_value, file_name_value, file_path_value, id_db))
 
-    table_data = None
-    if db_table == 'pacientes':
-        cursor.execute('SELECT * FROM pacientes ORDER BY id ASC')
         table_data = cursor.fetchall()
-    elif db_table == 'estudios':
-        cursor.execute('SELECT * FROM estudios')
-        table_data = cursor.fetchall()
-    
-    connection.close()
+
+    # The id number before the change is not known: a rare write, every patient is dropped
+    records.invalidate_all()
 
     return table_data
 
 
+def close_db() -> None:
+    """ Closes the connections of the database pool """
+    import db
+
+    db.close_pool()
+
+
 def delete_db(db_table: str, data: str) -> list:
-    """ Delete data from database table and returns table data updated
+    """ Delete data from database table and returns the rows deleted
     
     Parameters
     ----------
@@ -618,42 +730,221 @@ def delete_db(db_table: str, data: str) -> list:
     Returns
     -------
     table_data: list
-        Data of table updated
+        Rows affected by the operation, as returned by the database
     """
-    settings = QSettings(f'{sys.path[0]}/settings.ini', QSettings.Format.IniFormat)
-    db_host = settings.value('db_host')
-    db_port = settings.value('db_port')
-    db_name = settings.value('db_name')
-    db_user = settings.value('db_user')
-    db_password = settings.value('db_password')
-    connection = psycopg2.connect(user=db_user, 
-                                  password=db_password, 
-                                  host=db_host, 
-                                  port=db_port, 
-                                  database=db_name)
-    cursor = connection.cursor()
-
-    delete_query = None
-    if db_table == 'pacientes':
-        delete_query = f"DELETE FROM pacientes WHERE id_number='{data}'"
-    elif db_table == 'estudios':
-        delete_query = f"DELETE FROM estudios WHERE file_name='{data}'"
-    cursor.execute(delete_query)
-    connection.commit()
+    import db
+
+    with db.connection() as connection:
+        cursor = connection.cursor()
+
+        if db_table == 'pacientes':
+            cursor.execute('DELETE FROM pacientes WHERE id_number = %s RETURNING *', (data,))
+        elif db_table == 'estudios':
+            cursor.execute('DELETE FROM estudios WHERE file_name = %s RETURNING *', (data,))
 
-    table_data = None
-    if db_table == 'pacientes':
-        cursor.execute('SELECT * FROM pacientes ORDER BY id ASC')
-        table_data = cursor.fetchall()
-    elif db_table == 'estudios':
-        cursor.execute('SELECT * FROM estudios')
         table_data = cursor.fetchall()
-    
-    connection.close()
+
+    _invalidate_rows(db_table, table_data)
 
     return table_data
 
 
+def _insert_resultados(cursor, estudio_id: int, metrics: dict) -> None:
+    """ Stores the metrics of a study for the current analysis version """
+    # Column names from the constants of the analysis module, values as parameters
+    columns = METRICS + AREAS
+    cursor.execute(f"""INSERT INTO resultados (estudio_id, analysis_version, {', '.join(columns)})
+                    VALUES (%s, %s, {', '.join(['%s'] * len(columns))})
+                    ON CONFLICT (estudio_id, analysis_version) DO NOTHING""",
+                    (estudio_id, ANALYSIS_VERSION, *[metrics[key] for key in columns]))
+
+
+def signal_storage() -> str:
+    """ Storage of the signals of the studies, from settings.ini
+
+    Returns
+    -------
+    storage: str
+        'file': signals are read from the study files (default)
+        'database': signals are also stored in the senales table
+    """
+    settings = QSettings(f'{sys.path[0]}/settings.ini', QSettings.Format.IniFormat)
+    return settings.value('signal_storage', 'file')
+
+
+def _insert_senal(cursor, estudio_id: int, header: reader.StudyHeader, signal) -> None:
+    """ Stores the header and the compressed signals of a study """
+    encoding, blob = blobs.encode_signal(signal)
+    cursor.execute("""INSERT INTO senales (estudio_id, header, n_samples, n_columns, encoding, signal)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (estudio_id) DO NOTHING""",
+                    (estudio_id, json.dumps(cache.header_to_dict(header)), len(signal), signal.shape[1],
+                    encoding, blob))
+
+
+def _load_senal(cursor, estudio_id: int):
+    """ Header and signals of a study stored in senales, or None
+
+    The first SIGNAL_CHUNK bytes of the blob come with the header, which is
+    the whole blob of usual studies. Larger blobs are read by parts while
+    they are decompressed.
+    """
+    import db
+
+    db.execute_prepared(cursor, 'senal_por_estudio', (estudio_id, SIGNAL_CHUNK))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    header, n_samples, n_columns, encoding, size, first_chunk = row
+    if isinstance(header, str):
+        # JSONB is read as a dict, the TEXT of SQLite as a string
+        header = json.loads(header)
+
+    def chunks():
+        yield first_chunk
+        for start in range(SIGNAL_CHUNK + 1, size + 1, SIGNAL_CHUNK):
+            db.execute_prepared(cursor, 'senal_parte', (estudio_id, start, SIGNAL_CHUNK))
+            yield cursor.fetchone()[0]
+
+    return cache.header_from_dict(header), blobs.decode_signal(encoding, chunks(), n_samples, n_columns)
+
+
+def add_study_db(data: dict) -> tuple:
+    """ Adds a study and the results of its analysis to the database
+
+    The study file is analyzed before the insert, and the study and its
+    results are added in one transaction, with its signals if they are
+    stored in the database.
+    
+    Parameters
+    ----------
+    data: dict
+        Data from study file: id_number, file_name and file_path
+    
+    Returns
+    -------
+    table_data: list
+        Row added to estudios
+    metrics: dict
+        Metrics stored in resultados
+    analysis_data: tuple
+        Results of analyze_study, for the plots
+    """
+    import db
+
+    header, signal = cache.load_study(data['file_path'])
+    analysis_data = analyze_signal(header, signal)
+    metrics = summary(*analysis_data)
+
+    with db.connection() as connection:
+        cursor = connection.cursor()
+
+        cursor.execute("""INSERT INTO estudios (id_number, file_name, file_path) 
+                    VALUES (%s, %s, %s) 
+                    RETURNING *""",
+                    (data['id_number'], data['file_name'], data['file_path']))
+        table_data = cursor.fetchall()
+
+        _insert_resultados(cursor, table_data[0][0], metrics)
+        if signal_storage() == 'database':
+            _insert_senal(cursor, table_data[0][0], header, signal)
+
+    _invalidate_rows('estudios', table_data)
+
+    return table_data, metrics, analysis_data
+
+
+def get_results_db(study_data: tuple) -> dict:
+    """ Get the stored metrics of a study
+
+    Parameters
+    ----------
+    study_data: tuple
+        Row of the study in estudios
+
+    Returns
+    -------
+    metrics: dict
+        Metrics of the study for the current analysis version, as stored in
+        resultados, or None if the study wasn't analyzed with it
+    """
+    import db
+
+    with db.connection() as connection:
+        cursor = connection.cursor()
+
+        db.execute_prepared(cursor, 'resultados_por_estudio', (study_data[0], ANALYSIS_VERSION))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        names = [column[0] for column in cursor.description]
+
+    return dict(zip(names, row))
+
+
+def get_study_db(study_data: tuple, metrics: dict = None) -> tuple:
+    """ Get the plots of a study, and its metrics if they aren't stored
+
+    With the database storage, the signals are read from senales if the
+    study has them there, and otherwise read from the study file and
+    stored in senales on that visit. With the file storage, senales is not
+    queried and the study file is read. With the stored metrics of
+    get_results_db, only the plot data is computed. Studies added before
+    resultados existed, or analyzed with another version of the
+    algorithms, are analyzed and their metrics stored.
+    
+    Parameters
+    ----------
+    study_data: tuple
+        Row of the study in estudios
+    metrics: dict
+        Stored metrics of the study, from get_results_db, or None
+    
+    Returns
+    -------
+    metrics: dict
+        Metrics of the study, as stored in resultados
+    analysis_data: tuple
+        Results of analyze_signal or plot_signal, or None if the signals
+        can't be read but its metrics are stored
+    """
+    import db
+
+    in_database = signal_storage() == 'database'
+    stored = None
+    if in_database:
+        with db.connection() as connection:
+            stored = _load_senal(connection.cursor(), study_data[0])
+
+    if stored is not None:
+        header, signal = stored
+    else:
+        try:
+            header, signal = cache.load_study(study_data[3])
+        except OSError:
+            if metrics is None:
+                raise
+            return metrics, None
+
+    store_results = metrics is None
+    if store_results:
+        analysis_data = analyze_signal(header, signal)
+        metrics = summary(*analysis_data)
+    else:
+        analysis_data = plot_signal(header, signal, metrics)
+
+    store_signal = in_database and stored is None
+    if store_results or store_signal:
+        with db.connection() as connection:
+            cursor = connection.cursor()
+            if store_results:
+                _insert_resultados(cursor, study_data[0], metrics)
+            if store_signal:
+                _insert_senal(cursor, study_data[0], header, signal)
+
+    return metrics, analysis_data
+
+
 # ----------------
 # About App Dialog
 # ----------------
@@ -0,0 +1,268 @@
+"""
+Analysis benchmark
+
+Compares the single pass NumPy kernel analysis.analisis with the previous
+pandas Series pipeline (analisis, ellipseStandard and ellipsePCA over a
+DataFrame) on synthetic recordings, reporting time and peak memory traced by
+tracemalloc. A cohort of studies of different lengths is also analysed
+with analysis.analisis_batch and with a loop of analysis.analisis calls.
+
+Usage: python benchmarks/bench_analysis.py [--frequency HZ] [--seconds S] [--repeat N]
+       [--studies N]
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import analysis
+
+
+# ---------------------------
+# Previous pandas pipeline
+# ---------------------------
+def legacy_analisis(df: pd.DataFrame, frequency: float = 10.0, start: float = 0.0) -> dict:
+    results = {}
+
+    data_x = df.iloc[:,0].reset_index(drop=True)
+    data_y = df.iloc[:,1].reset_index(drop=True)
+    data_t = start + np.arange(len(df)) / frequency
+
+    results['data_x'] = data_x
+    results['data_y'] = data_y
+    results['data_t'] = data_t
+
+    x_max = data_x.max()
+    x_min = data_x.min()
+    y_max = data_y.max()
+    y_min = data_y.min()
+
+    results['lat_max'] = x_max
+    results['lat_t_max'] = data_t[data_x.idxmax()]
+    results['lat_min'] = x_min
+    results['lat_t_min'] = data_t[data_x.idxmin()]
+
+    results['ap_max'] = y_max
+    results['ap_t_max'] = data_t[data_y.idxmax()]
+    results['ap_min'] = y_min
+    results['ap_t_min'] = data_t[data_y.idxmin()]
+
+    results['lat_rango'] = x_max - x_min
+    results['ap_rango'] = y_max - y_min
+
+    tAnalisis = len(df) / frequency
+    time_analysis = len(df) - 1
+    den = tAnalisis / len(df)
+
+    # SEÑAL X ----------------------------------------------------------------
+    avgX = data_x.sum() / len(df)
+
+    numX = abs(data_x.diff()).dropna()
+    velSgnX = numX / den
+    results['lat_vel'] = velSgnX.sum() / time_analysis
+
+    numRMSX = (data_x - avgX) * (data_x - avgX)
+    results['lat_rms'] = np.sqrt(numRMSX.sum() / time_analysis)
+    
+    # SEÑAL Y ----------------------------------------------------------------
+    avgY = data_y.sum() / len(df)
+
+    numY = abs(data_y.diff()).dropna()
+    velSgnY = numY / den
+    results['ap_vel'] = velSgnY.sum() / time_analysis
+
+    numRMSY = (data_y - avgY) * (data_y - avgY)
+    results['ap_rms'] = np.sqrt(numRMSY.sum() / time_analysis)
+
+    # SEÑALES X Y ------------------------------------------------------------
+    num2 = np.sqrt((numX * numX) + (numY * numY))
+    numVMT = num2 / tAnalisis
+    results['centro_vel'] = numVMT.sum()
+
+    numDist = np.sqrt((data_x * data_x) + (data_y * data_y))
+    distM = numDist / tAnalisis
+
+    results['centro_dist'] = distM.sum()
+    results['centro_frec'] = numVMT.sum() / (2 * np.pi)
+
+    return results
+
+
+def legacy_ellipseStandard(df: pd.DataFrame) -> dict:
+    data_x = df.iloc[:,0]
+    data_y = df.iloc[:,1]
+
+    x_max = data_x.max()
+    x_min = data_x.min()
+    y_max = data_y.max()
+    y_min = data_y.min()
+
+    a = (x_max - x_min) / 2
+    b = (y_max - y_min) / 2
+    x0 = x_max - a
+    y0 = y_max - b
+
+    theta = np.linspace(0, 2 * np.pi, 100)
+    x = x0 + a * np.cos(theta)
+    y = y0 + b * np.sin(theta)
+
+    results = {
+        'x': x,
+        'y': y,
+        'area': np.pi * a * b
+    }
+
+    return results
+
+
+def legacy_ellipsePCA(df: pd.DataFrame) -> dict:
+    data_x = df.iloc[:,0]
+    data_y = df.iloc[:,1]
+
+    sumX = data_x.sum()
+    sumY = data_y.sum()
+    cen = ( sumX / len(df) , sumY / len(df) )
+
+    covXX = (data_x - cen[0]) * (data_x - cen[0])
+    covXY = (data_x - cen[0]) * (data_y - cen[1])
+    covYY = (data_y - cen[1]) * (data_y - cen[1])
+    JX = data_x - cen[0]
+    JY = data_y - cen[1]
+    theta = np.arctan2(JY , JX)
+    rho = np.sqrt((JX * JX) + (JY * JY))
+
+    a = covXX.sum() / len(covXX)
+    b = covXY.sum() / len(covXY)
+    d = covYY.sum() / len(covYY)
+
+    B = a + d
+    C = a * d - b * b
+    L1 = (B / 2) + np.sqrt(B * B - 4 * C) / 2
+    eigvec = ( L1 - d , b )
+
+    rot = np.arctan( (L1 - d) / b )
+
+    thetarot = theta + rot
+    rotX = rho * np.cos(thetarot)
+    rotY = rho * np.sin(thetarot)
+
+    maxX = rotX.max()
+    minX = rotX.min()
+    maxY = rotY.max()
+    minY = rotY.min()
+
+    aa = (maxX - minX) / 2
+    bb = (maxY - minY) / 2
+    x0 = maxX - aa
+    y0 = maxY - bb
+
+    phi = np.linspace(0, 2 * np.pi, 100)
+    newX = x0 + aa * np.cos(phi)
+    newY = y0 + bb * np.sin(phi)
+    thetaellipse = np.arctan2(newY, newX)
+    rhoellipse = np.sqrt((newX * newX) + (newY * newY))
+    thetarotellipse = thetaellipse - rot
+    Xellipse = rhoellipse * np.cos(thetarotellipse)
+    Yellipse = rhoellipse * np.sin(thetarotellipse)
+    XellipseFinal = Xellipse + cen[0]
+    YellipseFinal = Yellipse + cen[1]
+
+    results = {
+        'x': XellipseFinal,
+        'y': YellipseFinal,
+        'area': np.pi * aa * bb
+    }
+
+    return results
+
+
+def legacy_pipeline(df: pd.DataFrame, frequency: float) -> dict:
+    """ Previous analysis of a study """
+    results = legacy_analisis(df, frequency)
+    results['elipse'] = legacy_ellipseStandard(df)
+    results['pca'] = legacy_ellipsePCA(df)
+    return results
+
+
+def measure(function, *args, repeat: int) -> tuple:
+    """ Best time and peak traced memory of function(*args) """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(times), peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frequency', type=float, default=1000.0)
+    parser.add_argument('--seconds', type=float, default=60.0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--studies', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = int(args.frequency * args.seconds)
+    signal = np.cumsum(rng.normal(scale=0.05, size=(n, 2)), axis=0) + (-20.0, 28.0)
+    df = pd.DataFrame(signal, columns=('Px', 'Py'))
+
+    legacy = legacy_pipeline(df, args.frequency)
+    kernel = analysis.analisis(signal, args.frequency)
+    for key, value in legacy.items():
+        if key in ('elipse', 'pca'):
+            assert np.isclose(value['area'], kernel[key]['area'], rtol=1e-9), key
+        elif not key.startswith('data'):
+            assert np.isclose(value, kernel[key], rtol=1e-9), key
+
+    time_legacy, peak_legacy = measure(legacy_pipeline, df, args.frequency, repeat=args.repeat)
+    time_kernel, peak_kernel = measure(analysis.analisis, signal, args.frequency, repeat=args.repeat)
+
+    print(f'{n} samples ({args.frequency:g} Hz, {args.seconds:g} s)')
+    print(f'{"":<8}{"time (ms)":>12}{"peak (MiB)":>12}')
+    print(f'{"pandas":<8}{time_legacy * 1e3:>12.2f}{peak_legacy / 2**20:>12.2f}')
+    print(f'{"kernel":<8}{time_kernel * 1e3:>12.2f}{peak_kernel / 2**20:>12.2f}')
+    print(f'speedup {time_legacy / time_kernel:.1f}x, peak memory {peak_legacy / peak_kernel:.1f}x lower')
+
+    # Cohort of 10 Hz studies between 30 and 60 s, as exported by the platform
+    lengths = rng.integers(300, 601, size=args.studies)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    cohort = np.cumsum(rng.normal(scale=0.05, size=(offsets[-1], 2)), axis=0)
+    studies = [cohort[begin:end] for begin, end in zip(offsets[:-1], offsets[1:])]
+
+    def loop(studies):
+        return [analysis.analisis(study) for study in studies]
+
+    batch = analysis.analisis_batch(cohort, offsets=offsets)
+    for index in (0, args.studies - 1):
+        single = analysis.analisis(studies[index])
+        for key, values in batch.items():
+            if key in ('elipse_area', 'pca_area'):
+                value = single[key.split('_')[0]]['area']
+            else:
+                value = single[key]
+            assert np.isclose(values[index], value, rtol=1e-9), key
+
+    time_loop, _ = measure(loop, studies, repeat=max(1, args.repeat // 4))
+    time_batch, _ = measure(analysis.analisis_batch, cohort, 10.0, 0.0, offsets, repeat=args.repeat)
+
+    print(f'\n{args.studies} studies ({offsets[-1]} samples)')
+    print(f'{"loop":<8}{time_loop * 1e3:>12.2f}')
+    print(f'{"batch":<8}{time_batch * 1e3:>12.2f}')
+    print(f'speedup {time_loop / time_batch:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
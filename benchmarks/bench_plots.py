@@ -0,0 +1,73 @@
+"""
+Plots benchmark
+
+Measures the redraw of a signal plot of backend.MPLCanvas for recordings
+of increasing length, with the min/max decimation of the decimation module
+and with every sample, as plotted before:
+
+1. Lengths: minutes of a 1000 Hz recording, as in long clinical protocols
+2. Redraw: full Agg render of the canvas, as on every resize or zoom
+
+Usage: python benchmarks/bench_plots.py [--minutes M ...] [--width PX] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt6.QtWidgets import QApplication
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import backend
+
+FREQUENCY = 1000
+
+
+def best_time(canvas: backend.MPLCanvas, repeat: int) -> float:
+    """ Best time of a full redraw of canvas """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        canvas.draw()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--minutes', type=float, nargs='+', default=[0.5, 2, 10, 60])
+    parser.add_argument('--width', type=int, default=1200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    canvas = backend.MPLCanvas(None, True)
+    canvas.resize(args.width, 300)
+
+    rng = np.random.default_rng(0)
+    print(f'{"minutes":>8}{"samples":>12}{"all (s)":>12}{"decimated (s)":>16}{"speedup":>10}')
+    for minutes in args.minutes:
+        n_samples = int(minutes * 60 * FREQUENCY)
+        data_t = np.arange(n_samples) / FREQUENCY
+        data_y = np.cumsum(rng.standard_normal(n_samples)) * 0.01
+        i_max, i_min = data_y.argmax(), data_y.argmin()
+
+        canvas.plot_signal(data_t, data_y, data_t[i_max], data_y[i_max], data_t[i_min], data_y[i_min])
+        time_decimated = best_time(canvas, args.repeat)
+
+        canvas.signal_line.set_data(data_t, data_y)
+        time_all = best_time(canvas, args.repeat)
+
+        print(f'{minutes:>8g}{n_samples:>12}{time_all:>12.4f}{time_decimated:>16.4f}'
+            f'{time_all / time_decimated:>9.1f}x')
+
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
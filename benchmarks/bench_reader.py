@@ -0,0 +1,81 @@
+"""
+Reader benchmark
+
+Compares reader.read_study with the previous pandas.read_csv loading of the
+stabilometry text files on the examples scaled up:
+
+1. Batch: every example file copied many times, as in a night's batch of
+   re-opened studies
+2. Long: one example with its signal repeated, as in a long recording
+
+Usage: python benchmarks/bench_reader.py [--copies N] [--repeat N]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import reader
+
+examples_path = Path(__file__).resolve().parent.parent / 'examples'
+
+
+def read_pandas(file_path: str) -> np.ndarray:
+    """ Previous loading of the stabilometry text files """
+    df = pd.read_csv(file_path, sep='\t', skiprows=43, encoding='ISO-8859-1')
+    return df.iloc[:, :2].to_numpy()
+
+
+def best_time(function, files: list, repeat: int) -> float:
+    """ Best time of reading all files with function """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file_path in files:
+            function(file_path)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--copies', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    examples = sorted(examples_path.glob('*.txt'))
+    for file_path in examples:
+        _, signal = reader.read_study(str(file_path))
+        assert np.array_equal(signal, read_pandas(str(file_path))), file_path
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        batch = []
+        for copy in range(args.copies):
+            for file_path in examples:
+                target = Path(temp_dir) / f'{file_path.stem}_{copy}.txt'
+                shutil.copyfile(file_path, target)
+                batch.append(str(target))
+
+        raw = examples[0].read_bytes()
+        header_end = raw.find(b'\n\n')
+        columns_end = raw.find(b'\n', header_end + 2) + 1
+        long_file = Path(temp_dir) / 'long.txt'
+        long_file.write_bytes(raw[:columns_end] + raw[columns_end:] * args.copies)
+
+        print(f'{"case":<8}{"files":>8}{"pandas (s)":>14}{"reader (s)":>14}{"speedup":>10}')
+        for case, files in (('batch', batch), ('long', [str(long_file)])):
+            time_pandas = best_time(read_pandas, files, args.repeat)
+            time_reader = best_time(reader.read_study, files, args.repeat)
+            print(f'{case:<8}{len(files):>8}{time_pandas:>14.4f}{time_reader:>14.4f}'
+                f'{time_pandas / time_reader:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
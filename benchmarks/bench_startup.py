@@ -0,0 +1,81 @@
+"""
+Startup benchmark
+
+Measures with 'python -X importtime' the import of the modules used without
+GUI (analysis, reader, cache, blobs, decimation and the rombergs command
+line) and fails if any of them pulls in the GUI or database stack, or if
+the import takes longer than the budget:
+
+1. Heavy modules: PyQt6, matplotlib, psycopg2 and scipy must not be imported
+2. Budget: cumulative import time of each module below --budget milliseconds
+
+The GUI module backend is reported for reference only.
+
+Usage: python benchmarks/bench_startup.py [--budget MS] [--repeat N]
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+root_path = Path(__file__).resolve().parent.parent
+
+HEADLESS = ('analysis', 'reader', 'cache', 'blobs', 'decimation', 'rombergs')
+HEAVY = ('PyQt6', 'matplotlib', 'psycopg2', 'scipy')
+
+
+def import_time(module: str) -> tuple:
+    """ Cumulative import time in ms of module and top level modules imported
+
+    Parameters
+    ----------
+    module: str
+        Name of the module to import in a new interpreter
+
+    Returns
+    -------
+    time: float
+        Cumulative import time of module in milliseconds
+    imported: set
+        Top level packages imported by module
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=root_path, capture_output=True, text=True, check=True)
+
+    time, imported = 0.0, set()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip().split('.')[0])
+        if name.strip() == module:
+            time = int(cumulative) / 1000
+    return time, imported
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--budget', type=float, default=500.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    print(f'{"module":<10}{"import (ms)":>14}  heavy modules')
+    for module in HEADLESS + ('backend',):
+        results = [import_time(module) for _ in range(args.repeat)]
+        time = min(result[0] for result in results)
+        heavy = sorted(set(HEAVY) & results[0][1])
+        print(f'{module:<10}{time:>14.1f}  {", ".join(heavy) or "-"}')
+
+        if module in HEADLESS and (heavy or time > args.budget):
+            failed = True
+
+    if failed:
+        print('FAILED: headless modules import the GUI stack or exceed the budget')
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Blobs
+
+This file contains the binary encoding of the signals of a study, to store
+them inside the database.
+
+Signals are compressed with zlib in one of two encodings, recorded with the
+blob so that it can be decoded:
+
+'delta_i4_1e6': samples as integers of 1e-6 units, stored as the difference
+    with the previous sample. Stabilometry exports have 6 decimals, so the
+    differences are small integers that compress to about a quarter of the
+    float64 size. Used only when the conversion back is exact.
+'f8': float64 samples, for any other signal
+
+Blobs are decoded from an iterable of compressed chunks, so a large blob can
+be read from the database by parts without holding it whole in memory.
+
+1. Encoding methods: compression and decompression of a signal
+"""
+
+import zlib
+
+import numpy as np
+
+ENCODINGS = ('delta_i4_1e6', 'f8')
+
+SCALE = 1_000_000
+
+COMPRESSION_LEVEL = 6
+
+
+# ---------
+# Funciones
+# ---------
+def _fixed_point(signal: np.ndarray):
+    """ Integer differences of a signal with 6 decimals, or None if not exact """
+    scaled = np.rint(signal * SCALE)
+    if not np.isfinite(scaled).all() or np.abs(scaled).max(initial=0) >= 2 ** 62:
+        return None
+    values = scaled.astype(np.int64)
+    if not np.array_equal(values / SCALE, signal):
+        return None
+
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, signal.shape[1]), np.int64))
+    if np.abs(deltas).max(initial=0) >= 2 ** 31:
+        return None
+    return deltas.astype('<i4')
+
+
+def encode_signal(signal: np.ndarray) -> tuple:
+    """ Compresses a signal for storage
+
+    Parameters
+    ----------
+    signal: np.ndarray
+        Samples (rows) of the signals (columns) of a study
+
+    Returns
+    -------
+    encoding: str
+        Encoding of the blob, one of ENCODINGS
+    blob: bytes
+        Compressed signal
+    """
+    signal = np.asarray(signal, dtype=np.float64).reshape(len(signal), -1)
+
+    deltas = _fixed_point(signal)
+    if deltas is not None:
+        return 'delta_i4_1e6', zlib.compress(deltas.tobytes(), COMPRESSION_LEVEL)
+    return 'f8', zlib.compress(signal.astype('<f8').tobytes(), COMPRESSION_LEVEL)
+
+
+def decode_signal(encoding: str, chunks, n_samples: int, n_columns: int) -> np.ndarray:
+    """ Decompresses a signal from the chunks of its blob
+
+    Parameters
+    ----------
+    encoding: str
+        Encoding of the blob, one of ENCODINGS
+    chunks: iterable
+        Consecutive parts (bytes) of the compressed blob
+    n_samples: int
+        Number of samples of the signal
+    n_columns: int
+        Number of signals
+
+    Returns
+    -------
+    signal: np.ndarray
+        Samples (rows) of the signals (columns), as float64
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f'unknown signal encoding: {encoding}')
+
+    dtype = np.dtype('<i4') if encoding == 'delta_i4_1e6' else np.dtype('<f8')
+    buffer = np.empty(n_samples * n_columns, dtype=dtype)
+    view = memoryview(buffer).cast('B')
+
+    # Each chunk is decompressed to bytes and copied to its place of the
+    # buffer, so only the output of one chunk is held besides the signal
+    decompressor = zlib.decompressobj()
+    offset = 0
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        view[offset:offset + len(data)] = data
+        offset += len(data)
+    data = decompressor.flush()
+    view[offset:offset + len(data)] = data
+    offset += len(data)
+
+    if offset != buffer.nbytes or not decompressor.eof:
+        raise ValueError('signal blob is truncated or does not match its size')
+
+    signal = buffer.reshape(n_samples, n_columns)
+    if encoding == 'delta_i4_1e6':
+        return np.cumsum(signal, axis=0, dtype=np.int64) / SCALE
+    return signal.astype(np.float64, copy=False)
@@ -0,0 +1,121 @@
+"""
+Cache
+
+This file contains the binary cache of parsed stabilometry studies.
+
+Each study file gets two sidecar files in the cache folder, named after the
+hash of the study path:
+
+<hash>.npy: signal array, reopened memory-mapped with np.load(mmap_mode='r')
+    when larger than MMAP_MIN_BYTES (smaller arrays are cheaper to read whole)
+<hash>.json: study path, size and modification time, and parsed header
+
+The sidecar is valid while the size and modification time of the study file
+match the ones saved in the json file, otherwise the study is parsed again
+and the sidecar overwritten.
+"""
+
+from dataclasses import asdict
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import reader
+
+cache_path = f'{sys.path[0]}/cache'
+
+MMAP_MIN_BYTES = 1 << 20
+
+
+# ---------
+# Funciones
+# ---------
+def _sidecar_paths(file_path: str, cache_dir: str) -> tuple:
+    """ Paths of the sidecar files of a study file """
+    name = hashlib.sha1(file_path.encode('utf-8')).hexdigest()
+    return Path(cache_dir) / f'{name}.npy', Path(cache_dir) / f'{name}.json'
+
+
+def _file_key(file_path: str) -> dict:
+    """ Path, size and modification time that identify a study file """
+    stat = os.stat(file_path)
+    return {'path': file_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def header_to_dict(header: reader.StudyHeader) -> dict:
+    """ Converts a study header to a JSON serializable dict """
+    return asdict(header)
+
+
+def header_from_dict(data: dict) -> reader.StudyHeader:
+    """ Converts a dict from header_to_dict back to a study header """
+    data = dict(data)
+    data['columns'] = tuple(data['columns'])
+    data['metrics'] = {key: tuple(values) for key, values in data['metrics'].items()}
+    return reader.StudyHeader(**data)
+
+
+def _write_sidecar(npy_path: Path, json_path: Path, key: dict,
+        header: reader.StudyHeader, signal: np.ndarray) -> None:
+    """ Writes the sidecar files, the json file last as commit mark """
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+
+    npy_temp = npy_path.with_suffix('.npy.tmp')
+    with open(npy_temp, 'wb') as file:
+        np.save(file, signal)
+    os.replace(npy_temp, npy_path)
+
+    json_temp = json_path.with_suffix('.json.tmp')
+    with open(json_temp, 'w', encoding='utf-8') as file:
+        json.dump({**key, 'header': header_to_dict(header)}, file)
+    os.replace(json_temp, json_path)
+
+
+def load_study(file_path: str, cache_dir: str = None) -> tuple:
+    """ Loads a stabilometry study from its binary sidecar or its text file
+
+    On a cache hit, the signal is loaded from the sidecar (memory-mapped read
+    only if large) and the header from json, without parsing the text file. On a
+    miss, the text file is parsed with reader.read_study and the sidecar is
+    written for later visits.
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the stabilometry text file
+    cache_dir: str
+        Cache folder, by default the 'cache' folder of the application
+
+    Returns
+    -------
+    header: StudyHeader
+        Typed record of the header fields
+    signal: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals
+    """
+    file_path = os.path.abspath(file_path)
+    npy_path, json_path = _sidecar_paths(file_path, cache_dir or cache_path)
+    key = _file_key(file_path)
+
+    try:
+        with open(json_path, encoding='utf-8') as file:
+            data = json.load(file)
+        if all(data[item] == value for item, value in key.items()):
+            mmap_mode = 'r' if npy_path.stat().st_size >= MMAP_MIN_BYTES else None
+            return header_from_dict(data['header']), np.load(npy_path, mmap_mode=mmap_mode)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    header, signal = reader.read_study(file_path)
+
+    try:
+        _write_sidecar(npy_path, json_path, key, header, signal)
+    except OSError:
+        # Cache folder not writable, or sidecar in use by another process
+        pass
+
+    return header, signal
@@ -5,11 +5,18 @@ This file contains class Database Dialog.
 
 To configure the database access, it requires:
 
+Engine: PostgreSQL server or SQLite file on this computer
 Host: Host IP address or 'localhost'
 Port: Port number
 Name: Database name previously created
 Username: Database access username
 Password: Database access password
+
+A SQLite database only requires its name, the path of its file relative to
+the folder of the application.
+
+Optionally, the signals of the studies are stored in the database, so that
+they remain available when the study files are moved or not reachable.
 """
 
 from PyQt6 import QtWidgets
@@ -24,6 +31,8 @@ import material3_components as mt3
 class Database(QtWidgets.QDialog):
     def __init__(self):
         """ UI Database dialog class """
+        import db
+
         super().__init__()
         # --------
         # Settings
@@ -36,11 +45,13 @@ class Database(QtWidgets.QDialog):
 
         self.database_data = None
 
+        self.engine_dict = {0: ('PostgreSQL', 'PostgreSQL'), 1: ('SQLite', 'SQLite')}
+
         # ----------------
         # Generación de UI
         # ----------------
         width = 304
-        height = 412
+        height = 500
         screen_x = int(self.screen().availableGeometry().width() / 2 - (width / 2))
         screen_y = int(self.screen().availableGeometry().height() / 2 - (height / 2))
 
@@ -64,6 +75,12 @@ class Database(QtWidgets.QDialog):
             self.theme_value, self.language_value)
         
         y, w = 48, width - 32
+        self.engine_menu = mt3.Menu(self.database_card, 'engine_menu',
+            (8, y, w), 2, 2, self.engine_dict, self.theme_value, self.language_value)
+        self.engine_menu.setCurrentIndex(db.ENGINES.index(self.settings.value('db_engine', 'postgresql')))
+        self.engine_menu.currentIndexChanged.connect(self.on_engine_menu_currentIndexChanged)
+
+        y += 44
         self.host_text = mt3.TextField(self.database_card,
             (8, y, w), ('Host', 'Host'), self.theme_value, self.language_value)
 
@@ -85,6 +102,13 @@ class Database(QtWidgets.QDialog):
             (8, y, w), ('Contraseña', 'Password'), self.theme_value, self.language_value)
         
         y += 68
+        self.storage_switch = mt3.Switch(self.database_card, 'storage_switch',
+            (8, y, w), ('Señales en la base de datos', 'Signals in the database'),
+            ('done.png', 'close.png'), self.settings.value('signal_storage', 'file') == 'database',
+            self.theme_value, self.language_value)
+        self.storage_switch.clicked.connect(self.storage_switch.set_state)
+
+        y += 44
         self.aceptar_button = mt3.TextButton(self.database_card, 'aceptar_button',
             (w-200, y, 100), ('Aceptar', 'Ok'), 'done.png', self.theme_value, self.language_value)
         self.aceptar_button.clicked.connect(self.on_aceptar_button_clicked)
@@ -93,14 +117,34 @@ class Database(QtWidgets.QDialog):
             (w-92, y, 100), ('Cancelar', 'Cancel'), 'close.png', self.theme_value, self.language_value)
         self.cancelar_button.clicked.connect(self.on_cancelar_button_clicked)
 
+        self.on_engine_menu_currentIndexChanged(self.engine_menu.currentIndex())
+
     # ---------
     # Funciones
     # ---------
+    def on_engine_menu_currentIndexChanged(self, index: int) -> None:
+        """ Enables the fields used by the selected engine """
+        import db
+
+        server = db.ENGINES[index] == 'postgresql'
+        self.host_text.setEnabled(server)
+        self.port_text.setEnabled(server)
+        self.user_text.setEnabled(server)
+        self.password_text.setEnabled(server)
+
     def on_aceptar_button_clicked(self):
         """ Save database information in settings file """
-        if (self.host_text.text_field.text() == '' or self.port_text.text_field.text() == '' or 
+        import db
+
+        engine = db.ENGINES[self.engine_menu.currentIndex()]
+        if engine == 'sqlite':
+            missing = self.name_text.text_field.text() == ''
+        else:
+            missing = (self.host_text.text_field.text() == '' or self.port_text.text_field.text() == '' or 
                 self.name_text.text_field.text() == '' or self.user_text.text_field.text() == '' or 
-                self.password_text.text_field.text() == ''):
+                self.password_text.text_field.text() == '')
+
+        if missing:
                 
             if self.language_value == 0:
                 QtWidgets.QMessageBox.critical(self, 'Error en el Formulario', 'Hace falta información de la base de datos')
@@ -108,6 +152,7 @@ class Database(QtWidgets.QDialog):
                 QtWidgets.QMessageBox.critical(self, 'Form Error', 'Database information is missing')
         else:
             self.database_data = {
+                'db_engine': engine,
                 'db_host': self.host_text.text_field.text(),
                 'db_port': self.port_text.text_field.text(),
                 'db_name': self.name_text.text_field.text(),
@@ -115,13 +160,17 @@ class Database(QtWidgets.QDialog):
                 'db_password': self.password_text.text_field.text()
             }
 
+            self.settings.setValue('db_engine', engine)
             self.settings.setValue('db_host', self.host_text.text_field.text())
             self.settings.setValue('db_port', self.port_text.text_field.text())
             self.settings.setValue('db_name', self.name_text.text_field.text())
             self.settings.setValue('db_user', self.user_text.text_field.text())
             self.settings.setValue('db_password', self.password_text.text_field.text())
+            self.settings.setValue('signal_storage',
+                'database' if self.storage_switch.isChecked() else 'file')
 
             self.settings.sync()
+            db.reset_pool()
 
             self.close()
 
@@ -0,0 +1,380 @@
+"""
+Database access
+
+This file contains the connection pool shared by the database methods of
+the backend.
+
+The database engine is chosen in settings.ini (db_engine):
+
+'postgresql': PostgreSQL server, for several workstations (default)
+'sqlite': SQLite file (db_name) on this computer, for offline and
+    single-seat use. The file is opened in WAL mode, so reads don't wait
+    for writes, and with foreign keys enforced.
+
+Both engines run the same queries: SQLite connections take the %s
+placeholders of psycopg2, and the queries that differ between engines have
+one version per engine in STATEMENTS and SQLITE_STATEMENTS.
+
+The pool is created on the first use with the database settings of
+settings.ini, keeps connections open between calls and is closed at exit.
+Connections idle for longer than VALIDATE_AFTER seconds are checked before
+being handed out, and replaced if the server dropped them.
+
+The frequent queries of STATEMENTS are prepared once per connection on
+their first use and then only executed with their parameters, so the
+server parses and plans them once per session. SQLite connections keep
+their compiled statements in the statement cache of sqlite3.
+
+1. Class Connection: connection that keeps track of its prepared statements
+2. Classes SQLiteConnection, SQLiteCursor and SQLitePool: SQLite engine
+3. Pool methods: creation, reset after a change of settings and shutdown
+4. Connection method: context manager to check out a pooled connection
+5. Prepared statement method: execution of the queries of STATEMENTS
+"""
+
+import atexit
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from analysis import METRICS, AREAS
+
+ENGINES = ('postgresql', 'sqlite')
+
+# Errors of an unreachable database, and of any database error, for both engines
+OperationalError = (psycopg2.OperationalError, sqlite3.OperationalError)
+Error = (psycopg2.Error, sqlite3.Error)
+
+POOL_MIN = 1
+POOL_MAX = 8
+
+# Seconds of inactivity after which a connection is validated on checkout
+VALIDATE_AFTER = 30.0
+
+# Columns read by the prepared statements. They are listed instead of *: a
+# prepared statement whose result columns change (e.g. a column added by a
+# migration of another workstation) fails for the rest of the session
+PACIENTES_COLUMNS = ('id, last_name, first_name, id_type, id_number, birth_date, sex, '
+    'weight, weight_unit, height, height_unit, bmi')
+ESTUDIOS_COLUMNS = 'id, id_number, file_name, file_path'
+RESULTADOS_COLUMNS = ', '.join(METRICS + AREAS)
+
+# Frequent queries prepared on each connection, name -> SQL with $n parameters
+STATEMENTS = {
+    'paciente_por_id_number': f'SELECT {PACIENTES_COLUMNS} FROM pacientes WHERE id_number = $1',
+    'estudios_por_id_number': f'SELECT {ESTUDIOS_COLUMNS} FROM estudios WHERE id_number = $1 ORDER BY id ASC',
+    'pacientes_pagina': f'SELECT {PACIENTES_COLUMNS} FROM pacientes WHERE id > $1 ORDER BY id ASC LIMIT $2',
+    'pacientes_buscar': (f'SELECT {PACIENTES_COLUMNS} FROM pacientes WHERE id > $1 AND ('
+        '(CAST(id_number AS TEXT) COLLATE "C" >= $2 AND CAST(id_number AS TEXT) COLLATE "C" < $3) OR '
+        '(lower(last_name) COLLATE "C" >= $2 AND lower(last_name) COLLATE "C" < $3) OR '
+        '(lower(first_name) COLLATE "C" >= $2 AND lower(first_name) COLLATE "C" < $3)) '
+        'ORDER BY id ASC LIMIT $4'),
+    'resultados_por_estudio': (f'SELECT {RESULTADOS_COLUMNS} FROM resultados '
+        'WHERE estudio_id = $1 AND analysis_version = $2'),
+    'senal_por_estudio': ('SELECT header, n_samples, n_columns, encoding, octet_length(signal), '
+        'substring(signal FROM 1 FOR $2) FROM senales WHERE estudio_id = $1'),
+    'senal_parte': 'SELECT substring(signal FROM $2 FOR $3) FROM senales WHERE estudio_id = $1',
+}
+
+# The same queries for SQLite, with ?n parameters and its binary collation
+SQLITE_STATEMENTS = {
+    **{name: re.sub(r'\$(\d+)', r'?\1', statement).replace(' COLLATE "C"', '')
+        for name, statement in STATEMENTS.items()},
+    'senal_por_estudio': ('SELECT header, n_samples, n_columns, encoding, length(signal), '
+        'substr(signal, 1, ?2) FROM senales WHERE estudio_id = ?1'),
+    'senal_parte': 'SELECT substr(signal, ?2, ?3) FROM senales WHERE estudio_id = ?1',
+    # SQLite reads an OR of index ranges as a scan, the union reads each index.
+    # The names are compared in the Unicode lower case of unicode_lower
+    'pacientes_buscar': (f'SELECT {PACIENTES_COLUMNS} FROM pacientes WHERE id > ?1 AND id IN ('
+        'SELECT id FROM pacientes WHERE CAST(id_number AS TEXT) >= ?2 AND CAST(id_number AS TEXT) < ?3 '
+        'UNION ALL SELECT id FROM pacientes WHERE unicode_lower(last_name) >= ?2 AND unicode_lower(last_name) < ?3 '
+        'UNION ALL SELECT id FROM pacientes WHERE unicode_lower(first_name) >= ?2 AND unicode_lower(first_name) < ?3) '
+        'ORDER BY id ASC LIMIT ?4'),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_checkouts = threading.BoundedSemaphore(POOL_MAX)
+_last_used = {}
+
+
+class Connection(extensions.connection):
+    """ Connection with the names of the statements prepared in its session """
+    dialect = 'postgresql'
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+# ------
+# SQLite
+# ------
+def _qmark(query: str) -> str:
+    """ Query with the placeholders of psycopg2 changed to the ones of sqlite3 """
+    return query.replace('%s', '?').replace('%%', '%')
+
+
+def _unicode_lower(text):
+    """ Unicode lower case, for the unicode_lower() function of SQLite """
+    return text.lower() if isinstance(text, str) else text
+
+
+class SQLiteCursor(sqlite3.Cursor):
+    """ Cursor that runs queries written with the %s placeholders of psycopg2 """
+    def execute(self, query: str, parameters=()):
+        return super().execute(_qmark(query), parameters)
+
+    def executemany(self, query: str, parameters):
+        return super().executemany(_qmark(query), parameters)
+
+
+class SQLiteConnection(sqlite3.Connection):
+    """ Connection whose cursors take the queries of the psycopg2 connections """
+    dialect = 'sqlite'
+
+    def cursor(self, factory=SQLiteCursor):
+        return super().cursor(factory)
+
+
+class SQLitePool:
+    def __init__(self, minconn: int, maxconn: int, path: str) -> None:
+        """ Pool of connections to a SQLite file
+
+        It has the methods of ThreadedConnectionPool used by this module.
+        A connection is used by one thread at a time, but not always the
+        same thread, so connections are opened with check_same_thread off.
+
+        Parameters
+        ----------
+        minconn: int
+            Number of connections opened with the pool
+        maxconn: int
+            Maximum number of idle connections kept open
+        path: str
+            Path of the SQLite file, created if it doesn't exist
+
+        Returns
+        -------
+        None
+        """
+        self.maxconn = maxconn
+        self.path = path
+        self.closed = False
+        self._idle = []
+        self._lock = threading.Lock()
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+
+    def _connect(self) -> SQLiteConnection:
+        """ Opens a connection in WAL mode and with foreign keys enforced """
+        connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False,
+            factory=SQLiteConnection)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute('PRAGMA foreign_keys = ON')
+        # lower() of SQLite only changes ASCII letters, names have accents. It
+        # is not replaced: other clients of the file would index with the built-in
+        connection.create_function('unicode_lower', 1, _unicode_lower, deterministic=True)
+        return connection
+
+    def getconn(self) -> SQLiteConnection:
+        with self._lock:
+            if self.closed:
+                raise PoolError('connection pool is closed')
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def putconn(self, connection: SQLiteConnection, close: bool = False) -> None:
+        with self._lock:
+            if not close and not self.closed and len(self._idle) < self.maxconn:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def closeall(self) -> None:
+        # Connections in use are closed by connection() when their block ends
+        with self._lock:
+            self.closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+# ---------
+# Funciones
+# ---------
+def connection_settings() -> dict:
+    """ Engine and connection parameters from the database settings of settings.ini """
+    # QtCore is imported with the first pool, importing db (e.g. from the command line) does not load Qt
+    from PyQt6.QtCore import QSettings
+
+    settings = QSettings(f'{sys.path[0]}/settings.ini', QSettings.Format.IniFormat)
+    return {
+        'engine': settings.value('db_engine', 'postgresql'),
+        'host': settings.value('db_host'),
+        'port': settings.value('db_port'),
+        'database': settings.value('db_name'),
+        'user': settings.value('db_user'),
+        'password': settings.value('db_password'),
+    }
+
+
+def sqlite_path(name: str) -> str:
+    """ Path of a SQLite file, relative to the application folder """
+    return os.path.join(sys.path[0], name or 'rombergs.db')
+
+
+def get_pool():
+    """ Connection pool, created on the first call
+
+    Returns
+    -------
+    pool: ThreadedConnectionPool or SQLitePool
+        Pool of connections to the database of the settings
+
+    Raises
+    ------
+    psycopg2.OperationalError or sqlite3.OperationalError
+        If the database of the settings is not reachable
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            parameters = connection_settings()
+            if parameters.pop('engine') == 'sqlite':
+                _pool = SQLitePool(POOL_MIN, POOL_MAX, sqlite_path(parameters['database']))
+            else:
+                _pool = ThreadedConnectionPool(POOL_MIN, POOL_MAX,
+                    connection_factory=Connection, **parameters)
+        return _pool
+
+
+def close_pool() -> None:
+    """ Closes every connection of the pool """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
+
+
+def reset_pool() -> None:
+    """ Closes the pool so that the next call connects with the new settings """
+    close_pool()
+
+
+def _is_valid(connection) -> bool:
+    """ Checks that a pooled connection is still usable """
+    if connection.dialect == 'sqlite':
+        return True
+    if connection.closed:
+        return False
+    if connection.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    # New connections have no last use and don't need the round trip
+    last_used = _last_used.get(id(connection))
+    if last_used is None or time.monotonic() - last_used < VALIDATE_AFTER:
+        return True
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connection.rollback()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+    return True
+
+
+@contextmanager
+def connection():
+    """ Pooled database connection
+
+    The connection is validated on checkout, committed when the block ends
+    normally, rolled back when it raises, and returned to the pool. With
+    POOL_MAX connections checked out, the checkout waits for one of them,
+    so a block must not check out a second connection.
+
+    Yields
+    ------
+    connection: psycopg2.extensions.connection
+        Open connection to the database of the settings
+    """
+    pool = get_pool()
+
+    # ThreadedConnectionPool raises PoolError beyond POOL_MAX connections in
+    # use: threads beyond it wait here for a connection to be returned
+    with _checkouts:
+        # A pool can hold several dropped connections after a server restart
+        for _ in range(POOL_MAX + 1):
+            conn = pool.getconn()
+            if _is_valid(conn):
+                break
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        else:
+            raise psycopg2.OperationalError('no usable connection to the database')
+
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Error:
+                # The error of the block is more useful than the one of the rollback
+                pass
+            raise
+        finally:
+            broken = conn.dialect == 'postgresql' and (conn.closed or
+                conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN)
+            if broken:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            if pool.closed:
+                # Pool closed meanwhile (e.g. by reset_pool), only its idle connections were closed
+                conn.close()
+            else:
+                pool.putconn(conn, close=broken)
+
+
+def execute_prepared(cursor, name: str, params: tuple = ()) -> None:
+    """ Executes a statement of STATEMENTS, preparing it on first use
+
+    Parameters
+    ----------
+    cursor: psycopg2.extensions.cursor
+        Cursor of a pooled connection
+    name: str
+        Name of the statement in STATEMENTS
+    params: tuple
+        Values of the $n parameters of the statement
+    """
+    if cursor.connection.dialect == 'sqlite':
+        cursor.execute(SQLITE_STATEMENTS[name], params)
+        return
+
+    prepared = cursor.connection.prepared
+    if name not in prepared:
+        # PREPARE is not undone by a rollback, the statement lasts the session
+        cursor.execute(f'PREPARE {name} AS {STATEMENTS[name]}')
+        prepared.add(name)
+
+    if params:
+        cursor.execute(f'EXECUTE {name} ({", ".join(["%s"] * len(params))})', params)
+    else:
+        cursor.execute(f'EXECUTE {name}')
+
+
+atexit.register(close_pool)
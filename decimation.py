@@ -0,0 +1,145 @@
+"""
+Decimation
+
+This file contains the level of detail of the line plots of long signals.
+
+A line plot can't show more than one vertical stroke per column of pixels.
+The samples in view are split in as many bins as columns of pixels of the
+plot, and only the minimum and the maximum of each bin are drawn, in their
+order in time. The envelope drawn is the same as with every sample, with
+the extrema of the signal included, but the number of vertices is set by
+the width of the plot instead of the length of the recording.
+
+For long recordings, a pyramid of min/max levels of the signal is built
+once per study. The bins of a range in view are then computed from the
+coarsest level with enough detail for the width of the plot, so zooming
+and panning cost the same at any length of the recording.
+
+1. Decimation methods: range in view, min/max pyramid and min/max decimation
+   of a signal
+"""
+
+import numpy as np
+
+# Bins of a level of the pyramid per bin of the next one
+PYRAMID_FACTOR = 8
+
+# Signals shorter than this are decimated from their samples, without pyramid
+PYRAMID_MIN_SAMPLES = 4096
+
+
+# ---------
+# Funciones
+# ---------
+def visible_range(data_t: np.ndarray, t_start: float, t_end: float) -> tuple:
+    """ Samples between two times, with one more sample at each side
+
+    Parameters
+    ----------
+    data_t: np.ndarray
+        Times of the samples, in ascending order
+    t_start, t_end: float
+        Limits of the time axis in view
+
+    Returns
+    -------
+    start, stop: int
+        Range of the samples in view, so the line reaches the borders
+    """
+    start = max(int(np.searchsorted(data_t, t_start, side='left')) - 1, 0)
+    stop = min(int(np.searchsorted(data_t, t_end, side='right')) + 1, len(data_t))
+    return start, stop
+
+
+def _minmax_positions(values: np.ndarray, size: int) -> np.ndarray:
+    """ Positions of the minimum and maximum of each bin of size values, in order """
+    n_full = len(values) // size
+    bins = values[:n_full * size].reshape(n_full, size)
+    offsets = np.arange(n_full) * size
+    i_min = offsets + bins.argmin(axis=1)
+    i_max = offsets + bins.argmax(axis=1)
+
+    parts = [np.column_stack((np.minimum(i_min, i_max), np.maximum(i_min, i_max))).ravel()]
+    if n_full * size < len(values):
+        tail = values[n_full * size:]
+        parts.append(np.sort([n_full * size + tail.argmin(), n_full * size + tail.argmax()]))
+    return np.concatenate(parts).astype(np.intp)
+
+
+def build_pyramid(data_y: np.ndarray) -> list:
+    """ Min/max pyramid of a signal, for the decimation of any range in view
+
+    Each level keeps the minimum and maximum of bins of PYRAMID_FACTOR
+    times the samples of the bins of the level below, the first level
+    bins of PYRAMID_FACTOR samples, and is built from the level below in
+    a time proportional to its size.
+
+    Parameters
+    ----------
+    data_y: np.ndarray
+        Values of the samples
+
+    Returns
+    -------
+    pyramid: list
+        Sample indices kept by each level, in ascending order, from the
+        finest level. Empty for signals of less than PYRAMID_MIN_SAMPLES
+    """
+    data_y = np.asarray(data_y)
+    if len(data_y) < PYRAMID_MIN_SAMPLES:
+        return []
+
+    pyramid = [_minmax_positions(data_y, PYRAMID_FACTOR)]
+    while len(pyramid[-1]) >= PYRAMID_MIN_SAMPLES:
+        # A bin of the next level is PYRAMID_FACTOR bins, two points each, of this one
+        level = pyramid[-1]
+        pyramid.append(level[_minmax_positions(data_y[level], 2 * PYRAMID_FACTOR)])
+    return pyramid
+
+
+def minmax(data_t: np.ndarray, data_y: np.ndarray, start: int, stop: int, n_bins: int,
+        pyramid: list = None) -> tuple:
+    """ Minimum and maximum of each bin of a range of samples
+
+    With a pyramid, the bins are taken from the coarsest level with more
+    than two points per bin, so the time doesn't depend on the length of
+    the range. Bins at the borders of the range are not split across
+    levels: the envelope can miss part of a bin of that level at each end.
+
+    Parameters
+    ----------
+    data_t: np.ndarray
+        Times of the samples, in ascending order
+    data_y: np.ndarray
+        Values of the samples
+    start, stop: int
+        Range of the samples to decimate
+    n_bins: int
+        Number of bins, usually the width of the plot in pixels
+    pyramid: list
+        Levels of build_pyramid of data_y, or None to read every sample
+
+    Returns
+    -------
+    data_t, data_y: np.ndarray
+        Samples kept, in order: the first and last of the range and the
+        minimum and maximum of every bin. The range itself if it has no
+        more than two samples per bin
+    """
+    n_bins = max(n_bins, 1)
+    if stop - start <= 2 * n_bins:
+        return data_t[start:stop], data_y[start:stop]
+
+    for level in reversed(pyramid or []):
+        low, high = np.searchsorted(level, (start, stop))
+        if high - low > 2 * n_bins:
+            candidates = level[low:high]
+            size = -(-len(candidates) // n_bins)
+            kept = candidates[_minmax_positions(data_y[candidates], size)]
+            break
+    else:
+        size = -(-(stop - start) // n_bins)
+        kept = start + _minmax_positions(data_y[start:stop], size)
+
+    indices = np.concatenate(([start], kept, [stop - 1])).astype(np.intp)
+    return data_t[indices], data_y[indices]
@@ -0,0 +1,165 @@
+"""
+Exporter
+
+This file contains the export of the registry for analysis in other tools:
+one row per study, with its patient and the results of the current version
+of the analysis, to a CSV file or to a Parquet file (requires pyarrow).
+Patients without studies are exported with empty study columns, and studies
+not analyzed with the current version with empty results.
+
+Rows are read through a server-side (named) cursor in batches of a fixed
+size and written as they arrive, so the memory used by an export doesn't
+grow with the size of the registry. SQLite cursors already step through
+the rows of a query as they are fetched.
+
+1. Database methods: streaming query of the registry
+2. Output methods: CSV and Parquet writers by batches
+3. Export method: export of the registry, with counts and times
+"""
+
+import csv
+import time
+
+import db
+import migrations
+from analysis import ANALYSIS_VERSION, METRICS, AREAS
+
+PATIENT_COLUMNS = ('id_number', 'last_name', 'first_name', 'id_type', 'birth_date', 'sex',
+    'weight', 'weight_unit', 'height', 'height_unit', 'bmi')
+STUDY_COLUMNS = ('file_name', 'file_path')
+COLUMNS = PATIENT_COLUMNS + STUDY_COLUMNS + METRICS + AREAS
+
+# Numeric columns of pacientes, read as floats instead of decimals
+DECIMAL_COLUMNS = ('weight', 'height', 'bmi')
+
+BATCH_SIZE = 5000
+
+
+# ------------------------
+# Métodos de Base de Datos
+# ------------------------
+def _registry_query() -> str:
+    """ Query of the rows of the export, in the order of COLUMNS """
+    patient = ', '.join(f'CAST(p.{column} AS DOUBLE PRECISION)' if column in DECIMAL_COLUMNS
+        else f'p.{column}' for column in PATIENT_COLUMNS)
+    study = ', '.join(f'e.{column}' for column in STUDY_COLUMNS)
+    results = ', '.join(f'r.{column}' for column in METRICS + AREAS)
+    return f"""SELECT {patient}, {study}, {results} FROM pacientes p
+                    LEFT JOIN estudios e ON e.id_number = p.id_number
+                    LEFT JOIN resultados r ON r.estudio_id = e.id AND r.analysis_version = %s
+                    ORDER BY p.id, e.id"""
+
+
+def read_registry(connection, batch_size: int = BATCH_SIZE):
+    """ Rows of the export, by batches
+
+    Parameters
+    ----------
+    connection: connection
+        Pooled connection, the rows are read in its transaction
+    batch_size: int
+        Number of rows fetched from the database at a time
+
+    Yields
+    ------
+    rows: list
+        Tuples of values in the order of COLUMNS, at most batch_size
+    """
+    if connection.dialect == 'sqlite':
+        cursor = connection.cursor()
+    else:
+        # Named cursor: the result stays on the server and is fetched by parts
+        cursor = connection.cursor(name='exportacion')
+        cursor.itersize = batch_size
+    try:
+        cursor.execute(_registry_query(), (ANALYSIS_VERSION,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+# -----------------
+# Métodos de Salida
+# -----------------
+class CSVWriter:
+    def __init__(self, out_path: str) -> None:
+        """ CSV file written by batches of rows """
+        self.file = open(out_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows: list) -> None:
+        self.writer.writerows(rows)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, out_path: str) -> None:
+        """ Parquet file written by batches of rows, one row group per batch """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Parquet output requires pyarrow, use a .csv output instead')
+
+        types = {'id_number': pa.int64(), **{column: pa.float64()
+            for column in DECIMAL_COLUMNS + METRICS + AREAS}}
+        self.pa = pa
+        self.schema = pa.schema([(column, types.get(column, pa.string())) for column in COLUMNS])
+        self.writer = pq.ParquetWriter(out_path, self.schema)
+
+    def write(self, rows: list) -> None:
+        columns = list(zip(*rows))
+        self.writer.write_batch(self.pa.record_batch(
+            [self.pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def open_writer(out_path: str):
+    """ Writer of the format given by the file extension """
+    if out_path.lower().endswith('.parquet'):
+        return ParquetWriter(out_path)
+    return CSVWriter(out_path)
+
+
+# ---------------------
+# Método de Exportación
+# ---------------------
+def export_registry(out_path: str, batch_size: int = BATCH_SIZE) -> dict:
+    """ Writes the patients, studies and results of the database to a file
+
+    Parameters
+    ----------
+    out_path: str
+        Output file, .parquet or .csv
+    batch_size: int
+        Number of rows read and written at a time
+
+    Returns
+    -------
+    report: dict
+        written rows and seconds
+    """
+    start_time = time.perf_counter()
+    migrations.migrate()
+
+    writer = open_writer(out_path)
+    written = 0
+    try:
+        with db.connection() as connection:
+            for rows in read_registry(connection, batch_size):
+                writer.write(rows)
+                written += len(rows)
+    finally:
+        writer.close()
+
+    return {'written': written, 'seconds': time.perf_counter() - start_time}
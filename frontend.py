@@ -9,13 +9,14 @@ from PyQt6.QtWidgets import QWidget, QApplication
 from PyQt6.QtCore import QSettings
 
 import sys
-import pandas as pd
 from pathlib import Path
 
 import material3_components as mt3
 import backend
 import patient
 import database
+import models
+import workers
 
 
 class App(QWidget):
@@ -36,18 +37,14 @@ class App(QWidget):
         # Variables
         # ---------
         self.patient_data = None
-        self.data_lat_max = 0.0
-        self.data_lat_t_max = 0.0
-        self.data_lat_min = 0.0
-        self.data_lat_t_min = 0.0
-        self.data_ap_max = 0.0
-        self.data_ap_t_max = 0.0
-        self.data_ap_min = 0.0
-        self.data_ap_t_min = 0.0
-        self.lat_text_1 = None
-        self.lat_text_2 = None
-        self.ap_text_1 = None
-        self.ap_text_2 = None
+
+        # Database and analysis jobs, run outside of the GUI thread
+        self.jobs = workers.JobQueue(self)
+
+        # Patients of the registry, loaded by pages as the menu is scrolled
+        self.pacientes_model = models.PatientModel(self.jobs, backend.get_patients_page,
+            backend.PATIENTS_PAGE, self)
+        self.pacientes_model.failed.connect(self.on_job_failed)
 
         # ----------------
         # Generación de UI
@@ -118,8 +115,31 @@ class App(QWidget):
         y_1 = 48
         self.pacientes_menu = mt3.Menu(self.paciente_card, 'pacientes_menu',
             (8, y_1, 164), 10, 10, {}, self.theme_value, self.language_value)
+        self.pacientes_menu.setMaxCount(2 ** 31 - 1)
+        self.pacientes_menu.setModel(self.pacientes_model)
         self.pacientes_menu.textActivated.connect(self.on_pacientes_menu_textActivated)
 
+        # Text of the menu to search patients by id number or names
+        self.pacientes_menu.setEditable(True)
+        self.pacientes_menu.setInsertPolicy(QtWidgets.QComboBox.InsertPolicy.NoInsert)
+        self.pacientes_menu.setCompleter(None)
+        self.pacientes_menu.lineEdit().setStyleSheet('background-color: transparent; border: 0px')
+        self.pacientes_menu.lineEdit().textEdited.connect(self.on_pacientes_menu_textEdited)
+        # With a placeholder, the menu doesn't select the first patient of the
+        # rows loaded into it while empty, which would replace the search text
+        if self.language_value == 0:
+            self.pacientes_menu.setPlaceholderText('Buscar')
+            self.pacientes_menu.lineEdit().setPlaceholderText('Buscar')
+        elif self.language_value == 1:
+            self.pacientes_menu.setPlaceholderText('Search')
+            self.pacientes_menu.lineEdit().setPlaceholderText('Search')
+
+        # The search waits for a pause in the typing
+        self.search_timer = QtCore.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.on_search_timer_timeout)
+
         y_1 += 40
         self.paciente_add_button = mt3.IconButton(self.paciente_card, 'paciente_add_button',
             (60, y_1), 'person_add.png', self.theme_value)
@@ -224,6 +244,11 @@ class App(QWidget):
             self.theme_value, self.language_value)
         self.antePost_plot = backend.MPLCanvas(self.antePost_plot_card, self.theme_value)
 
+        self.zoom_tooltip = {0: 'Rueda: zoom, arrastrar: desplazar, doble clic: ver todo',
+            1: 'Wheel: zoom, drag: pan, double click: show all'}
+        self.lateral_plot.setToolTip(self.zoom_tooltip[self.language_value])
+        self.antePost_plot.setToolTip(self.zoom_tooltip[self.language_value])
+
         self.elipse_plot_card = mt3.Card(self, 'elipse_plot_card',
             (188, 520, 300, 300), ('Elipse', 'Ellipse'), self.theme_value, self.language_value)
         self.elipse_plot = backend.MPLCanvas(self.elipse_plot_card, self.theme_value)
@@ -352,11 +377,8 @@ class App(QWidget):
         # Base de Datos
         # -------------
         try:
-            self.patientes_list = backend.create_db('pacientes')
+            self.pacientes_model.set_rows(backend.create_db('pacientes'))
             self.estudios_list = backend.create_db('estudios')
-
-            for data in self.patientes_list:
-                self.pacientes_menu.addItem(str(data[4]))
             self.pacientes_menu.setCurrentIndex(-1)
         except:
             self.pacientes_menu.setEnabled(False)
@@ -387,11 +409,19 @@ class App(QWidget):
         self.idioma_menu.language_text(index)
         
         self.paciente_card.language_text(index)
+        if index == 0:
+            self.pacientes_menu.setPlaceholderText('Buscar')
+            self.pacientes_menu.lineEdit().setPlaceholderText('Buscar')
+        elif index == 1:
+            self.pacientes_menu.setPlaceholderText('Search')
+            self.pacientes_menu.lineEdit().setPlaceholderText('Search')
         self.analisis_card.language_text(index)
         self.info_card.language_text(index)
 
         self.lateral_plot_card.language_text(index)
+        self.lateral_plot.setToolTip(self.zoom_tooltip[index])
         self.antePost_plot_card.language_text(index)
+        self.antePost_plot.setToolTip(self.zoom_tooltip[index])
         self.elipse_plot_card.language_text(index)
         self.hull_plot_card.language_text(index)
         self.pca_plot_card.language_text(index)
@@ -484,34 +514,12 @@ class App(QWidget):
         self.hull_plot_card.apply_styleSheet(state)
         self.pca_plot_card.apply_styleSheet(state)
 
-        self.lateral_plot.apply_styleSheet(state)
-        if self.lat_text_1:
-            self.lat_text_1.remove()
-            self.lat_text_2.remove()
-            if state:
-                self.lat_text_1 = self.lateral_plot.axes.text(self.data_lat_t_max, self.data_lat_max, f'{self.data_lat_max:.2f}', color='#000000')
-                self.lat_text_2 = self.lateral_plot.axes.text(self.data_lat_t_min, self.data_lat_min, f'{self.data_lat_min:.2f}', color='#000000')
-            else:
-                self.lat_text_1 = self.lateral_plot.axes.text(self.data_lat_t_max, self.data_lat_max, f'{self.data_lat_max:.2f}', color='#E5E9F0')
-                self.lat_text_2 = self.lateral_plot.axes.text(self.data_lat_t_min, self.data_lat_min, f'{self.data_lat_min:.2f}', color='#E5E9F0')
-        self.lateral_plot.draw()
-        self.antePost_plot.apply_styleSheet(state)
-        if self.ap_text_1:
-            self.ap_text_1.remove()
-            self.ap_text_2.remove()
-            if state:
-                self.ap_text_1 = self.antePost_plot.axes.text(self.data_ap_t_max, self.data_ap_max, f'{self.data_ap_max:.2f}', color='#000000')
-                self.ap_text_2 = self.antePost_plot.axes.text(self.data_ap_t_min, self.data_ap_min, f'{self.data_ap_min:.2f}', color='#000000')
-            else:
-                self.ap_text_1 = self.antePost_plot.axes.text(self.data_ap_t_max, self.data_ap_max, f'{self.data_ap_max:.2f}', color='#E5E9F0')
-                self.ap_text_2 = self.antePost_plot.axes.text(self.data_ap_t_min, self.data_ap_min, f'{self.data_ap_min:.2f}', color='#E5E9F0')
-        self.antePost_plot.draw()
-        self.elipse_plot.apply_styleSheet(state)
-        self.elipse_plot.draw()
-        self.hull_plot.apply_styleSheet(state)
-        self.hull_plot.draw()
-        self.pca_plot.apply_styleSheet(state)
-        self.pca_plot.draw()
+        # The colours of the plots change in place, and the plots are redrawn
+        # together once the event loop is idle
+        palette = backend.light if state else backend.dark
+        for plot in (self.lateral_plot, self.antePost_plot, self.elipse_plot, self.hull_plot, self.pca_plot):
+            plot.set_palette(palette)
+            plot.draw_idle()
 
         self.lateral_card.apply_styleSheet(state)
         self.lat_rango_label.apply_styleSheet(state)
@@ -555,11 +563,8 @@ class App(QWidget):
         self.db_info.exec()
         
         if self.db_info.database_data:
-            self.patientes_list = backend.create_db('pacientes')
+            self.pacientes_model.set_rows(backend.create_db('pacientes'))
             self.estudios_list = backend.create_db('estudios')
-
-            for data in self.patientes_list:
-                self.pacientes_menu.addItem(str(data[4]))
             self.pacientes_menu.setCurrentIndex(-1)
 
             self.pacientes_menu.setEnabled(True)
@@ -635,15 +640,82 @@ class App(QWidget):
 
         return super().resizeEvent(a0)
 
+    def closeEvent(self, a0: QtGui.QCloseEvent) -> None:
+        """ Close event, with the queued jobs cancelled and the running ones waited for a while """
+        self.jobs.shutdown(backend.SHUTDOWN_WAIT)
+        backend.close_db()
+        return super().closeEvent(a0)
+
     # ------------------
     # Funciones Paciente
     # ------------------
+    def current_patient(self) -> tuple:
+        """ Row of the patient selected in the menu, None if the text is a search """
+        row = self.pacientes_model.row(self.pacientes_menu.currentIndex())
+        if row is None or str(row[4]) != self.pacientes_menu.currentText():
+            return None
+        return row
+
+    @staticmethod
+    def row_index(rows: list, id_db: int) -> int:
+        """ Position of the row with database id id_db in a list of table rows """
+        return next(index for index, row in enumerate(rows) if row[0] == id_db)
+
+    def on_job_failed(self, err: Exception) -> None:
+        """ Error of a background database or analysis job """
+        if self.language_value == 0:
+            QtWidgets.QMessageBox.critical(self, 'Error de Base de Datos', f'La operación no se completó:\n{err}')
+        elif self.language_value == 1:
+            QtWidgets.QMessageBox.critical(self, 'Database Error', f'The operation was not completed:\n{err}')
+
+    def clear_patient(self) -> None:
+        """ Clear the information of the current patient """
+        self.patient_data = None
+        self.analisis_add_button.setEnabled(False)
+        self.analisis_del_button.setEnabled(False)
+        self.analisis_menu.setEnabled(False)
+
+        self.apellido_value.setText('')
+        self.nombre_value.setText('')
+        self.id_value.setText('')
+        self.fecha_value.setText('')
+        self.sex_value.setText('')
+        self.sex_label.set_icon('', self.theme_value)
+        self.peso_value.setText('')
+        self.altura_value.setText('')
+        self.bmi_value.setText('')
+
+    def clear_analysis(self) -> None:
+        """ Clear plots and results of the current study """
+        self.lateral_plot.clear()
+        self.antePost_plot.clear()
+        self.elipse_plot.clear()
+        self.hull_plot.clear()
+        self.pca_plot.clear()
+
+        self.lat_rango_value.setText('')
+        self.lat_vel_value.setText('')
+        self.lat_rms_value.setText('')
+        self.ap_rango_value.setText('')
+        self.ap_vel_value.setText('')
+        self.ap_rms_value.setText('')
+        self.cop_vel_value.setText('')
+        self.distancia_value.setText('')
+        self.frecuencia_value.setText('')
+        self.elipse_value.setText('')
+        self.hull_value.setText('')
+        self.pca_value.setText('')
+
     def on_paciente_add_button_clicked(self) -> None:
         """ Add patient button to the database """
         self.patient_window = patient.Patient()
         self.patient_window.exec()
         
         if self.patient_window.patient_data:
+            # The new patient replaces the patient and study being loaded
+            self.jobs.cancel('paciente')
+            self.jobs.cancel('estudio')
+
             if self.patient_window.patient_data['sex'] == 'F':
                 self.sex_label.set_icon('woman', self.theme_value)
             elif self.patient_window.patient_data['sex'] == 'M':
@@ -661,34 +733,43 @@ class App(QWidget):
             # -------------
             # Base de datos
             # -------------
-            self.patientes_list = backend.add_db('pacientes', self.patient_window.patient_data)
-            
-            self.pacientes_menu.clear()
-            for data in self.patientes_list:
-                self.pacientes_menu.addItem(str(data[4]))
-            self.pacientes_menu.setCurrentIndex(len(self.patientes_list)-1)
-
-            self.analisis_add_button.setEnabled(True)
-            self.analisis_del_button.setEnabled(True)
-            self.analisis_menu.setEnabled(True)
-
-            if self.language_value == 0:
-                QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Paciente agregado a la base de datos')
-            elif self.language_value == 1:
-                QtWidgets.QMessageBox.information(self, 'Data Saved', 'Patient added to database')
+            self.jobs.submit(backend.add_db, 'pacientes', self.patient_window.patient_data,
+                on_result=self.on_paciente_added, on_error=self.on_job_failed)
         else:
             if self.language_value == 0:
                 QtWidgets.QMessageBox.critical(self, 'Error de Datos', 'No se dio información de un paciente nuevo')
             elif self.language_value == 1:
                 QtWidgets.QMessageBox.critical(self, 'Data Error', 'No information on a new patient was given')
 
+    def on_paciente_added(self, added_rows: list) -> None:
+        """ Patient added to the database by a background job """
+        self.pacientes_model.append_rows(added_rows)
+        for data in added_rows:
+            self.patient_data = data
+            self.pacientes_menu.setCurrentIndex(self.pacientes_model.index_of(data[0]))
+
+        # A new patient has no studies
+        self.estudios_list = []
+        self.analisis_menu.clear()
+        self.clear_analysis()
+
+        self.analisis_add_button.setEnabled(True)
+        self.analisis_del_button.setEnabled(True)
+        self.analisis_menu.setEnabled(True)
+
+        if self.language_value == 0:
+            QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Paciente agregado a la base de datos')
+        elif self.language_value == 1:
+            QtWidgets.QMessageBox.information(self, 'Data Saved', 'Patient added to database')
+
 
     def on_paciente_edit_button_clicked(self) -> None:
         """ Edit patient button in the database """
-        patient_id = self.pacientes_menu.currentText()
+        patient_row = self.current_patient()
 
-        if patient_id != '':
-            patient_data = backend.get_db('pacientes', patient_id)
+        if patient_row is not None:
+            # Row of the menu, already in memory, instead of a database query
+            patient_data = [patient_row]
 
             id_db = patient_data[0][0]
             self.patient_window = patient.Patient()
@@ -719,31 +800,14 @@ class App(QWidget):
             self.patient_window.exec()
 
             if self.patient_window.patient_data:
-                self.patientes_list = backend.edit_db('pacientes', id_db, self.patient_window.patient_data)
+                self.jobs.cancel('paciente')
+                self.jobs.cancel('estudio')
 
-                self.pacientes_menu.clear()
-                for data in self.patientes_list:
-                    self.pacientes_menu.addItem(str(data[4]))
                 self.pacientes_menu.setCurrentIndex(-1)
+                self.clear_patient()
 
-                self.analisis_add_button.setEnabled(False)
-                self.analisis_del_button.setEnabled(False)
-                self.analisis_menu.setEnabled(False)
-
-                self.apellido_value.setText('')
-                self.nombre_value.setText('')
-                self.id_value.setText('')
-                self.fecha_value.setText('')
-                self.sex_value.setText('')
-                self.sex_label.set_icon('', self.theme_value)
-                self.peso_value.setText('')
-                self.altura_value.setText('')
-                self.bmi_value.setText('')
-
-                if self.language_value == 0:
-                    QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Paciente editado en la base de datos')
-                elif self.language_value == 1:
-                    QtWidgets.QMessageBox.information(self, 'Data Saved', 'Patient edited in database')
+                self.jobs.submit(backend.edit_db, 'pacientes', id_db, self.patient_window.patient_data,
+                    on_result=self.on_paciente_edited, on_error=self.on_job_failed)
             else:
                 if self.language_value == 0:
                     QtWidgets.QMessageBox.critical(self, 'Error de Datos', 'No se dio información del paciente')
@@ -755,47 +819,53 @@ class App(QWidget):
             elif self.language_value == 1:
                 QtWidgets.QMessageBox.critical(self, 'Patient Error', 'No patient selected')
 
+    def on_paciente_edited(self, edited_rows: list) -> None:
+        """ Patient edited in the database by a background job """
+        self.pacientes_model.update_rows(edited_rows)
+        self.pacientes_menu.setCurrentIndex(-1)
+
+        if self.language_value == 0:
+            QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Paciente editado en la base de datos')
+        elif self.language_value == 1:
+            QtWidgets.QMessageBox.information(self, 'Data Saved', 'Patient edited in database')
+
 
     def on_paciente_del_button_clicked(self) -> None:
         """ Delete patient button from the database """
-        patient_id = self.pacientes_menu.currentText()
+        patient_row = self.current_patient()
 
-        if patient_id != '':
-            self.patientes_list = backend.delete_db('pacientes', patient_id)
+        if patient_row is not None:
+            self.jobs.cancel('paciente')
+            self.jobs.cancel('estudio')
 
-            self.pacientes_menu.clear()
-            for data in self.patientes_list:
-                self.pacientes_menu.addItem(str(data[4]))
             self.pacientes_menu.setCurrentIndex(-1)
+            self.clear_patient()
 
-            self.analisis_add_button.setEnabled(False)
-            self.analisis_del_button.setEnabled(False)
-            self.analisis_menu.setEnabled(False)
-
-            self.apellido_value.setText('')
-            self.nombre_value.setText('')
-            self.id_value.setText('')
-            self.fecha_value.setText('')
-            self.sex_value.setText('')
-            self.sex_label.set_icon('', self.theme_value)
-            self.peso_value.setText('')
-            self.altura_value.setText('')
-            self.bmi_value.setText('')
-
-            if self.language_value == 0:
-                QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Paciente eliminado de la base de datos')
-            elif self.language_value == 1:
-                QtWidgets.QMessageBox.information(self, 'Data Saved', 'Patient deleted from database')
+            self.jobs.submit(backend.delete_db, 'pacientes', patient_row[4],
+                on_result=self.on_paciente_deleted, on_error=self.on_job_failed)
         else:
             if self.language_value == 0:
                 QtWidgets.QMessageBox.critical(self, 'Error de Paciente', 'No se seleccionó un paciente')
             elif self.language_value == 1:
                 QtWidgets.QMessageBox.critical(self, 'Patient Error', 'No patient selected')
 
+    def on_paciente_deleted(self, deleted_rows: list) -> None:
+        """ Patient deleted from the database by a background job """
+        self.pacientes_model.remove_rows(deleted_rows)
+        self.pacientes_menu.setCurrentIndex(-1)
+
+        if self.language_value == 0:
+            QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Paciente eliminado de la base de datos')
+        elif self.language_value == 1:
+            QtWidgets.QMessageBox.information(self, 'Data Saved', 'Patient deleted from database')
+
 
     def on_pacientes_menu_textActivated(self, current_pacient: str) -> None:
         """ Change active patient and present previously saved studies and information
         
+        The patient and its studies are loaded by a background job, which
+        replaces the job of a patient selected before.
+
         Parameters
         ----------
         current_pacient: str
@@ -805,7 +875,39 @@ class App(QWidget):
         -------
         None
         """
-        patient_data = backend.get_db('pacientes', current_pacient)
+        if self.current_patient() is None:
+            # Enter on a search text that is not a patient of the menu
+            return
+
+        self.jobs.cancel('estudio')
+
+        self.analisis_add_button.setEnabled(False)
+        self.analisis_del_button.setEnabled(False)
+        self.analisis_menu.setEnabled(False)
+        self.analisis_menu.clear()
+        self.clear_analysis()
+
+        self.jobs.submit(backend.get_patient_db, current_pacient, channel='paciente',
+            on_result=self.on_paciente_loaded, on_error=self.on_job_failed)
+
+    def on_paciente_loaded(self, data: tuple) -> None:
+        """ Present the patient and studies loaded by a background job """
+        patient_data, self.estudios_list = data
+        if not patient_data:
+            # Deleted from another workstation after the menu was loaded
+            patient_row = self.current_patient()
+            if patient_row is not None:
+                self.pacientes_model.remove_rows([patient_row])
+            self.pacientes_menu.setCurrentIndex(-1)
+            self.clear_patient()
+
+            if self.language_value == 0:
+                QtWidgets.QMessageBox.critical(self, 'Error de Paciente', 'El paciente ya no está en la base de datos')
+            elif self.language_value == 1:
+                QtWidgets.QMessageBox.critical(self, 'Patient Error', 'The patient is no longer in the database')
+            return
+
+        self.patient_data = patient_data[0]
 
         if patient_data[0][6] == 'F':
             self.sex_label.set_icon('woman', self.theme_value)
@@ -825,35 +927,25 @@ class App(QWidget):
         self.analisis_del_button.setEnabled(True)
         self.analisis_menu.setEnabled(True)
 
-        self.estudios_list = backend.get_db('estudios', current_pacient)
         self.analisis_menu.clear()
         for data in self.estudios_list:
             self.analisis_menu.addItem(str(data[2]))
         self.analisis_menu.setCurrentIndex(-1)
 
-        self.lateral_plot.axes.cla()
-        self.lateral_plot.draw()
-        self.antePost_plot.axes.cla()
-        self.antePost_plot.draw()
-        self.elipse_plot.axes.cla()
-        self.elipse_plot.draw()
-        self.hull_plot.axes.cla()
-        self.hull_plot.draw()
-        self.pca_plot.axes.cla()
-        self.pca_plot.draw()
 
-        self.lat_rango_value.setText('')
-        self.lat_vel_value.setText('')
-        self.lat_rms_value.setText('')
-        self.ap_rango_value.setText('')
-        self.ap_vel_value.setText('')
-        self.ap_rms_value.setText('')
-        self.cop_vel_value.setText('')
-        self.distancia_value.setText('')
-        self.frecuencia_value.setText('')
-        self.elipse_value.setText('')
-        self.hull_value.setText('')
-        self.pca_value.setText('')
+    def on_pacientes_menu_textEdited(self, text: str) -> None:
+        """ Search text of the patient menu, searched after a pause in the typing """
+        self.search_timer.start()
+
+    def on_search_timer_timeout(self) -> None:
+        """ Load the first page of the patients matching the search text """
+        # The reset of the model clears the text of the menu, it's put back as typed
+        line_edit = self.pacientes_menu.lineEdit()
+        text, cursor = line_edit.text(), line_edit.cursorPosition()
+        self.pacientes_model.set_search(text)
+        if line_edit.text() != text:
+            line_edit.setText(text)
+            line_edit.setCursorPosition(cursor)
 
     
     # -----------------
@@ -868,174 +960,111 @@ class App(QWidget):
         if selected_file:
             self.default_path = self.settings.setValue('default_path', str(Path(selected_file).parent))
 
-            df = pd.read_csv(selected_file, sep='\t', skiprows=43, encoding='ISO-8859-1')
-
-            results = backend.analisis(df)
-            
-            # ----------------
-            # Gráficas Señales
-            # ----------------
-            data_lat = results['data_x']
-            data_ap = results['data_y']
-            data_t = results['data_t']
-
-            self.data_lat_max = results['lat_max']
-            self.data_lat_t_max = results['lat_t_max']
-            self.data_lat_min = results['lat_min']
-            self.data_lat_t_min = results['lat_t_min']
-
-            self.lateral_plot.axes.cla()
-            self.lateral_plot.fig.subplots_adjust(left=0.05, bottom=0.15, right=1, top=0.95, wspace=0, hspace=0)
-            self.lateral_plot.axes.plot(data_t, data_lat, '#42A4F5')
-            self.lateral_plot.axes.plot(self.data_lat_t_max, self.data_lat_max, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-            self.lateral_plot.axes.plot(self.data_lat_t_min, self.data_lat_min, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-            if self.theme_value:
-                self.lat_text_1 = self.lateral_plot.axes.text(self.data_lat_t_max, self.data_lat_max, f'{self.data_lat_max:.2f}', color='#000000')
-                self.lat_text_2 = self.lateral_plot.axes.text(self.data_lat_t_min, self.data_lat_min, f'{self.data_lat_min:.2f}', color='#000000')
-            else:
-                self.lat_text_1 = self.lateral_plot.axes.text(self.data_lat_t_max, self.data_lat_max, f'{self.data_lat_max:.2f}', color='#E5E9F0')
-                self.lat_text_2 = self.lateral_plot.axes.text(self.data_lat_t_min, self.data_lat_min, f'{self.data_lat_min:.2f}', color='#E5E9F0')
-            self.lateral_plot.draw()
-
-            self.data_ap_max = results['ap_max']
-            self.data_ap_t_max = results['ap_t_max']
-            self.data_ap_min = results['ap_min']
-            self.data_ap_t_min = results['ap_t_min']
-
-            self.antePost_plot.axes.cla()
-            self.antePost_plot.fig.subplots_adjust(left=0.05, bottom=0.15, right=1, top=0.95, wspace=0, hspace=0)
-            self.antePost_plot.axes.plot(data_t, data_ap, '#42A4F5')
-            self.antePost_plot.axes.plot(self.data_ap_t_max, self.data_ap_max, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-            self.antePost_plot.axes.plot(self.data_ap_t_min, self.data_ap_min, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-            if self.theme_value:
-                self.ap_text_1 = self.antePost_plot.axes.text(self.data_ap_t_max, self.data_ap_max, f'{self.data_ap_max:.2f}', color='#000000')
-                self.ap_text_2 = self.antePost_plot.axes.text(self.data_ap_t_min, self.data_ap_min, f'{self.data_ap_min:.2f}', color='#000000')
-            else:
-                self.ap_text_1 = self.antePost_plot.axes.text(self.data_ap_t_max, self.data_ap_max, f'{self.data_ap_max:.2f}', color='#E5E9F0')
-                self.ap_text_2 = self.antePost_plot.axes.text(self.data_ap_t_min, self.data_ap_min, f'{self.data_ap_min:.2f}', color='#E5E9F0')
-            self.antePost_plot.draw()
-
-            # --------------
-            # Gráficas Áreas
-            # --------------
-            data_elipse = backend.ellipseStandard(df)
-            self.elipse_plot.axes.cla()
-            self.elipse_plot.fig.subplots_adjust(left=0.1, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-            self.elipse_plot.axes.scatter(data_lat, data_ap, marker='.', color='#42A4F5')
-            self.elipse_plot.axes.plot(data_elipse['x'], data_elipse['y'], '#FF2D55')
-            self.elipse_plot.axes.axis('equal')
-            self.elipse_plot.draw()
-
-            data_convex = backend.convexHull(df)
-            self.hull_plot.axes.cla()
-            self.hull_plot.fig.subplots_adjust(left=0.1, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-            self.hull_plot.axes.scatter(data_lat, data_ap, marker='.', color='#42A4F5')
-            self.hull_plot.axes.fill(data_convex['x'], data_convex['y'], edgecolor='#FF2D55', fill=False, linewidth=2)
-            self.hull_plot.axes.axis('equal')
-            self.hull_plot.draw()
-
-            data_pca = backend.ellipsePCA(df)
-            self.pca_plot.axes.cla()
-            self.pca_plot.fig.subplots_adjust(left=0.1, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-            self.pca_plot.axes.scatter(data_lat, data_ap, marker='.', color='#42A4F5')
-            self.pca_plot.axes.plot(data_pca['x'], data_pca['y'], '#FF2D55')
-            self.pca_plot.axes.axis('equal')
-            self.pca_plot.draw()
-
-            # --------------------------
-            # Presentación de resultados
-            # --------------------------
-            self.lat_rango_value.setText(f'{results["lat_rango"]:.2f}')
-            self.lat_vel_value.setText(f'{results["lat_vel"]:.2f}')
-            self.lat_rms_value.setText(f'{results["lat_rms"]:.2f}')
-
-            self.ap_rango_value.setText(f'{results["ap_rango"]:.2f}')
-            self.ap_vel_value.setText(f'{results["ap_vel"]:.2f}')
-            self.ap_rms_value.setText(f'{results["ap_rms"]:.2f}')
-
-            self.cop_vel_value.setText(f'{results["centro_vel"]:.2f}')
-            self.distancia_value.setText(f'{results["centro_dist"]:.2f}')
-            self.frecuencia_value.setText(f'{results["centro_frec"]:.2f}')
-
-            self.elipse_value.setText(f'{data_elipse["area"]:.2f}')
-            self.hull_value.setText(f'{data_convex["area"]:.2f}')
-            self.pca_value.setText(f'{data_pca["area"]:.2f}')
+            # The new study replaces the study being loaded, and is shown when
+            # it is added unless another study or patient is selected meanwhile
+            ticket = self.jobs.hold('estudio')
+            self.clear_analysis()
 
             # -------------
             # Base de datos
             # -------------
             study_data = {
-                'id_number': self.pacientes_menu.currentText(),
+                'id_number': self.patient_data[4],
                 'file_name': Path(selected_file).name,
                 'file_path': selected_file
                 }
-            self.estudios_list = backend.add_db('estudios', study_data)
-            
-            self.analisis_menu.clear()
-            for data in self.estudios_list:
-                self.analisis_menu.addItem(str(data[2]))
-            self.analisis_menu.setCurrentIndex(len(self.patientes_list)-1)
-
-            if self.language_value == 0:
-                QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Estudio agregado a la base de datos')
-            elif self.language_value == 1:
-                QtWidgets.QMessageBox.information(self, 'Data Saved', 'Study added to database')
+            id_number = study_data['id_number']
+            self.jobs.submit(backend.add_study_db, study_data,
+                on_result=lambda data: self.on_analisis_added(data, id_number, ticket),
+                on_error=lambda err: self.on_analisis_add_failed(err, ticket))
         else:
             if self.language_value == 0:
                 QtWidgets.QMessageBox.critical(self, 'Error de Datos', 'No se seleccióno un archivo para el estudio')
             elif self.language_value == 1:
                 QtWidgets.QMessageBox.critical(self, 'Data Error', 'No file for a study was given')
 
+    def on_analisis_added(self, data: tuple, id_number: int, ticket: int) -> None:
+        """ Study added to the database and analyzed by a background job
+
+        Parameters
+        ----------
+        data: tuple
+            Results of backend.add_study_db
+        id_number: int
+            Id number of the patient of the study
+        ticket: int
+            Hold of the 'estudio' channel taken when the study was submitted
+
+        Returns
+        -------
+        None
+        """
+        added_rows, metrics, analysis_data = data
+        show = self.jobs.release('estudio', ticket)
+
+        # The study is listed when its patient is selected again
+        if self.patient_data is None or self.patient_data[4] != id_number:
+            show = False
+        else:
+            for data in added_rows:
+                self.estudios_list.append(data)
+                self.analisis_menu.addItem(str(data[2]))
+
+        if show:
+            self.analisis_menu.setCurrentIndex(len(self.estudios_list)-1)
+            self.show_analysis((metrics, analysis_data))
+
+        if self.language_value == 0:
+            QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Estudio agregado a la base de datos')
+        elif self.language_value == 1:
+            QtWidgets.QMessageBox.information(self, 'Data Saved', 'Study added to database')
+
+
+    def on_analisis_add_failed(self, err: Exception, ticket: int) -> None:
+        """ Error of the background job of a new study """
+        self.jobs.release('estudio', ticket)
+        self.on_job_failed(err)
+
 
     def on_analisis_del_button_clicked(self) -> None:
         """ Delete analysis button from the database """
         current_study = self.analisis_menu.currentText()
 
         if current_study != '':
-            self.estudios_list = backend.delete_db('estudios', current_study)
-            
-            self.analisis_menu.clear()
-            for data in self.estudios_list:
-                self.analisis_menu.addItem(str(data[2]))
+            self.jobs.cancel('estudio')
             self.analisis_menu.setCurrentIndex(-1)
+            self.clear_analysis()
 
-            self.lateral_plot.axes.cla()
-            self.lateral_plot.draw()
-            self.antePost_plot.axes.cla()
-            self.antePost_plot.draw()
-            self.elipse_plot.axes.cla()
-            self.elipse_plot.draw()
-            self.hull_plot.axes.cla()
-            self.hull_plot.draw()
-            self.pca_plot.axes.cla()
-            self.pca_plot.draw()
-
-            self.lat_rango_value.setText('')
-            self.lat_vel_value.setText('')
-            self.lat_rms_value.setText('')
-            self.ap_rango_value.setText('')
-            self.ap_vel_value.setText('')
-            self.ap_rms_value.setText('')
-            self.cop_vel_value.setText('')
-            self.distancia_value.setText('')
-            self.frecuencia_value.setText('')
-            self.elipse_value.setText('')
-            self.hull_value.setText('')
-            self.pca_value.setText('')
-
-            if self.language_value == 0:
-                QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Análisis eliminado de la base de datos')
-            elif self.language_value == 1:
-                QtWidgets.QMessageBox.information(self, 'Data Saved', 'Analysis deleted from database')
+            self.jobs.submit(backend.delete_db, 'estudios', current_study,
+                on_result=self.on_analisis_deleted, on_error=self.on_job_failed)
         else:
             if self.language_value == 0:
                 QtWidgets.QMessageBox.critical(self, 'Error de Análisis', 'No se seleccionó un análisis')
             elif self.language_value == 1:
                 QtWidgets.QMessageBox.critical(self, 'Analysis Error', 'No analysis selected')
 
+    def on_analisis_deleted(self, deleted_rows: list) -> None:
+        """ Study deleted from the database by a background job """
+        for data in deleted_rows:
+            # Unless another patient was selected meanwhile
+            if any(row[0] == data[0] for row in self.estudios_list):
+                index = self.row_index(self.estudios_list, data[0])
+                del self.estudios_list[index]
+                self.analisis_menu.removeItem(index)
+        self.analisis_menu.setCurrentIndex(-1)
+
+        if self.language_value == 0:
+            QtWidgets.QMessageBox.information(self, 'Datos Guardados', 'Análisis eliminado de la base de datos')
+        elif self.language_value == 1:
+            QtWidgets.QMessageBox.information(self, 'Data Saved', 'Analysis deleted from database')
+
 
     def on_analisis_menu_textActivated(self, current_study: str):
         """ Change analysis and present results
+
+        The stored metrics of the study are read by a background job, and
+        then its plots by another one, which replace the jobs of a study
+        selected before.
         
         Parameters
         ----------
@@ -1046,13 +1075,99 @@ class App(QWidget):
         -------
         None
         """
-        analisis_data = backend.get_db('estudios', self.pacientes_menu.currentText())
-        study_path = [item for item in analisis_data if item[2] == current_study][0][3]
+        study_data = [item for item in self.estudios_list if item[2] == current_study][0]
+
+        self.jobs.submit(backend.get_results_db, study_data, channel='estudio',
+            on_result=lambda metrics: self.on_resultados_loaded(study_data, metrics),
+            on_error=self.on_job_failed)
 
-        df = pd.read_csv(study_path, sep='\t', skiprows=43, encoding='ISO-8859-1')
+    def on_resultados_loaded(self, study_data: tuple, metrics: dict) -> None:
+        """ Present the stored metrics of a study and load its plots
+
+        Parameters
+        ----------
+        study_data: tuple
+            Row of the study in estudios
+        metrics: dict
+            Stored metrics of the study, or None if it must be analyzed
+
+        Returns
+        -------
+        None
+        """
+        if metrics is not None:
+            self.show_results(metrics)
 
-        results = backend.analisis(df)
+        self.jobs.submit(backend.get_study_db, study_data, metrics, channel='estudio',
+            on_result=self.show_analysis, on_error=self.on_job_failed)
+
+    def show_analysis(self, data: tuple) -> None:
+        """ Present plots and results of a study loaded by a background job
+        
+        Parameters
+        ----------
+        data: tuple
+            Metrics of the study, and results of backend.get_study_db for
+            the plots (None if the study file can't be read)
         
+        Returns
+        -------
+        None
+        """
+        metrics, analysis_data = data
+
+        if analysis_data is None:
+            self.clear_analysis()
+        else:
+            self.show_plots(*analysis_data)
+
+        self.show_results(metrics)
+
+    def show_results(self, metrics: dict) -> None:
+        """ Present the metrics of a study
+
+        Parameters
+        ----------
+        metrics: dict
+            Metrics of the study, as stored in resultados
+
+        Returns
+        -------
+        None
+        """
+        # --------------------------
+        # Presentación de resultados
+        # --------------------------
+        self.lat_rango_value.setText(f'{metrics["lat_rango"]:.2f}')
+        self.lat_vel_value.setText(f'{metrics["lat_vel"]:.2f}')
+        self.lat_rms_value.setText(f'{metrics["lat_rms"]:.2f}')
+
+        self.ap_rango_value.setText(f'{metrics["ap_rango"]:.2f}')
+        self.ap_vel_value.setText(f'{metrics["ap_vel"]:.2f}')
+        self.ap_rms_value.setText(f'{metrics["ap_rms"]:.2f}')
+
+        self.cop_vel_value.setText(f'{metrics["centro_vel"]:.2f}')
+        self.distancia_value.setText(f'{metrics["centro_dist"]:.2f}')
+        self.frecuencia_value.setText(f'{metrics["centro_frec"]:.2f}')
+
+        self.elipse_value.setText(f'{metrics["elipse_area"]:.2f}')
+        self.hull_value.setText(f'{metrics["hull_area"]:.2f}')
+        self.pca_value.setText(f'{metrics["pca_area"]:.2f}')
+
+    def show_plots(self, results: dict, data_convex: dict) -> None:
+        """ Plot signals, ellipse, convex hull and oriented ellipse of a study
+        
+        Parameters
+        ----------
+        results: dict
+            Results of analisis or plot_data
+        data_convex: dict
+            Results of convexHull
+        
+        Returns
+        -------
+        None
+        """
         # ----------------
         # Gráficas Señales
         # ----------------
@@ -1060,87 +1175,21 @@ class App(QWidget):
         data_ap = results['data_y']
         data_t = results['data_t']
 
-        self.data_lat_max = results['lat_max']
-        self.data_lat_t_max = results['lat_t_max']
-        self.data_lat_min = results['lat_min']
-        self.data_lat_t_min = results['lat_t_min']
-
-        self.lateral_plot.axes.cla()
-        self.lateral_plot.fig.subplots_adjust(left=0.05, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-        self.lateral_plot.axes.plot(data_t, data_lat, '#42A4F5')
-        self.lateral_plot.axes.plot(self.data_lat_t_max, self.data_lat_max, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-        self.lateral_plot.axes.plot(self.data_lat_t_min, self.data_lat_min, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-        if self.theme_value:
-            self.lat_text_1 = self.lateral_plot.axes.text(self.data_lat_t_max, self.data_lat_max, f'{self.data_lat_max:.2f}', color='#000000')
-            self.lat_text_2 = self.lateral_plot.axes.text(self.data_lat_t_min, self.data_lat_min, f'{self.data_lat_min:.2f}', color='#000000')
-        else:
-            self.lat_text_1 = self.lateral_plot.axes.text(self.data_lat_t_max, self.data_lat_max, f'{self.data_lat_max:.2f}', color='#E5E9F0')
-            self.lat_text_2 = self.lateral_plot.axes.text(self.data_lat_t_min, self.data_lat_min, f'{self.data_lat_min:.2f}', color='#E5E9F0')
-        self.lateral_plot.draw()
-
-        self.data_ap_max = results['ap_max']
-        self.data_ap_t_max = results['ap_t_max']
-        self.data_ap_min = results['ap_min']
-        self.data_ap_t_min = results['ap_t_min']
-
-        self.antePost_plot.axes.cla()
-        self.antePost_plot.fig.subplots_adjust(left=0.05, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-        self.antePost_plot.axes.plot(data_t, data_ap, '#42A4F5')
-        self.antePost_plot.axes.plot(self.data_ap_t_max, self.data_ap_max, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-        self.antePost_plot.axes.plot(self.data_ap_t_min, self.data_ap_min, marker="o", markersize=3, markeredgecolor='#FF2D55', markerfacecolor='#FF2D55')
-        if self.theme_value:
-            self.ap_text_1 = self.antePost_plot.axes.text(self.data_ap_t_max, self.data_ap_max, f'{self.data_ap_max:.2f}', color='#000000')
-            self.ap_text_2 = self.antePost_plot.axes.text(self.data_ap_t_min, self.data_ap_min, f'{self.data_ap_min:.2f}', color='#000000')
-        else:
-            self.ap_text_1 = self.antePost_plot.axes.text(self.data_ap_t_max, self.data_ap_max, f'{self.data_ap_max:.2f}', color='#E5E9F0')
-            self.ap_text_2 = self.antePost_plot.axes.text(self.data_ap_t_min, self.data_ap_min, f'{self.data_ap_min:.2f}', color='#E5E9F0')
-        self.antePost_plot.draw()
+        self.lateral_plot.plot_signal(data_t, data_lat, results['lat_t_max'], results['lat_max'],
+            results['lat_t_min'], results['lat_min'], results.get('pyramid_x'))
+        self.antePost_plot.plot_signal(data_t, data_ap, results['ap_t_max'], results['ap_max'],
+            results['ap_t_min'], results['ap_min'], results.get('pyramid_y'))
 
         # --------------
         # Gráficas Áreas
         # --------------
-        data_elipse = backend.ellipseStandard(df)
-        self.elipse_plot.axes.cla()
-        self.elipse_plot.fig.subplots_adjust(left=0.1, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-        self.elipse_plot.axes.scatter(data_lat, data_ap, marker='.', color='#42A4F5')
-        self.elipse_plot.axes.plot(data_elipse['x'], data_elipse['y'], '#FF2D55')
-        self.elipse_plot.axes.axis('equal')
-        self.elipse_plot.draw()
-
-        data_convex = backend.convexHull(df)
-        self.hull_plot.axes.cla()
-        self.hull_plot.fig.subplots_adjust(left=0.1, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-        self.hull_plot.axes.scatter(data_lat, data_ap, marker='.', color='#42A4F5')
-        self.hull_plot.axes.fill(data_convex['x'], data_convex['y'], edgecolor='#FF2D55', fill=False, linewidth=2)
-        self.hull_plot.axes.axis('equal')
-        self.hull_plot.draw()
-
-        data_pca = backend.ellipsePCA(df)
-        self.pca_plot.axes.cla()
-        self.pca_plot.fig.subplots_adjust(left=0.1, bottom=0.1, right=1, top=0.95, wspace=0, hspace=0)
-        self.pca_plot.axes.scatter(data_lat, data_ap, marker='.', color='#42A4F5')
-        self.pca_plot.axes.plot(data_pca['x'], data_pca['y'], '#FF2D55')
-        self.pca_plot.axes.axis('equal')
-        self.pca_plot.draw()
-
-        # --------------------------
-        # Presentación de resultados
-        # --------------------------
-        self.lat_rango_value.setText(f'{results["lat_rango"]:.2f}')
-        self.lat_vel_value.setText(f'{results["lat_vel"]:.2f}')
-        self.lat_rms_value.setText(f'{results["lat_rms"]:.2f}')
-
-        self.ap_rango_value.setText(f'{results["ap_rango"]:.2f}')
-        self.ap_vel_value.setText(f'{results["ap_vel"]:.2f}')
-        self.ap_rms_value.setText(f'{results["ap_rms"]:.2f}')
+        data_elipse = results['elipse']
+        self.elipse_plot.plot_area(data_lat, data_ap, data_elipse['x'], data_elipse['y'])
 
-        self.cop_vel_value.setText(f'{results["centro_vel"]:.2f}')
-        self.distancia_value.setText(f'{results["centro_dist"]:.2f}')
-        self.frecuencia_value.setText(f'{results["centro_frec"]:.2f}')
+        self.hull_plot.plot_area(data_lat, data_ap, data_convex['x'], data_convex['y'], closed=True, linewidth=2)
 
-        self.elipse_value.setText(f'{data_elipse["area"]:.2f}')
-        self.hull_value.setText(f'{data_convex["area"]:.2f}')
-        self.pca_value.setText(f'{data_pca["area"]:.2f}')
+        data_pca = results['pca']
+        self.pca_plot.plot_area(data_lat, data_ap, data_pca['x'], data_pca['y'])
 
 
 if __name__=="__main__":
@@ -0,0 +1,346 @@
+"""
+Importer
+
+This file contains the bulk import of patients and studies, to migrate
+registries of other systems:
+
+Patients: CSV file with a header row and the columns of PATIENT_COLUMNS.
+    bmi may be empty or missing, it is calculated from weight and height
+Studies: folder with one subfolder per patient, named by its id number,
+    with the study files of the patient (or the study files of one patient)
+
+Rows are written by batches, one transaction per batch, with many rows per
+statement (psycopg2.extras.execute_values on PostgreSQL). Patients whose id
+number, or studies whose file name, are already in the database are
+skipped, or updated on request for patients. Studies are analyzed in a
+process pool before they are written, with their results.
+
+1. Input methods: reading and checking of patient CSV files and study folders
+2. Database methods: batched inserts
+3. Import methods: import of patients and studies, with counts and times
+"""
+
+import csv
+import math
+import os
+import time
+
+from psycopg2.extras import execute_values
+
+import db
+import migrations
+import records
+import rombergs
+from analysis import ANALYSIS_VERSION, METRICS, AREAS
+
+PATIENT_COLUMNS = ('last_name', 'first_name', 'id_type', 'id_number', 'birth_date', 'sex',
+    'weight', 'weight_unit', 'height', 'height_unit', 'bmi')
+
+# Allowed values of the coded columns, as written by the patient dialog
+PATIENT_CODES = {
+    'id_type': ('CC', 'TI'),
+    'sex': ('F', 'M'),
+    'weight_unit': ('Kg', 'Lb'),
+    'height_unit': ('m', 'ft - in'),
+}
+
+BATCH_SIZE = 5000
+
+# Rows per statement of execute_values
+PAGE_SIZE = 1000
+
+# Length of the file_name and file_path columns of estudios
+MAX_PATH_LENGTH = 128
+
+# Length of the VARCHAR columns of pacientes, and largest id number of its BIGINT column
+MAX_TEXT_LENGTH = 128
+MAX_ID_NUMBER = 2 ** 63 - 1
+
+# Exclusive upper bounds of the NUMERIC(5,2), NUMERIC(3,2) and NUMERIC(4,2)
+# columns of pacientes
+NUMERIC_LIMITS = {'weight': 1000.0, 'height': 10.0, 'bmi': 100.0}
+
+
+# ------------------
+# Métodos de Lectura
+# ------------------
+def _bmi(weight: float, weight_unit: str, height: float, height_unit: str) -> float:
+    """ Body mass index, with the unit conversions of the patient dialog """
+    weight_kg = weight * 0.454 if weight_unit == 'Lb' else weight
+    if height_unit == 'ft - in':
+        height_ft = math.floor(height)
+        height_in = (height - height_ft) * 100
+        height = ((height_ft * 12) + height_in) * 2.54 / 100
+    return round(weight_kg / (height * height), 1)
+
+
+def _check_range(values: dict, column: str) -> None:
+    """ Checks that a number is positive and fits its column of pacientes """
+    # Rounded as the database stores it, NaN fails both comparisons
+    if not 0 < round(values[column], 2) < NUMERIC_LIMITS[column]:
+        raise ValueError(f'{column} must be greater than 0 and less than {NUMERIC_LIMITS[column]:g}')
+
+
+def _patient_row(record: dict) -> tuple:
+    """ Checked row of pacientes from a record of a CSV file """
+    values = {column: (record.get(column) or '').strip() for column in PATIENT_COLUMNS}
+
+    missing = [column for column in PATIENT_COLUMNS if column != 'bmi' and values[column] == '']
+    if missing:
+        raise ValueError(f'missing {", ".join(missing)}')
+    for column, codes in PATIENT_CODES.items():
+        if values[column] not in codes:
+            raise ValueError(f'{column} must be one of {", ".join(codes)}')
+    for column in ('last_name', 'first_name', 'birth_date'):
+        if len(values[column]) > MAX_TEXT_LENGTH:
+            raise ValueError(f'{column} longer than {MAX_TEXT_LENGTH} characters')
+
+    values['id_number'] = int(values['id_number'])
+    if not 0 < values['id_number'] <= MAX_ID_NUMBER:
+        raise ValueError(f'id_number must be greater than 0 and at most {MAX_ID_NUMBER}')
+    values['weight'] = float(values['weight'])
+    values['height'] = float(values['height'])
+    _check_range(values, 'weight')
+    _check_range(values, 'height')
+    if values['bmi'] == '':
+        values['bmi'] = _bmi(values['weight'], values['weight_unit'],
+            values['height'], values['height_unit'])
+    else:
+        values['bmi'] = float(values['bmi'])
+    _check_range(values, 'bmi')
+
+    return tuple(values[column] for column in PATIENT_COLUMNS)
+
+
+def read_patients_csv(file_path: str) -> tuple:
+    """ Patients of a CSV file
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the CSV file, with a header row with PATIENT_COLUMNS
+
+    Returns
+    -------
+    rows: list
+        Checked rows for pacientes, in the order of PATIENT_COLUMNS. Of
+        repeated id numbers, the last row is kept
+    errors: list
+        (line, message) of the rows that can't be imported
+    """
+    rows = {}
+    errors = []
+    with open(file_path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.DictReader(file)
+        missing = set(PATIENT_COLUMNS) - {'bmi'} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f'{file_path}: missing columns {", ".join(sorted(missing))}')
+
+        for record in reader:
+            try:
+                row = _patient_row(record)
+            except ValueError as error:
+                errors.append((reader.line_num, str(error)))
+                continue
+            rows.pop(row[3], None)
+            rows[row[3]] = row
+
+    return list(rows.values()), errors
+
+
+def find_study_files(folder: str, id_number: int = None) -> list:
+    """ Study files of a folder and the id numbers of their patients
+
+    Parameters
+    ----------
+    folder: str
+        Folder with one subfolder per patient, named by its id number
+    id_number: int
+        Id number of the patient of every study file directly in folder,
+        instead of the subfolders
+
+    Returns
+    -------
+    studies: list
+        Sorted (id_number, file_path) of the study files
+    """
+    if id_number is not None:
+        return [(id_number, path) for path in rombergs.expand_inputs([folder])]
+
+    studies = []
+    for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+        if entry.is_dir() and entry.name.isdigit():
+            studies.extend((int(entry.name), path) for path in rombergs.expand_inputs([entry.path]))
+    return studies
+
+
+# ------------------------
+# Métodos de Base de Datos
+# ------------------------
+def _insert_many(cursor, query: str, rows: list) -> list:
+    """ Runs an INSERT ... VALUES %s ... RETURNING for many rows
+
+    Parameters
+    ----------
+    cursor: cursor
+        Cursor of a pooled connection
+    query: str
+        Query for psycopg2.extras.execute_values, with one VALUES %s
+    rows: list
+        Tuples of values, one per row
+
+    Returns
+    -------
+    returned: list
+        Rows returned by the query
+    """
+    if cursor.connection.dialect == 'sqlite':
+        # Statements of SQLite are local calls, one per row costs little
+        values = f'VALUES ({", ".join(["%s"] * len(rows[0]))})'
+        query = query.replace('VALUES %s', values)
+        returned = []
+        for row in rows:
+            cursor.execute(query, row)
+            returned.extend(cursor.fetchall())
+        return returned
+
+    return execute_values(cursor, query, rows, page_size=PAGE_SIZE, fetch=True)
+
+
+def _existing(cursor, table: str, column: str, values: list) -> set:
+    """ Values of a column that are already in a table """
+    found = set()
+    for start in range(0, len(values), PAGE_SIZE):
+        page = values[start:start + PAGE_SIZE]
+        cursor.execute(f'SELECT {column} FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(page))})',
+            page)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+
+def _batches(items: list, batch_size: int):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+# ----------------------
+# Métodos de Importación
+# ----------------------
+def import_patients(rows: list, update: bool = False, batch_size: int = BATCH_SIZE) -> dict:
+    """ Writes patients to the database
+
+    Parameters
+    ----------
+    rows: list
+        Rows for pacientes, in the order of PATIENT_COLUMNS, without
+        repeated id numbers
+    update: bool
+        Update the patients already in the database, instead of skipping them
+    batch_size: int
+        Number of patients per transaction
+
+    Returns
+    -------
+    report: dict
+        total, written and skipped patients, errors and seconds
+    """
+    start_time = time.perf_counter()
+    migrations.migrate()
+
+    columns = ', '.join(PATIENT_COLUMNS)
+    if update:
+        conflict = 'DO UPDATE SET ' + ', '.join(f'{column} = EXCLUDED.{column}'
+            for column in PATIENT_COLUMNS if column != 'id_number')
+    else:
+        conflict = 'DO NOTHING'
+    query = f'INSERT INTO pacientes ({columns}) VALUES %s ON CONFLICT (id_number) {conflict} RETURNING id_number'
+
+    written = 0
+    for batch in _batches(rows, batch_size):
+        with db.connection() as connection:
+            written += len(_insert_many(connection.cursor(), query, batch))
+
+    records.invalidate_all()
+    return {'total': len(rows), 'written': written, 'skipped': len(rows) - written,
+        'errors': [], 'seconds': time.perf_counter() - start_time}
+
+
+def import_studies(studies: list, workers: int = None, batch_size: int = BATCH_SIZE) -> dict:
+    """ Analyzes study files and writes them and their results to the database
+
+    Studies whose file name is already in the database are skipped without
+    analysis. Studies of unknown patients, with paths longer than the
+    columns of estudios, or that can't be analyzed are reported as errors.
+
+    Parameters
+    ----------
+    studies: list
+        (id_number, file_path) of the study files
+    workers: int
+        Number of analysis processes, by default the number of CPUs
+    batch_size: int
+        Number of studies per transaction
+
+    Returns
+    -------
+    report: dict
+        total, written and skipped studies, errors and seconds
+    """
+    start_time = time.perf_counter()
+    migrations.migrate()
+
+    # Later studies with the same file name would be skipped by the database
+    pending = {}
+    for id_number, file_path in studies:
+        pending.setdefault(os.path.basename(file_path), (id_number, os.path.abspath(file_path)))
+
+    errors = []
+    with db.connection() as connection:
+        cursor = connection.cursor()
+        existing = _existing(cursor, 'estudios', 'file_name', list(pending))
+        # Id numbers beyond BIGINT can't be queried, they are reported as unknown patients
+        patients = _existing(cursor, 'pacientes', 'id_number',
+            sorted({item[0] for item in pending.values() if 0 < item[0] <= MAX_ID_NUMBER}))
+
+    to_analyze = []
+    for file_name, (id_number, file_path) in pending.items():
+        if file_name in existing:
+            continue
+        if id_number not in patients:
+            errors.append((file_path, f'no patient with id number {id_number}'))
+        elif len(file_path) > MAX_PATH_LENGTH:
+            errors.append((file_path, f'path longer than {MAX_PATH_LENGTH} characters'))
+        else:
+            to_analyze.append((id_number, file_name, file_path))
+
+    analyzed = rombergs.analyze_files([item[2] for item in to_analyze], workers)
+
+    valid = []
+    for item, row in zip(to_analyze, analyzed):
+        if row['error']:
+            errors.append((item[2], row['error']))
+        else:
+            valid.append((item, row))
+
+    columns = METRICS + AREAS
+    study_query = """INSERT INTO estudios (id_number, file_name, file_path) VALUES %s
+                    ON CONFLICT (file_name) DO NOTHING RETURNING id, file_name"""
+    result_query = f"""INSERT INTO resultados (estudio_id, analysis_version, {', '.join(columns)}) VALUES %s
+                    ON CONFLICT (estudio_id, analysis_version) DO NOTHING RETURNING estudio_id"""
+
+    written = 0
+    for batch in _batches(valid, batch_size):
+        metrics = {item[1]: row for item, row in batch}
+        with db.connection() as connection:
+            cursor = connection.cursor()
+            # A study added meanwhile by another workstation is skipped
+            added = _insert_many(cursor, study_query, [item for item, _ in batch])
+            if added:
+                _insert_many(cursor, result_query, [(estudio_id, ANALYSIS_VERSION,
+                    *[metrics[file_name][key] for key in columns]) for estudio_id, file_name in added])
+        written += len(added)
+
+    records.invalidate_all()
+    return {'total': len(studies), 'written': written,
+        'skipped': len(studies) - written - len(errors), 'errors': errors,
+        'seconds': time.perf_counter() - start_time}
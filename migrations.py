@@ -0,0 +1,366 @@
+"""
+Migrations
+
+This file contains the versioned schema of the database.
+
+Every change of the schema is a forward migration of MIGRATIONS with a
+version number. The versions applied to a database are recorded in the
+schema_version table, so each migration runs once, in order, in its own
+transaction. On a normal start, when the database is up to date, the only
+cost is one query of the current version per connection pool.
+
+Workstations sharing one database serialize their migrations with an
+advisory lock, and check the version again once they hold it.
+
+The DDL is written for PostgreSQL and translated for SQLite databases by
+_execute, with the types of SQLITE_TYPES. The changes that SQLite can't
+make in the same way have their own SQLite version in the migration. On
+SQLite, the pending migrations run in one transaction, whose write lock
+serializes the processes sharing the file.
+
+1. Migration methods: one function per version, with the DDL of the change
+2. Migration engine: current version and application of pending migrations
+"""
+
+import sqlite3
+import threading
+
+import psycopg2
+from psycopg2 import errors
+
+import db
+
+# Key of the advisory lock taken while migrating ('ROMB')
+LOCK_KEY = 0x524F4D42
+
+# PostgreSQL types and collations and their SQLite equivalents
+SQLITE_TYPES = (
+    (' COLLATE "C"', ''),
+    ('serial PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    ('TIMESTAMPTZ NOT NULL DEFAULT now()', 'TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP'),
+    ('JSONB', 'TEXT'),
+    ('BYTEA', 'BLOB'),
+)
+
+_checked_pool = None
+_checked_lock = threading.Lock()
+
+
+# --------------------
+# Métodos de Migración
+# --------------------
+def _execute(cursor, statement: str) -> None:
+    """ Executes a DDL statement, translated to the engine of the cursor """
+    if cursor.connection.dialect == 'sqlite':
+        for postgresql_type, sqlite_type in SQLITE_TYPES:
+            statement = statement.replace(postgresql_type, sqlite_type)
+    cursor.execute(statement)
+
+
+def _create_tables(cursor) -> None:
+    """ Tables pacientes and estudios, as created by the first versions """
+    _execute(cursor, """CREATE TABLE IF NOT EXISTS pacientes (
+                    id serial PRIMARY KEY,
+                    last_name VARCHAR(128) NOT NULL,
+                    first_name VARCHAR(128) NOT NULL,
+                    id_type CHAR(2) NOT NULL,
+                    id_number BIGINT UNIQUE NOT NULL,
+                    birth_date VARCHAR(128) NOT NULL,
+                    sex CHAR(1) NOT NULL,
+                    weight NUMERIC(5,2) NOT NULL,
+                    weight_unit CHAR(2) NOT NULL,
+                    height NUMERIC(3,2) NOT NULL,
+                    height_unit VARCHAR(7) NOT NULL,
+                    bmi NUMERIC(4,2) NOT NULL
+                    )""")
+    _execute(cursor, """CREATE TABLE IF NOT EXISTS estudios (
+                    id serial PRIMARY KEY,
+                    id_number BIGINT NOT NULL,
+                    file_name VARCHAR(128) UNIQUE NOT NULL,
+                    file_path VARCHAR(128) UNIQUE NOT NULL
+                    )""")
+
+
+def _estudios_index_and_foreign_key(cursor) -> None:
+    """ Index of the studies of a patient and foreign key to pacientes """
+    if cursor.connection.dialect == 'sqlite':
+        _estudios_foreign_key_sqlite(cursor)
+
+    # Studies of a patient, ordered by id, are read from the index
+    cursor.execute("""CREATE INDEX IF NOT EXISTS estudios_id_number_id_idx
+                    ON estudios (id_number, id)""")
+    if cursor.connection.dialect == 'sqlite':
+        return
+
+    # Studies follow their patient on delete and on change of id number. The
+    # key is added without checking the existing rows, and checked only if
+    # there are no studies left without a patient
+    cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = 'estudios_id_number_fkey'")
+    if cursor.fetchone() is None:
+        cursor.execute("""ALTER TABLE estudios ADD CONSTRAINT estudios_id_number_fkey
+                        FOREIGN KEY (id_number) REFERENCES pacientes (id_number)
+                        ON DELETE CASCADE ON UPDATE CASCADE NOT VALID""")
+    cursor.execute("""SELECT 1 FROM estudios WHERE NOT EXISTS
+                    (SELECT 1 FROM pacientes WHERE pacientes.id_number = estudios.id_number)
+                    LIMIT 1""")
+    if cursor.fetchone() is None:
+        cursor.execute('ALTER TABLE estudios VALIDATE CONSTRAINT estudios_id_number_fkey')
+
+
+def _estudios_foreign_key_sqlite(cursor) -> None:
+    """ Foreign key of estudios to pacientes in a SQLite database """
+    # SQLite can't add a constraint to a table: the table is made again with it
+    cursor.execute("""CREATE TABLE estudios_nueva (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id_number BIGINT NOT NULL REFERENCES pacientes (id_number)
+                        ON DELETE CASCADE ON UPDATE CASCADE,
+                    file_name VARCHAR(128) UNIQUE NOT NULL,
+                    file_path VARCHAR(128) UNIQUE NOT NULL
+                    )""")
+    cursor.execute('INSERT INTO estudios_nueva SELECT * FROM estudios')
+    cursor.execute('DROP TABLE estudios')
+    cursor.execute('ALTER TABLE estudios_nueva RENAME TO estudios')
+
+
+def _create_resultados(cursor) -> None:
+    """ Table of the results of the analysis of each study """
+    # One row per study and version of the analysis algorithms
+    _execute(cursor, """CREATE TABLE IF NOT EXISTS resultados (
+                    estudio_id INTEGER NOT NULL REFERENCES estudios (id) ON DELETE CASCADE,
+                    analysis_version INTEGER NOT NULL,
+                    lat_max DOUBLE PRECISION NOT NULL,
+                    lat_t_max DOUBLE PRECISION NOT NULL,
+                    lat_min DOUBLE PRECISION NOT NULL,
+                    lat_t_min DOUBLE PRECISION NOT NULL,
+                    lat_rango DOUBLE PRECISION NOT NULL,
+                    lat_vel DOUBLE PRECISION NOT NULL,
+                    lat_rms DOUBLE PRECISION NOT NULL,
+                    ap_max DOUBLE PRECISION NOT NULL,
+                    ap_t_max DOUBLE PRECISION NOT NULL,
+                    ap_min DOUBLE PRECISION NOT NULL,
+                    ap_t_min DOUBLE PRECISION NOT NULL,
+                    ap_rango DOUBLE PRECISION NOT NULL,
+                    ap_vel DOUBLE PRECISION NOT NULL,
+                    ap_rms DOUBLE PRECISION NOT NULL,
+                    centro_vel DOUBLE PRECISION NOT NULL,
+                    centro_dist DOUBLE PRECISION NOT NULL,
+                    centro_frec DOUBLE PRECISION NOT NULL,
+                    elipse_area DOUBLE PRECISION NOT NULL,
+                    hull_area DOUBLE PRECISION NOT NULL,
+                    pca_area DOUBLE PRECISION NOT NULL,
+                    computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (estudio_id, analysis_version)
+                    )""")
+
+
+def _create_senales(cursor) -> None:
+    """ Table of the signals of the studies stored in the database """
+    # Apart from estudios, so that the listings of studies never read the blobs
+    _execute(cursor, """CREATE TABLE IF NOT EXISTS senales (
+                    estudio_id INTEGER PRIMARY KEY REFERENCES estudios (id) ON DELETE CASCADE,
+                    header JSONB NOT NULL,
+                    n_samples INTEGER NOT NULL,
+                    n_columns SMALLINT NOT NULL,
+                    encoding VARCHAR(16) NOT NULL,
+                    signal BYTEA NOT NULL
+                    )""")
+    # The blobs are already compressed: stored out of line without compression,
+    # so that a part of a blob is read without reading all of it
+    if cursor.connection.dialect == 'postgresql':
+        cursor.execute('ALTER TABLE senales ALTER COLUMN signal SET STORAGE EXTERNAL')
+
+
+def _pacientes_search_indexes(cursor) -> None:
+    """ Indexes of the prefix search of patients by id number and names """
+    # Byte order ("C"), in which the prefix ranges of the search are exact
+    _execute(cursor, """CREATE INDEX IF NOT EXISTS pacientes_id_number_text_idx
+                    ON pacientes ((CAST(id_number AS TEXT) COLLATE "C"))""")
+    _execute(cursor, """CREATE INDEX IF NOT EXISTS pacientes_last_name_idx
+                    ON pacientes ((lower(last_name) COLLATE "C"))""")
+    _execute(cursor, """CREATE INDEX IF NOT EXISTS pacientes_first_name_idx
+                    ON pacientes ((lower(first_name) COLLATE "C"))""")
+
+
+def _notify_triggers(cursor) -> None:
+    """ Triggers that notify the id number of the patients written """
+    # A SQLite file has no other workstations to notify
+    if cursor.connection.dialect == 'sqlite':
+        return
+
+    # Channel of records.CHANNEL. Notifications are sent at commit, once per
+    # id number and transaction
+    cursor.execute("""CREATE OR REPLACE FUNCTION notificar_cambio() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                            PERFORM pg_notify('rombergs_cambios', OLD.id_number::text);
+                        END IF;
+                        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                            PERFORM pg_notify('rombergs_cambios', NEW.id_number::text);
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $$ LANGUAGE plpgsql""")
+    for table in ('pacientes', 'estudios'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {table}_notificar ON {table}')
+        cursor.execute(f"""CREATE TRIGGER {table}_notificar
+                        AFTER INSERT OR UPDATE OR DELETE ON {table}
+                        FOR EACH ROW EXECUTE PROCEDURE notificar_cambio()""")
+
+
+def _pacientes_search_indexes_sqlite(cursor) -> None:
+    """ Indexes of the names of patients of SQLite, on unicode_lower """
+    # The indexes of version 5 were built with lower() replaced by the Unicode
+    # one of the application, and drift from the rows written by other clients
+    if cursor.connection.dialect != 'sqlite':
+        return
+
+    for column in ('last_name', 'first_name'):
+        cursor.execute(f'DROP INDEX IF EXISTS pacientes_{column}_idx')
+        cursor.execute(f'CREATE INDEX pacientes_{column}_idx ON pacientes (unicode_lower({column}))')
+
+
+# Ordered forward migrations: (version, description, function)
+MIGRATIONS = (
+    (1, 'Tablas pacientes y estudios', _create_tables),
+    (2, 'Índice y llave foránea de estudios', _estudios_index_and_foreign_key),
+    (3, 'Tabla resultados', _create_resultados),
+    (4, 'Tabla senales', _create_senales),
+    (5, 'Índices de búsqueda de pacientes', _pacientes_search_indexes),
+    (6, 'Notificación de cambios de pacientes y estudios', _notify_triggers),
+    (7, 'Índices de búsqueda de nombres en SQLite', _pacientes_search_indexes_sqlite),
+)
+
+
+# ------------------
+# Motor de Migración
+# ------------------
+def current_version(connection) -> int:
+    """ Version of the schema of a database
+
+    Parameters
+    ----------
+    connection: psycopg2.extensions.connection or db.SQLiteConnection
+        Open connection to the database
+
+    Returns
+    -------
+    version: int
+        Last version applied, 0 if the database has no schema_version table
+    """
+    cursor = connection.cursor()
+    if connection.dialect == 'sqlite':
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+        if cursor.fetchone() is None:
+            return 0
+    try:
+        cursor.execute('SELECT max(version) FROM schema_version')
+    except errors.UndefinedTable:
+        connection.rollback()
+        return 0
+    version = cursor.fetchone()[0]
+    connection.commit()
+    return version or 0
+
+
+def migrate(force: bool = False) -> int:
+    """ Applies the pending migrations to the database of the settings
+
+    The database is checked once per connection pool: later calls return
+    without any query until the pool is reset by a change of settings.
+
+    Parameters
+    ----------
+    force: bool
+        Check the version of the database even if it was already checked
+
+    Returns
+    -------
+    version: int
+        Version of the schema after the migrations
+
+    Raises
+    ------
+    psycopg2.OperationalError or sqlite3.OperationalError
+        If the database of the settings is not reachable
+    """
+    global _checked_pool
+    latest = MIGRATIONS[-1][0]
+
+    with _checked_lock:
+        pool = db.get_pool()
+        if pool is _checked_pool and not force:
+            return latest
+
+        with db.connection() as connection:
+            version = current_version(connection)
+            if version < latest:
+                version = _apply_pending(connection)
+
+        _checked_pool = pool
+        return version
+
+
+def _create_schema_version(cursor) -> None:
+    """ Table of the versions applied to the database """
+    _execute(cursor, """CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description VARCHAR(128) NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    )""")
+
+
+def _apply_pending(connection) -> int:
+    """ Applies the migrations newer than the version of the database """
+    if connection.dialect == 'sqlite':
+        return _apply_pending_sqlite(connection)
+    cursor = connection.cursor()
+
+    # Another workstation may be migrating: wait for it, then read the version again
+    cursor.execute('SELECT pg_advisory_lock(%s)', (LOCK_KEY,))
+    try:
+        _create_schema_version(cursor)
+        connection.commit()
+
+        version = current_version(connection)
+        for migration_version, description, function in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            try:
+                function(cursor)
+                cursor.execute('INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                    (migration_version, description))
+                connection.commit()
+            except psycopg2.Error:
+                connection.rollback()
+                raise
+            version = migration_version
+    finally:
+        cursor.execute('SELECT pg_advisory_unlock(%s)', (LOCK_KEY,))
+        connection.commit()
+
+    return version
+
+
+def _apply_pending_sqlite(connection) -> int:
+    """ Applies the pending migrations to a SQLite database in one transaction """
+    cursor = connection.cursor()
+
+    # The write lock is taken at once, other processes wait for the commit
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        _create_schema_version(cursor)
+        cursor.execute('SELECT max(version) FROM schema_version')
+        version = cursor.fetchone()[0] or 0
+        for migration_version, description, function in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            function(cursor)
+            cursor.execute('INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                (migration_version, description))
+            version = migration_version
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+
+    return version
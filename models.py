@@ -0,0 +1,149 @@
+"""
+Models
+
+This file contains the Qt item models of the application.
+
+The patient model keeps only the pages of the registry already shown: the
+first page is loaded at start, and the next ones in background jobs when
+the list is scrolled to its end (canFetchMore/fetchMore). A search loads
+the pages of the patients matching it instead.
+
+1. Class PatientModel: patients of the registry, loaded by pages on demand
+"""
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal
+
+
+class PatientModel(QAbstractListModel):
+    failed = pyqtSignal(object)
+
+    def __init__(self, jobs, fetch_page, page_size: int, parent=None) -> None:
+        """ Patients of the registry, loaded by pages
+
+        Parameters
+        ----------
+        jobs: workers.JobQueue
+            Queue of the background jobs that fetch the pages
+        fetch_page: callable
+            fetch_page(search, after, limit): rows of the patients matching
+            search with database id greater than after, ordered by id
+        page_size: int
+            Number of patients per page
+        parent: QObject
+            Parent object, usually the main window
+
+        Returns
+        -------
+        None
+        """
+        super().__init__(parent)
+        self.jobs = jobs
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.channel = f'pagina_{id(self)}'
+
+        self.rows = []
+        self.ids = set()
+        self.search = ''
+        self.after = 0
+        self.more = True
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return str(row[4])
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return f'{row[1]} {row[2]}'
+        if role == Qt.ItemDataRole.UserRole:
+            return row
+        return None
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return not parent.isValid() and self.more and not self.jobs.is_busy(self.channel)
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()) -> None:
+        if not self.canFetchMore(parent):
+            return
+        self.jobs.submit(self.fetch_page, self.search, self.after, self.page_size,
+            channel=self.channel, on_result=self.add_page, on_error=self.failed.emit)
+
+    # ---------
+    # Funciones
+    # ---------
+    def row(self, index: int) -> tuple:
+        """ Row of a patient by its position, or None """
+        return self.rows[index] if 0 <= index < len(self.rows) else None
+
+    def index_of(self, id_db: int) -> int:
+        """ Position of a patient by its database id, -1 if not loaded """
+        for index, row in enumerate(self.rows):
+            if row[0] == id_db:
+                return index
+        return -1
+
+    def set_rows(self, rows: list) -> None:
+        """ Replaces the patients with the first page of the registry """
+        self.jobs.cancel(self.channel)
+        self.beginResetModel()
+        self.rows = []
+        self.ids = set()
+        self.search = ''
+        self.after = 0
+        self.endResetModel()
+        self.add_page(rows)
+
+    def set_search(self, search: str) -> None:
+        """ Replaces the patients with the first page of a search """
+        search = search.strip()
+        if search == self.search:
+            return
+
+        self.jobs.cancel(self.channel)
+        self.beginResetModel()
+        self.rows = []
+        self.ids = set()
+        self.search = search
+        self.after = 0
+        self.more = True
+        self.endResetModel()
+        self.fetchMore()
+
+    def add_page(self, rows: list) -> None:
+        """ Appends a page fetched from the database """
+        self.more = len(rows) == self.page_size
+        if rows:
+            self.after = rows[-1][0]
+        # Patients added in this session may come again in a later page
+        self.append_rows([row for row in rows if row[0] not in self.ids])
+
+    def append_rows(self, rows: list) -> None:
+        """ Appends patients at the end of the list """
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+        self.rows.extend(rows)
+        self.ids.update(row[0] for row in rows)
+        self.endInsertRows()
+
+    def update_rows(self, rows: list) -> None:
+        """ Replaces the loaded patients with the same database id """
+        for row in rows:
+            index = self.index_of(row[0])
+            if index >= 0:
+                self.rows[index] = row
+                self.dataChanged.emit(self.index(index), self.index(index))
+
+    def remove_rows(self, rows: list) -> None:
+        """ Removes the loaded patients with the same database id """
+        for row in rows:
+            index = self.index_of(row[0])
+            if index >= 0:
+                self.beginRemoveRows(QModelIndex(), index, index)
+                del self.rows[index]
+                self.ids.discard(row[0])
+                self.endRemoveRows()
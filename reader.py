@@ -0,0 +1,269 @@
+"""
+Reader
+
+This file contains the reader of the stabilometry text files exported by the
+BTS platform.
+
+The export has a header of 'key: value' lines terminated by an empty line,
+followed by a row with the column names (Px, Py) and the tab separated
+center of pressure samples:
+
+                          File name:	C:\\...\\study.tdf plat 1
+                      Frequency(Hz):	10.000000
+                      Total time(s):	44.958000
+                                ...
+                 Range time of analysis(s):	45.000000
+                                ...
+
+      Px	      Py
+-21.982819	29.504150
+...
+
+1. Class StudyHeader: typed record of the header fields
+2. Reading methods: header parsing, analysis window and signal loading into
+   NumPy arrays
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+ENCODING = 'ISO-8859-1'
+
+# Digits to '0' and whitespace to ' ', to check the format with byte counts
+FIXED_POINT = bytes.maketrans(b'123456789\t\r\n', b'000000000   ')
+
+HEADER_FIELDS = {
+    'Frequency(Hz)': ('frequency', float),
+    'Total time(s)': ('total_time', float),
+    'Real total time(s)': ('real_total_time', float),
+    'Start of analysis(s)': ('start_of_analysis', float),
+    'Range time of analysis(s)': ('range_time_of_analysis', float),
+    'Reference frame': ('reference_frame', int),
+}
+
+
+@dataclass
+class StudyHeader:
+    """ Header of a stabilometry text file
+
+    Attributes
+    ----------
+    file_name: str
+        Name of the source file in the acquisition workstation
+    frequency: float
+        Sampling frequency in Hz
+    total_time: float
+        Total time of the recording in seconds
+    real_total_time: float
+        Real total time of the recording in seconds
+    start_of_analysis: float
+        Start time of the analysis window in seconds
+    range_time_of_analysis: float
+        Length of the analysis window in seconds
+    reference_frame: int
+        Reference frame of the platform
+    columns: tuple
+        Names of the signal columns
+    metrics: dict
+        Device metrics of the header, name -> tuple of values
+    """
+    file_name: str = ''
+    frequency: float = 10.0
+    total_time: float = 0.0
+    real_total_time: float = 0.0
+    start_of_analysis: float = 0.0
+    range_time_of_analysis: float = 0.0
+    reference_frame: int = 0
+    columns: tuple = ('Px', 'Py')
+    metrics: dict = field(default_factory=dict)
+
+
+# ---------
+# Funciones
+# ---------
+def _parse_values(fields: list) -> tuple:
+    """ Converts header values to float when possible """
+    values = []
+    for value in fields:
+        try:
+            values.append(float(value))
+        except ValueError:
+            values.append(value)
+    return tuple(values)
+
+
+def _parse_fixed_point(body: bytes) -> np.ndarray:
+    """ Parses signal values written with a fixed number of decimals
+
+    The platform writes every sample as '%f' (six decimals), so the values
+    can be parsed as integers once the decimal point is removed, which is
+    about twice as fast as parsing them as floats. The division by a power
+    of ten is correctly rounded, so the result equals the float parsing.
+
+    Parameters
+    ----------
+    body: bytes
+        Signal values separated by whitespace
+
+    Returns
+    -------
+    values: np.ndarray
+        Signal values, or None if the body is not in fixed point format
+    """
+    pattern = body.translate(FIXED_POINT) + b' '
+    if pattern.translate(None, b'0.+- '):
+        return None
+
+    dot = pattern.find(b'.')
+    decimals = pattern.find(b' ', dot) - dot - 1
+    if dot == -1 or not 0 < decimals < 10:
+        return None
+
+    n_values = pattern.count(b'.')
+    if pattern.count(b'.' + b'0' * decimals + b' ') != n_values:
+        return None
+
+    try:
+        values = np.fromstring(body.replace(b'.', b''), dtype=np.int64, sep=' ')
+    except ValueError:
+        return None
+    if values.size != n_values or np.abs(values).max(initial=0) >= 2**53:
+        return None
+
+    return values / 10.0**decimals
+
+
+def parse_header(lines: list) -> StudyHeader:
+    """ Parses the header lines of a stabilometry text file
+
+    Parameters
+    ----------
+    lines: list
+        Decoded header lines, without the empty line that closes the header
+
+    Returns
+    -------
+    header: StudyHeader
+        Typed record of the header fields
+
+    Raises
+    ------
+    ValueError
+        If a known field has no value or a value that is not a number
+    """
+    header = StudyHeader()
+    metrics = header.metrics
+    for line in lines:
+        key, _, values = line.partition('\t')
+        key = key.strip().rstrip(':').rstrip()
+
+        if key in HEADER_FIELDS:
+            attribute, value_type = HEADER_FIELDS[key]
+            fields = values.split()
+            if not fields:
+                raise ValueError(f'header field {key!r} has no value')
+            setattr(header, attribute, value_type(float(fields[0])))
+        elif key == 'File name':
+            header.file_name = values.strip()
+        else:
+            fields = values.split()
+            try:
+                metrics[key] = tuple(map(float, fields))
+            except ValueError:
+                metrics[key] = _parse_values(fields)
+    return header
+
+
+def analysis_window(header: StudyHeader, n_samples: int) -> slice:
+    """ Samples of the analysis window given by the header
+
+    Parameters
+    ----------
+    header: StudyHeader
+        Header with frequency, start and range time of analysis
+    n_samples: int
+        Number of samples of the signal
+
+    Returns
+    -------
+    window: slice
+        Rows of the signal inside the analysis window. The whole signal from
+        the start of analysis if the header has no range time of analysis
+    """
+    start = int(round(header.start_of_analysis * header.frequency))
+    stop = n_samples
+    if header.range_time_of_analysis > 0:
+        stop = start + int(round(header.range_time_of_analysis * header.frequency))
+    return slice(min(start, n_samples), min(stop, n_samples))
+
+
+def _window_rows(body: bytes, header: StudyHeader) -> bytes:
+    """ Rows of the signal text inside the analysis window """
+    newlines = np.flatnonzero(np.frombuffer(body, dtype=np.uint8) == 10)
+    n_rows = newlines.size + (not body.endswith(b'\n'))
+    window = analysis_window(header, n_rows)
+
+    begin = newlines[window.start - 1] + 1 if window.start > 0 else 0
+    end = newlines[window.stop - 1] + 1 if window.stop <= newlines.size else len(body)
+    return body[begin:end]
+
+
+def read_study(file_path: str, window: bool = False) -> tuple:
+    """ Reads a stabilometry text file
+
+    The header is parsed into a StudyHeader and the two center of pressure
+    columns are loaded in a contiguous float64 array of shape (n, 2), without
+    building a DataFrame.
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the stabilometry text file
+    window: bool
+        Only convert the rows inside the analysis window of the header
+
+    Returns
+    -------
+    header: StudyHeader
+        Typed record of the header fields
+    signal: np.ndarray
+        Lateral (column 0) and antero-posterior (column 1) signals
+    """
+    with open(file_path, 'rb') as file:
+        raw = file.read()
+
+    # ------
+    # Header
+    # ------
+    header_end = raw.find(b'\n\n')
+    start = header_end + 2
+    if header_end == -1:
+        header_end = raw.find(b'\n\r\n')
+        start = header_end + 3
+    if header_end == -1:
+        raise ValueError(f'{file_path}: header without end')
+
+    header = parse_header(raw[:header_end].decode(ENCODING).splitlines())
+
+    end = raw.find(b'\n', start)
+    if end == -1:
+        end = len(raw)
+    header.columns = tuple(raw[start:end].decode(ENCODING).split())
+
+    # -----
+    # Señal
+    # -----
+    n_columns = len(header.columns)
+    body = raw[end + 1:]
+    if window:
+        body = _window_rows(body, header)
+    values = _parse_fixed_point(body)
+    if values is None:
+        values = np.fromstring(body, dtype=np.float64, sep=' ')
+    if values.size % n_columns:
+        raise ValueError(f'{file_path}: incomplete signal rows')
+
+    signal = np.ascontiguousarray(values.reshape(-1, n_columns)[:, :2])
+
+    return header, signal
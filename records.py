@@ -0,0 +1,234 @@
+"""
+Records
+
+This file contains the client-side cache of the patients and their study
+listings read from the database.
+
+Selecting again a patient selected recently is served from memory, with
+the least recently used patients evicted beyond MAX_PATIENTS. Several
+workstations share a PostgreSQL database, so the cache is only used while
+a listener thread receives the notifications of the triggers of the
+database (migration 6): every write to pacientes or estudios notifies the
+id number of the patient, and the patient is dropped from the cache. If
+the listener loses its connection, notifications may have been missed:
+the cache is cleared and not used until the listener is back.
+
+A SQLite file is used by one workstation, the writes of this application
+drop the patients they change and no listener is needed.
+
+1. Class RecordCache: LRU cache, safe to use from worker threads
+2. Class Listener: thread that receives the notifications of changes
+3. Cache methods: cached reads and invalidation of patients
+"""
+
+import atexit
+import select
+import threading
+from collections import OrderedDict
+
+import psycopg2
+
+import db
+
+# Channel of the notifications of the triggers of pacientes and estudios
+CHANNEL = 'rombergs_cambios'
+
+MAX_PATIENTS = 256
+
+# Seconds between checks of the stop request of the listener
+POLL_SECONDS = 5.0
+
+# Seconds between reconnections of the listener, doubled up to the maximum
+RETRY_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+
+
+class RecordCache:
+    def __init__(self, max_entries: int) -> None:
+        """ LRU cache of database records
+
+        A value read while its key is invalidated is returned but not
+        cached, so a read that raced with a write is never kept.
+
+        Parameters
+        ----------
+        max_entries: int
+            Maximum number of keys kept, the least recently used are evicted
+
+        Returns
+        -------
+        None
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.is_valid = lambda: False
+
+    def get(self, key: str, load):
+        """ Value of key, from the cache or from load(key) """
+        with self.lock:
+            if self.is_valid() and key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            generation = self.generation
+
+        value = load(key)
+
+        with self.lock:
+            if self.is_valid() and generation == self.generation:
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: str) -> None:
+        """ Drops a key from the cache """
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        """ Drops every key from the cache """
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+class Listener(threading.Thread):
+    def __init__(self, parameters: dict, cache: RecordCache) -> None:
+        """ Thread that invalidates a cache with the notifications of the database
+
+        Parameters
+        ----------
+        parameters: dict
+            Connection parameters of the PostgreSQL database
+        cache: RecordCache
+            Cache of the patients, by id number
+
+        Returns
+        -------
+        None
+        """
+        super().__init__(name='records-listener', daemon=True)
+        self.parameters = parameters
+        self.cache = cache
+        self.connected = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        delay = RETRY_SECONDS
+        while not self.stopped.is_set():
+            connection = None
+            try:
+                # Own connection, the pooled ones are in transactions and can't wait for notifications
+                connection = psycopg2.connect(**self.parameters,
+                    keepalives=1, keepalives_idle=10, keepalives_interval=5, keepalives_count=3)
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {CHANNEL}')
+
+                # Changes made before LISTEN were not notified
+                self.cache.clear()
+                self.connected.set()
+                delay = RETRY_SECONDS
+                self.listen(connection)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError, OSError):
+                pass
+            finally:
+                self.connected.clear()
+                self.cache.clear()
+                if connection is not None:
+                    connection.close()
+
+            self.stopped.wait(delay)
+            delay = min(delay * 2, RETRY_MAX_SECONDS)
+
+    def listen(self, connection) -> None:
+        """ Invalidates the patients notified until the thread is stopped """
+        while not self.stopped.is_set():
+            if select.select([connection], [], [], POLL_SECONDS) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                self.cache.invalidate(connection.notifies.pop(0).payload)
+
+    def stop(self) -> None:
+        """ Asks the thread to stop, it ends within POLL_SECONDS """
+        self.stopped.set()
+        self.connected.clear()
+
+
+patients = RecordCache(MAX_PATIENTS)
+
+_listener = None
+_listener_pool = None
+_listener_lock = threading.Lock()
+
+
+# ---------
+# Funciones
+# ---------
+def _check_listener() -> None:
+    """ Starts the listener of the database of the pool, once per pool """
+    global _listener, _listener_pool
+    with _listener_lock:
+        pool = db.get_pool()
+        if pool is _listener_pool:
+            return
+
+        stop_listener()
+        parameters = db.connection_settings()
+        if parameters.pop('engine') == 'sqlite':
+            patients.is_valid = lambda: True
+        else:
+            _listener = Listener(parameters, patients)
+            patients.is_valid = _listener.connected.is_set
+            _listener.start()
+        _listener_pool = pool
+
+
+def stop_listener() -> None:
+    """ Stops the listener and clears the cache """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    patients.is_valid = lambda: False
+    patients.clear()
+
+
+def get_patient(id_number: str, load) -> tuple:
+    """ Patient and studies of an id number, from the cache or from load
+
+    Parameters
+    ----------
+    id_number: str
+        Patient id number
+    load: callable
+        load(id_number): patient rows and study rows from the database
+
+    Returns
+    -------
+    patient_data: list
+        Rows of the patient in pacientes
+    studies_data: list
+        Rows of the studies of the patient in estudios
+    """
+    _check_listener()
+    patient_data, studies_data = patients.get(str(id_number), load)
+    # Copies, the lists of the caller are changed in place
+    return list(patient_data), list(studies_data)
+
+
+def invalidate_patient(id_number) -> None:
+    """ Drops a patient written by this workstation from the cache """
+    patients.invalidate(str(id_number))
+
+
+def invalidate_all() -> None:
+    """ Drops every patient from the cache """
+    patients.clear()
+
+
+atexit.register(stop_listener)
@@ -0,0 +1,272 @@
+"""
+Rombergs
+
+This file contains the command line entry point of the application, to
+analyze folders of stabilometry exports without display, settings or
+database:
+
+    python -m rombergs analyze <dir|glob|file> ... [--workers N] [--out FILE] [--cache DIR]
+
+Every study is analyzed with the analysis functions in a process pool and
+one row of metrics per file is written to FILE: Parquet for '.parquet'
+(requires pyarrow) or CSV otherwise. With --cache, the studies are loaded
+through binary sidecars kept in DIR for later runs.
+
+Patients and studies are imported in bulk to the database of the settings
+with the importer module:
+
+    python -m rombergs import patients <file.csv> [--update]
+    python -m rombergs import studies <folder> [--id-number N] [--workers N]
+
+and exported, one row per study with its patient and results, with the
+exporter module:
+
+    python -m rombergs export [--out FILE] [--batch-size N]
+
+1. Analysis methods: input expansion and analysis of one study file
+2. Output methods: CSV and Parquet writers
+3. Command line interface
+"""
+
+import argparse
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import analysis
+import cache
+import reader
+
+COLUMNS = ('file', 'frequency', 'n_samples') + analysis.METRICS + analysis.AREAS + ('error',)
+
+
+# -------------------
+# Métodos de Análisis
+# -------------------
+def expand_inputs(inputs: list) -> list:
+    """ Study files given by folders, glob patterns or file paths
+
+    Parameters
+    ----------
+    inputs: list
+        Folders (every .txt file inside), glob patterns or file paths
+
+    Returns
+    -------
+    files: list
+        Sorted paths of the study files, without duplicates
+    """
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            files.update(glob.glob(os.path.join(item, '*.txt')))
+        elif os.path.isfile(item):
+            files.add(item)
+        else:
+            files.update(path for path in glob.glob(item, recursive=True) if os.path.isfile(path))
+    return sorted(files)
+
+
+def analyze_file(file_path: str, cache_dir: str = None) -> dict:
+    """ Analysis of one stabilometry study file
+
+    Errors are returned in the row instead of raised, so that one damaged
+    export does not stop an unattended batch.
+
+    Parameters
+    ----------
+    file_path: str
+        Path of the stabilometry text file
+    cache_dir: str
+        Folder of the binary sidecars to load the study through, or None
+        to parse the text file without cache
+
+    Returns
+    -------
+    row: dict
+        File path, frequency, number of samples in the analysis window,
+        metrics of analysis.analisis and ellipse, convex hull and PCA areas
+    """
+    row = dict.fromkeys(COLUMNS)
+    row['file'] = file_path
+    try:
+        if cache_dir:
+            header, signal = cache.load_study(file_path, cache_dir)
+        else:
+            header, signal = reader.read_study(file_path)
+        signal = signal[reader.analysis_window(header, len(signal))]
+
+        results = analysis.analisis(signal, header.frequency, header.start_of_analysis)
+        row['frequency'] = header.frequency
+        row['n_samples'] = len(signal)
+        row.update(analysis.summary(results, analysis.convexHull(signal)))
+    except Exception as error:
+        row['error'] = f'{type(error).__name__}: {error}'
+    return row
+
+
+def analyze_files(files: list, workers: int = None, cache_dir: str = None) -> list:
+    """ Analysis of many study files in a process pool
+
+    Parameters
+    ----------
+    files: list
+        Paths of the stabilometry text files
+    workers: int
+        Number of worker processes, by default the number of CPUs
+    cache_dir: str
+        Folder of the binary sidecars to load the studies through, or None
+        to parse the text files without cache
+
+    Returns
+    -------
+    rows: list
+        One row of analyze_file per file, in the order of files
+    """
+    # A partial of a module function can still be pickled for the workers
+    function = partial(analyze_file, cache_dir=cache_dir)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(files) < 2:
+        return [function(file_path) for file_path in files]
+
+    # Chunks amortize the inter-process overhead of small exports
+    chunksize = max(1, len(files) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, files, chunksize=chunksize))
+
+
+# -----------------
+# Métodos de Salida
+# -----------------
+def write_csv(rows: list, out_path: str) -> None:
+    """ Writes the rows of metrics to a CSV file """
+    with open(out_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_parquet(rows: list, out_path: str) -> None:
+    """ Writes the rows of metrics to a Parquet file """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit('Parquet output requires pyarrow, use a .csv output instead')
+
+    table = pa.Table.from_pylist(rows, schema=pa.schema(
+        [('file', pa.string()), ('frequency', pa.float64()), ('n_samples', pa.int64())] +
+        [(key, pa.float64()) for key in COLUMNS[3:-1]] +
+        [('error', pa.string())]
+    ))
+    pq.write_table(table, out_path)
+
+
+def write_rows(rows: list, out_path: str) -> None:
+    """ Writes the rows of metrics in the format given by the file extension """
+    if out_path.lower().endswith('.parquet'):
+        write_parquet(rows, out_path)
+    else:
+        write_csv(rows, out_path)
+
+
+# --------------------
+# Interfaz de Comandos
+# --------------------
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog='rombergs', description="Romberg's Test")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    analyze = commands.add_parser('analyze', help='analyze stabilometry exports')
+    analyze.add_argument('inputs', nargs='+', help='folders, glob patterns or study files')
+    analyze.add_argument('--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    analyze.add_argument('--out', default='results.csv', help='output file, .parquet or .csv')
+    analyze.add_argument('--cache', metavar='DIR', default=None,
+        help='folder to read and write binary sidecars of the studies (default: no cache)')
+
+    importing = commands.add_parser('import', help='import patients or studies to the database')
+    kinds = importing.add_subparsers(dest='kind', required=True)
+
+    patients = kinds.add_parser('patients', help='import a CSV file of patients')
+    patients.add_argument('file', help='CSV file with a header row of the columns of pacientes')
+    patients.add_argument('--update', action='store_true', help='update patients already in the database')
+    patients.add_argument('--batch-size', type=int, default=None, help='patients per transaction')
+
+    studies = kinds.add_parser('studies', help='analyze and import folders of studies')
+    studies.add_argument('folder', help='folder with one subfolder of studies per patient id number')
+    studies.add_argument('--id-number', type=int, default=None,
+        help='id number of the patient of the studies directly in folder')
+    studies.add_argument('--workers', type=int, default=None, help='worker processes (default: all CPUs)')
+    studies.add_argument('--batch-size', type=int, default=None, help='studies per transaction')
+
+    export = commands.add_parser('export', help='export patients, studies and results from the database')
+    export.add_argument('--out', default='registry.csv', help='output file, .parquet or .csv')
+    export.add_argument('--batch-size', type=int, default=None, help='rows fetched from the database at a time')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        return import_command(args)
+    if args.command == 'export':
+        return export_command(args)
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        parser.error('no study files found')
+
+    rows = analyze_files(files, args.workers, args.cache)
+    write_rows(rows, args.out)
+
+    failed = [row for row in rows if row['error']]
+    for row in failed:
+        print(f'{row["file"]}: {row["error"]}', file=sys.stderr)
+    print(f'{len(rows) - len(failed)} of {len(rows)} studies analyzed, results in {args.out}')
+
+    return 1 if failed else 0
+
+
+def import_command(args: argparse.Namespace) -> int:
+    """ Runs the import subcommand and prints its report """
+    # The database stack is only loaded by this command
+    import importer
+
+    batch_size = args.batch_size or importer.BATCH_SIZE
+    if args.kind == 'patients':
+        rows, errors = importer.read_patients_csv(args.file)
+        report = importer.import_patients(rows, args.update, batch_size)
+        errors = [(f'{args.file}:{line}', message) for line, message in errors]
+        total = report['total'] + len(errors)
+    else:
+        studies = importer.find_study_files(args.folder, args.id_number)
+        report = importer.import_studies(studies, args.workers, batch_size)
+        errors = report['errors']
+        total = report['total']
+
+    for item, message in errors:
+        print(f'{item}: {message}', file=sys.stderr)
+    seconds = report['seconds']
+    rate = report['written'] / seconds if seconds > 0 else 0.0
+    print(f'{report["written"]} of {total} {args.kind} written, {report["skipped"]} skipped, '
+        f'{len(errors)} errors, in {seconds:.2f} s ({rate:.0f} {args.kind}/s)')
+
+    return 1 if errors else 0
+
+
+def export_command(args: argparse.Namespace) -> int:
+    """ Runs the export subcommand and prints its report """
+    # The database stack is only loaded by this command
+    import exporter
+
+    report = exporter.export_registry(args.out, args.batch_size or exporter.BATCH_SIZE)
+    seconds = report['seconds']
+    rate = report['written'] / seconds if seconds > 0 else 0.0
+    print(f'{report["written"]} rows exported to {args.out}, in {seconds:.2f} s ({rate:.0f} rows/s)')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Workers
+
+This file contains the background jobs of the application, to run database
+and analysis work outside of the Qt GUI thread.
+
+Jobs run in a QThreadPool and hand their result (or error) back to the GUI
+thread through Qt signals. Jobs submitted on a channel (e.g. 'paciente',
+'estudio') replace the previous job of the same channel: if it has not
+started it is taken out of the queue, and if it is running its result is
+discarded when it finishes, so only the result of the last request
+reaches the UI. A channel can also be held for a result computed by a job
+without channel, and taken over by the next request of the channel.
+
+1. Class Job: runnable with the function to run and its cancellation state
+2. Class JobQueue: submission, cancellation and delivery of jobs
+"""
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import itertools
+import sys
+
+
+class JobSignals(QObject):
+    """ Signals of a job, emitted from the worker thread """
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, object)
+
+
+class Job(QRunnable):
+    def __init__(self, job_id: int, channel: str, function, args: tuple, kwargs: dict) -> None:
+        """ Background job
+
+        Parameters
+        ----------
+        job_id: int
+            Unique id of the job in its queue
+        channel: str
+            Channel of the job, or None if no other job replaces it
+        function: callable
+            Function to run in the worker thread
+        args: tuple
+            Positional arguments of function
+        kwargs: dict
+            Keyword arguments of function
+
+        Returns
+        -------
+        None
+        """
+        super().__init__()
+        self.setAutoDelete(False)
+        self.job_id = job_id
+        self.channel = channel
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.signals = JobSignals()
+
+    def run(self) -> None:
+        """ Runs the function and emits its result or error """
+        if self.cancelled:
+            # Still signal the queue, so that it forgets the job
+            self.signals.finished.emit(self.job_id, None)
+            return
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as err:
+            self.signals.failed.emit(self.job_id, err)
+        else:
+            self.signals.finished.emit(self.job_id, result)
+
+
+class JobQueue(QObject):
+    def __init__(self, parent=None, max_threads: int = None) -> None:
+        """ Queue of background jobs
+
+        Parameters
+        ----------
+        parent: QObject
+            Parent object, usually the main window
+        max_threads: int
+            Maximum number of worker threads, by default the number of CPUs
+
+        Returns
+        -------
+        None
+        """
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+
+        self.ids = itertools.count(1)
+        self.jobs = {}
+        self.callbacks = {}
+        self.channels = {}
+
+    def submit(self, function, *args, channel: str = None, on_result=None, on_error=None, **kwargs) -> Job:
+        """ Runs function(*args, **kwargs) in a worker thread
+
+        Parameters
+        ----------
+        function: callable
+            Function to run in the worker thread. It must not use widgets
+        channel: str
+            Channel of the job. The previous job of the channel is cancelled
+        on_result: callable
+            Called in the GUI thread with the result of function
+        on_error: callable
+            Called in the GUI thread with the exception raised by function.
+            Without it, the exception is reported by sys.excepthook
+
+        Returns
+        -------
+        job: Job
+            Submitted job
+        """
+        if channel is not None:
+            self.cancel(channel)
+
+        job = Job(next(self.ids), channel, function, args, kwargs)
+        job.signals.finished.connect(self.on_job_finished)
+        job.signals.failed.connect(self.on_job_failed)
+
+        self.jobs[job.job_id] = job
+        self.callbacks[job.job_id] = (on_result, on_error)
+        if channel is not None:
+            self.channels[channel] = job.job_id
+
+        self.pool.start(job)
+        return job
+
+    def cancel(self, channel: str) -> None:
+        """ Cancels the current job of a channel
+
+        A queued job is removed from the pool. A running job can't be
+        interrupted, but its result is discarded when it finishes.
+
+        Parameters
+        ----------
+        channel: str
+            Channel of the job to cancel
+        """
+        job_id = self.channels.pop(channel, None)
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+
+        job.cancelled = True
+        self.callbacks.pop(job_id, None)
+        if self.pool.tryTake(job):
+            self.jobs.pop(job_id, None)
+
+    def hold(self, channel: str) -> int:
+        """ Cancels the current job of a channel and holds the channel
+
+        For results of a channel computed by a job without channel (e.g.
+        the analysis of a study returned by its write): the channel is held
+        until the result arrives, and a job submitted on the channel
+        meanwhile, or its cancellation, takes it over.
+
+        Parameters
+        ----------
+        channel: str
+            Channel to hold
+
+        Returns
+        -------
+        ticket: int
+            Ticket of the hold, for release
+        """
+        self.cancel(channel)
+        ticket = next(self.ids)
+        self.channels[channel] = ticket
+        return ticket
+
+    def release(self, channel: str, ticket: int) -> bool:
+        """ Ends the hold of a channel
+
+        Returns
+        -------
+        held: bool
+            True if the channel was still held with ticket, False if it was
+            taken over meanwhile
+        """
+        if self.channels.get(channel) != ticket:
+            return False
+        del self.channels[channel]
+        return True
+
+    def is_busy(self, channel: str) -> bool:
+        """ Checks if a channel has a job queued or running, or is held """
+        return channel in self.channels
+
+    def shutdown(self, msecs: int = -1) -> bool:
+        """ Cancels the queued jobs and waits for the running ones
+
+        Jobs not started yet, with or without a channel, are taken out of the
+        pool. Running jobs can't be interrupted, and are waited for at most
+        msecs, so that a job stuck on the database does not block the caller.
+
+        Parameters
+        ----------
+        msecs: int
+            Maximum time to wait in milliseconds, -1 to wait without limit
+
+        Returns
+        -------
+        done: bool
+            True if every running job finished in time
+        """
+        for channel in list(self.channels):
+            self.cancel(channel)
+        for job_id, job in list(self.jobs.items()):
+            job.cancelled = True
+            self.callbacks.pop(job_id, None)
+            if self.pool.tryTake(job):
+                self.jobs.pop(job_id, None)
+        return self.pool.waitForDone(msecs)
+
+    def _finish(self, job_id: int) -> tuple:
+        """ Forgets a finished job and returns its callbacks if still wanted """
+        job = self.jobs.pop(job_id, None)
+        if job is not None and self.channels.get(job.channel) == job_id:
+            del self.channels[job.channel]
+        return self.callbacks.pop(job_id, (None, None))
+
+    def on_job_finished(self, job_id: int, result) -> None:
+        on_result, _ = self._finish(job_id)
+        if on_result is not None:
+            on_result(result)
+
+    def on_job_failed(self, job_id: int, err: Exception) -> None:
+        job = self.jobs.get(job_id)
+        _, on_error = self._finish(job_id)
+        if on_error is not None:
+            on_error(err)
+        elif job is not None and not job.cancelled:
+            sys.excepthook(type(err), err, err.__traceback__)